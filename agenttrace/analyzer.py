@@ -4,22 +4,28 @@ Provides functions to analyze the output of the LLM for issues such as prompt ec
 """
 
 import re
-from difflib import SequenceMatcher
 from collections import Counter
-from typing import Dict
+from typing import Any, Dict, List, Mapping, Sequence
+from agenttrace.similarity import similarity
 
-def analyze_response(prompt: str, response: str) -> Dict[str, float]:
+# Compiled once and shared by every analysis.
+_SENTENCE_SPLIT = re.compile(r'[.!?]+')
+
+def analyze_response(prompt: str, response: str, similarity_method: str = "auto") -> Dict[str, float]:
     """
     Analyze the generated response for quality issues.
 
     Metrics computed:
     - prompt_similarity: similarity ratio between the prompt and the response (values 0-1).
+      Short inputs use difflib's exact ratio; long inputs use a linear-time character
+      n-gram estimate (see agenttrace.similarity) so echo detection scales to long prompts.
     - echo_flag: 1.0 if the prompt is heavily echoed, else 0.0.
     - repetition_score: fraction of the most common sentence relative to total sentences.
 
     Args:
         prompt (str): The original prompt.
         response (str): The generated response.
+        similarity_method (str): "auto", "ratio" (exact, original behaviour) or "ngram". Defaults to "auto".
 
     Returns:
         Dict[str, float]: A dictionary with keys:
@@ -28,21 +34,47 @@ def analyze_response(prompt: str, response: str) -> Dict[str, float]:
             - "repetition_score": ratio of the highest sentence frequency.
     """
     # Calculate similarity between prompt and response (in lower case)
-    similarity = SequenceMatcher(None, prompt.strip().lower(), response.strip().lower()).ratio()
-    echo_flag = 1.0 if similarity > 0.5 else 0.0
-
-    # Split the response into sentences for repetition analysis
-    sentences = re.split(r'[.!?]+', response)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    repetition_score = 0.0
-    if sentences:
-        counter = Counter(sentences)
-        total_sentences = sum(counter.values())
-        max_freq = max(counter.values())
-        repetition_score = max_freq / total_sentences
+    prompt_similarity = similarity(prompt.strip().lower(), response.strip().lower(), similarity_method)
+    echo_flag = 1.0 if prompt_similarity > 0.5 else 0.0
 
     return {
-        "prompt_similarity": similarity,
+        "prompt_similarity": prompt_similarity,
         "echo_flag": echo_flag,
-        "repetition_score": repetition_score
+        "repetition_score": _repetition_score(response)
     }
+
+def _repetition_score(response: str) -> float:
+    # Split the response into sentences for repetition analysis
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(response)]
+    counter = Counter(s for s in sentences if s)
+    if not counter:
+        return 0.0
+    return max(counter.values()) / sum(counter.values())
+
+def analyze_responses(turns: Sequence[Mapping[str, Any]], similarity_method: str = "auto") -> List[Dict[str, float]]:
+    """
+    Analyze many turns in one pass.
+
+    Equivalent to calling analyze_response on each turn, but prompts that occur in
+    several turns (e.g. replays of the same prompt) are normalised only once.
+
+    Args:
+        turns (Sequence[Mapping[str, Any]]): Turns with "prompt" and "response" keys.
+        similarity_method (str): Passed to analyze_response. Defaults to "auto".
+
+    Returns:
+        List[Dict[str, float]]: One analysis per turn, in order.
+    """
+    normalised: Dict[str, str] = {}
+    results = []
+    for turn in turns:
+        prompt, response = turn["prompt"], turn["response"]
+        if prompt not in normalised:
+            normalised[prompt] = prompt.strip().lower()
+        prompt_similarity = similarity(normalised[prompt], response.strip().lower(), similarity_method)
+        results.append({
+            "prompt_similarity": prompt_similarity,
+            "echo_flag": 1.0 if prompt_similarity > 0.5 else 0.0,
+            "repetition_score": _repetition_score(response)
+        })
+    return results
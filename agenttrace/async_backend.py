@@ -0,0 +1,157 @@
+"""
+Module: agenttrace.async_backend
+Asyncio-native backend abstraction. Blocking backends run on a bounded thread pool
+so many sessions can be in flight on one event loop, with per-call timeouts and
+cancellation.
+"""
+
+import asyncio
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from agenttrace.logger import setup_logger
+
+if TYPE_CHECKING:
+    from agenttrace.llm_backend import LLMBackend
+
+logger = setup_logger("AgentTrace.async_backend")
+
+
+class AsyncLLMBackend(ABC):
+    @abstractmethod
+    async def agenerate(self, prompt: str, max_length: int, timeout: Optional[float] = None) -> str:
+        pass
+
+    @abstractmethod
+    async def agenerate_with_trace(self, prompt: str, max_length: int,
+                                   timeout: Optional[float] = None) -> Tuple[str, list]:
+        """
+        Generate text and return chain-of-thought details (token-level trace) without blocking the event loop.
+        """
+        pass
+
+    async def agenerate_with_metrics(self, prompt: str, max_length: int, timeout: Optional[float] = None
+                                     ) -> Tuple[str, list, Optional[Dict[str, Any]]]:
+        """
+        Like agenerate_with_trace, also returning the generation's performance metrics
+        (None for backends that do not report them).
+        """
+        output, trace_info = await self.agenerate_with_trace(prompt, max_length, timeout)
+        return output, trace_info, None
+
+
+class ExecutorBackend(AsyncLLMBackend):
+    """
+    Runs a synchronous LLMBackend on a bounded thread pool.
+
+    At most `max_concurrency` generations are in flight; further calls wait on a
+    semaphore instead of spawning threads. A call that times out or is cancelled
+    raises in the caller immediately; the worker thread is released once the
+    current generation step finishes (for backends that support stopping) or the
+    generation completes. Seeded sampling generations of HuggingFaceBackend hold
+    torch's global RNG exclusively, so they run one at a time and stay reproducible.
+    """
+    def __init__(self, backend: "LLMBackend", max_concurrency: int = 2,
+                 timeout: Optional[float] = None) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix="agenttrace-generate")
+        # asyncio primitives belong to one event loop, so every loop using the backend
+        # (e.g. successive asyncio.run calls) gets its own semaphore. The worker pool
+        # bounds the generations running at once across all loops.
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _generate_sync(self, prompt: str, max_length: int, stop_event: threading.Event) -> Tuple[str, list]:
+        """
+        Blocking generation run on a worker thread. Subclasses whose backend can be
+        interrupted should honour `stop_event`.
+        """
+        return self.backend.generate_with_trace(prompt, max_length)
+
+    async def agenerate(self, prompt: str, max_length: int, timeout: Optional[float] = None) -> str:
+        output, _ = await self.agenerate_with_trace(prompt, max_length, timeout)
+        return output
+
+    def _generate_with_metrics(self, prompt: str, max_length: int, stop_event: threading.Event
+                               ) -> Tuple[str, list, Optional[Dict[str, Any]]]:
+        # last_metrics is per thread, so it is read on the worker that generated.
+        output, trace_info = self._generate_sync(prompt, max_length, stop_event)
+        metrics = getattr(self.backend, "last_metrics", None)
+        return output, trace_info, dict(metrics) if metrics is not None else None
+
+    async def agenerate_with_trace(self, prompt: str, max_length: int,
+                                   timeout: Optional[float] = None) -> Tuple[str, list]:
+        output, trace_info, _ = await self.agenerate_with_metrics(prompt, max_length, timeout)
+        return output, trace_info
+
+    async def agenerate_with_metrics(self, prompt: str, max_length: int, timeout: Optional[float] = None
+                                     ) -> Tuple[str, list, Optional[Dict[str, Any]]]:
+        """
+        Generate on the worker pool.
+
+        Args:
+            prompt (str): The input prompt.
+            max_length (int): Maximum total length (prompt + generation).
+            timeout (float, optional): Seconds to wait before raising asyncio.TimeoutError.
+                Defaults to the backend-wide timeout.
+
+        Returns:
+            Tuple[str, list, Optional[Dict[str, Any]]]: The generated text, its token-level
+            trace and the backend's metrics for this generation.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.timeout if timeout is None else timeout
+        async with semaphore:
+            stop_event = threading.Event()
+            future = loop.run_in_executor(self._executor, self._generate_with_metrics, prompt, max_length,
+                                          stop_event)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                # Tell the worker to stop generating; nobody is waiting for the result anymore.
+                stop_event.set()
+                logger.info(f"Generation for prompt '{prompt[:50]}' timed out after {timeout}s.")
+                raise
+            except asyncio.CancelledError:
+                stop_event.set()
+                logger.info(f"Generation for prompt '{prompt[:50]}' was cancelled.")
+                raise
+
+    def close(self) -> None:
+        """
+        Shut down the worker pool, waiting for running generations to finish.
+        """
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "ExecutorBackend":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+class AsyncHuggingFaceBackend(ExecutorBackend):
+    """
+    Async wrapper around HuggingFaceBackend. Cancellation and timeouts stop the
+    underlying model.generate call at the next generation step.
+    """
+    def __init__(self, model_name: str, max_concurrency: int = 2, timeout: Optional[float] = None,
+                 **backend_kwargs: Any) -> None:
+        from agenttrace.llm_backend import HuggingFaceBackend
+        super().__init__(HuggingFaceBackend(model_name, **backend_kwargs), max_concurrency, timeout)
+        self.model_name = model_name
+
+    def _generate_sync(self, prompt: str, max_length: int, stop_event: threading.Event) -> Tuple[str, list]:
+        return self.backend.generate_with_trace(prompt, max_length, stop_event=stop_event)
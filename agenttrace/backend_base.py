@@ -0,0 +1,51 @@
+"""
+Module: agenttrace.backend_base
+The synchronous backend interface. Kept free of torch and transformers so
+backends that do not run a model (e.g. agenttrace.replay_backend) load without
+the model stack; agenttrace.llm_backend re-exports it.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+
+class LLMBackend(ABC):
+    @abstractmethod
+    def generate(self, prompt: str, max_length: int) -> str:
+        pass
+
+    @abstractmethod
+    def generate_with_trace(self, prompt: str, max_length: int) -> (str, list):
+        """
+        Generate text and return chain-of-thought details (token-level trace).
+        """
+        pass
+
+    def generate_batch(self, prompts: Sequence[str], max_length: int, batch_size: int = 8) -> List[str]:
+        """
+        Generate a response for every prompt, returned in input order.
+        Backends that can batch on the model side should override this.
+        """
+        return [text for text, _ in self.generate_batch_with_trace(prompts, max_length, batch_size)]
+
+    def generate_batch_with_trace(self, prompts: Sequence[str], max_length: int,
+                                  batch_size: int = 8) -> List[Tuple[str, list]]:
+        """
+        Generate a (text, trace) pair for every prompt, returned in input order.
+        """
+        return [self.generate_with_trace(prompt, max_length) for prompt in prompts]
+
+    def generate_stream(self, prompt: str, max_length: int,
+                        trace: bool = True) -> Iterator[Tuple[str, Optional[dict]]]:
+        """
+        Yield (text_delta, trace_entry) pairs as the response is produced.
+        Backends without native streaming yield the whole response at once.
+        """
+        if not trace:
+            yield self.generate(prompt, max_length), None
+            return
+        text, trace_info = self.generate_with_trace(prompt, max_length)
+        if not trace_info:
+            yield text, None
+        for step, entry in enumerate(trace_info):
+            yield (text if step == 0 else ""), entry
@@ -0,0 +1,325 @@
+"""
+Module: agenttrace.comparison
+Compares N models on M prompts with K seeds. Each model's generations run in
+worker processes that hold one model at a time; results stream into a compact
+result matrix that updates pairwise output similarity and per-model trace
+statistics as cells arrive. Cells are cached, so adding a model to a finished
+comparison only generates the new model's column.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from agenttrace.logger import setup_logger
+from agenttrace.response_cache import ResponseCache
+from agenttrace.similarity import similarity
+
+logger = setup_logger("AgentTrace.comparison")
+
+Cell = Dict[str, Any]
+# (cell index, prompt, seed) of one generation requested from a worker.
+CellTask = Tuple[int, str, int]
+
+# Backend of the model the current worker process is generating with.
+_worker_state: Dict[str, Any] = {}
+
+
+def summarize_trace(text: str, trace: Sequence[Dict[str, Any]], metrics: Optional[Dict[str, Any]] = None) -> Cell:
+    """
+    Reduce a generation to the compact cell stored in a ComparisonResult.
+
+    Args:
+        text (str): The generated text.
+        trace (Sequence[Dict[str, Any]]): Its token-level trace.
+        metrics (Dict[str, Any], optional): The backend's last_metrics for the generation.
+
+    Returns:
+        Cell: Text, generated token count, mean and minimum token confidence and tokens/sec.
+    """
+    confidences = [entry["confidence"] for entry in trace if "confidence" in entry]
+    return {
+        "text": text,
+        "tokens": len(trace),
+        "mean_confidence": sum(confidences) / len(confidences) if confidences else None,
+        "min_confidence": min(confidences) if confidences else None,
+        "tokens_per_sec": (metrics or {}).get("tokens_per_sec"),
+    }
+
+
+def generate_cells(model_name: str, tasks: Sequence[CellTask], max_length: int,
+                   generation_kwargs: Optional[Dict[str, Any]] = None, dtype: Any = None) -> List[Tuple[int, Cell]]:
+    """
+    Generate one chunk of a model's column. Runs in a worker process.
+
+    Each worker keeps a single model resident: its registry has no memory budget
+    beyond the most recently requested model, so switching to another model frees
+    the previous one.
+
+    Returns:
+        List[Tuple[int, Cell]]: (cell index, cell) for every task.
+    """
+    key = (model_name, str(dtype), repr(sorted((generation_kwargs or {}).items())))
+    if _worker_state.get("key") != key:
+        from agenttrace.llm_backend import HuggingFaceBackend
+        from agenttrace.model_registry import ModelRegistry
+        registry = _worker_state.get("registry") or ModelRegistry(max_memory_mb=0)
+        _worker_state.update(key=key, registry=registry, backend=HuggingFaceBackend(
+            model_name, dtype=dtype, registry=registry, generation_kwargs=generation_kwargs
+        ))
+    backend = _worker_state["backend"]
+    results = []
+    for index, prompt, seed in tasks:
+        backend.seed = seed
+        text, trace = backend.generate_with_trace(prompt, max_length)
+        results.append((index, summarize_trace(text, trace, backend.last_metrics)))
+    return results
+
+
+class ComparisonResult:
+    """
+    Result matrix of a comparison: one column per model, one cell per (prompt, seed).
+
+    Cells are compact summaries (see summarize_trace), not full traces. Pairwise
+    similarity sums and per-model statistics are updated as each cell is added, so
+    reading them never rescans the matrix.
+
+    Args:
+        prompts (Sequence[str]): The prompt suite.
+        seeds (Sequence[int]): Seeds each prompt is generated with.
+        similarity_method (str): Method passed to similarity.similarity. Defaults to "auto".
+    """
+    _STAT_FIELDS = ("tokens", "mean_confidence", "min_confidence", "tokens_per_sec")
+
+    def __init__(self, prompts: Sequence[str], seeds: Sequence[int], similarity_method: str = "auto") -> None:
+        self.prompts = list(prompts)
+        self.seeds = list(seeds)
+        self.similarity_method = similarity_method
+        self.models: List[str] = []
+        self._columns: Dict[str, List[Optional[Cell]]] = {}
+        # (model_a, model_b) -> [similarity sum, compared cells], with model_a before model_b in self.models.
+        self._pairs: Dict[Tuple[str, str], List[float]] = {}
+        # model -> field -> [sum, count]
+        self._stats: Dict[str, Dict[str, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """
+        Number of cells per model.
+        """
+        return len(self.prompts) * len(self.seeds)
+
+    def index(self, prompt_index: int, seed_index: int) -> int:
+        return prompt_index * len(self.seeds) + seed_index
+
+    def add_model(self, model_name: str) -> None:
+        with self._lock:
+            if model_name in self._columns:
+                return
+            self.models.append(model_name)
+            self._columns[model_name] = [None] * self.size
+            self._stats[model_name] = {field: [0.0, 0] for field in self._STAT_FIELDS}
+            for other in self.models[:-1]:
+                self._pairs[(other, model_name)] = [0.0, 0]
+
+    def add(self, model_name: str, index: int, cell: Cell) -> None:
+        """
+        Store a cell and fold it into the model's statistics and its pairwise similarities.
+        """
+        self.add_model(model_name)
+        with self._lock:
+            column = self._columns[model_name]
+            if column[index] is not None:
+                return
+            column[index] = cell
+            for field, totals in self._stats[model_name].items():
+                if cell.get(field) is not None:
+                    totals[0] += cell[field]
+                    totals[1] += 1
+            for other in self.models:
+                other_cell = self._columns[other][index]
+                if other == model_name or other_cell is None:
+                    continue
+                pair = self._pair_key(model_name, other)
+                self._pairs[pair][0] += similarity(cell["text"], other_cell["text"], method=self.similarity_method)
+                self._pairs[pair][1] += 1
+
+    def _pair_key(self, model_a: str, model_b: str) -> Tuple[str, str]:
+        return (model_a, model_b) if (model_a, model_b) in self._pairs else (model_b, model_a)
+
+    def cell(self, model_name: str, prompt_index: int, seed_index: int = 0) -> Optional[Cell]:
+        return self._columns[model_name][self.index(prompt_index, seed_index)]
+
+    def missing(self, model_name: str) -> List[int]:
+        """
+        Indices of the model's cells that have not been generated yet.
+        """
+        column = self._columns.get(model_name)
+        if column is None:
+            return list(range(self.size))
+        return [index for index, cell in enumerate(column) if cell is None]
+
+    def completed(self, model_name: str) -> int:
+        return self.size - len(self.missing(model_name))
+
+    def similarity(self, model_a: str, model_b: str) -> Optional[float]:
+        """
+        Mean output similarity of two models over the cells both have generated.
+        """
+        if model_a == model_b:
+            return 1.0
+        with self._lock:
+            total, count = self._pairs[self._pair_key(model_a, model_b)]
+        return total / count if count else None
+
+    def similarity_matrix(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Mean pairwise output similarity, as {model: {model: similarity}}.
+        """
+        return {a: {b: self.similarity(a, b) for b in self.models} for a in self.models}
+
+    def model_stats(self) -> List[Dict[str, Any]]:
+        """
+        Per-model completed cell count and the means of the cell statistics.
+        """
+        rows = []
+        with self._lock:
+            for model_name in self.models:
+                row: Dict[str, Any] = {"model": model_name,
+                                       "completed": sum(cell is not None for cell in self._columns[model_name])}
+                for field, (total, count) in self._stats[model_name].items():
+                    row[field] = total / count if count else None
+                rows.append(row)
+        return rows
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one flat record per generated cell, e.g. for a DataFrame or CSV export.
+        """
+        for model_name in self.models:
+            for prompt_index in range(len(self.prompts)):
+                for seed_index, seed in enumerate(self.seeds):
+                    cell = self.cell(model_name, prompt_index, seed_index)
+                    if cell is not None:
+                        yield {"model": model_name, "prompt_index": prompt_index, "seed": seed, **cell}
+
+
+class ComparisonEngine:
+    """
+    Runs models over a prompt suite and seeds in parallel worker processes.
+
+    Each model's missing cells are split into chunks of `chunk_size` and submitted
+    model by model to a pool of `max_workers` processes. A worker keeps only the
+    model it is currently generating with, so at most `max_workers` models are
+    resident at once. Chunks stream into `result` as they finish.
+
+    With a `cache`, every cell is stored under its model, prompt, seed and
+    generation settings; later runs (including a fresh engine over the same cache)
+    only generate the cells that are not cached. Calling run() again with one extra
+    model therefore computes just that model's column.
+
+    Args:
+        prompts (Sequence[str]): The prompt suite.
+        seeds (Sequence[int]): Seeds each prompt is generated with. Defaults to (0,).
+        max_length (int): Maximum output length passed to the backend. Defaults to 50.
+        generation_kwargs (Dict[str, Any], optional): Sampling parameters for every model.
+        dtype (Any, optional): Weight dtype for every model, e.g. "bfloat16" or "int8".
+        cache (ResponseCache, optional): Cache of generated cells.
+        max_workers (int): Number of worker processes. Defaults to 2.
+        chunk_size (int): Cells per worker task. Defaults to 16.
+        similarity_method (str): Method passed to similarity.similarity. Defaults to "auto".
+        cell_runner (Callable): Function generating a chunk (see generate_cells); must be picklable.
+    """
+    def __init__(self, prompts: Sequence[str], seeds: Sequence[int] = (0,), max_length: int = 50,
+                 generation_kwargs: Optional[Dict[str, Any]] = None, dtype: Any = None,
+                 cache: Optional[ResponseCache] = None, max_workers: int = 2, chunk_size: int = 16,
+                 similarity_method: str = "auto",
+                 cell_runner: Callable[..., List[Tuple[int, Cell]]] = generate_cells) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1.")
+        self.max_length = max_length
+        self.generation_kwargs = dict(generation_kwargs or {})
+        self.dtype = dtype
+        self.cache = cache
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.cell_runner = cell_runner
+        self.result = ComparisonResult(prompts, seeds, similarity_method)
+
+    def _cache_key(self, model_name: str, index: int) -> str:
+        prompt = self.result.prompts[index // len(self.result.seeds)]
+        seed = self.result.seeds[index % len(self.result.seeds)]
+        params = {**self.generation_kwargs, "dtype": str(self.dtype), "comparison_cell": True}
+        return ResponseCache.make_key(model_name, prompt, self.max_length, params, seed)
+
+    def _task(self, index: int) -> CellTask:
+        seeds = self.result.seeds
+        return index, self.result.prompts[index // len(seeds)], seeds[index % len(seeds)]
+
+    def run(self, models: Sequence[str],
+            on_cell: Optional[Callable[[str, int, Cell], None]] = None) -> ComparisonResult:
+        """
+        Generate every missing cell of `models` and return the (shared, growing) result.
+
+        Args:
+            models (Sequence[str]): Model names or local paths to compare.
+            on_cell (Callable, optional): Called with the model, cell index and cell as
+                each cell is added, including cells served from the cache.
+
+        Returns:
+            ComparisonResult: The result matrix, also available as `self.result`.
+        """
+        pending: List[Tuple[str, List[int]]] = []
+        for model_name in models:
+            self.result.add_model(model_name)
+            missing = []
+            for index in self.result.missing(model_name):
+                cached = self.cache.get(self._cache_key(model_name, index)) if self.cache is not None else None
+                if cached is None:
+                    missing.append(index)
+                    continue
+                self.result.add(model_name, index, cached)
+                if on_cell is not None:
+                    on_cell(model_name, index, cached)
+            for start in range(0, len(missing), self.chunk_size):
+                pending.append((model_name, missing[start:start + self.chunk_size]))
+        if not pending:
+            return self.result
+
+        logger.info(f"Comparing {len(models)} models: {sum(len(chunk) for _, chunk in pending)} cells to generate "
+                    f"in {len(pending)} chunks on {self.max_workers} workers.")
+        # Workers are spawned rather than forked: forking a process that already runs torch threads can deadlock.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as pool:
+            running: Dict[Future, str] = {}
+            pending.reverse()
+            while pending or running:
+                while pending and len(running) < self.max_workers:
+                    model_name, indices = pending.pop()
+                    tasks = [self._task(index) for index in indices]
+                    future = pool.submit(self.cell_runner, model_name, tasks, self.max_length,
+                                         self.generation_kwargs, self.dtype)
+                    running[future] = model_name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    model_name = running.pop(future)
+                    try:
+                        cells = future.result()
+                    except Exception as e:
+                        # Let the chunks already running finish, but start no new ones.
+                        logger.error(f"Comparison of model '{model_name}' failed: {e}")
+                        pending.clear()
+                        for other in running:
+                            other.cancel()
+                        raise
+                    for index, cell in cells:
+                        self.result.add(model_name, index, cell)
+                        if self.cache is not None:
+                            self.cache.put(self._cache_key(model_name, index), cell)
+                        if on_cell is not None:
+                            on_cell(model_name, index, cell)
+        return self.result
@@ -3,23 +3,160 @@ Module: agenttrace.conversation
 Manages multi-turn conversation with an LLM using a backend abstraction.
 """
 
-from typing import List, Dict
-from agenttrace.llm_backend import HuggingFaceBackend, LLMBackend
+import contextlib
+import itertools
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+from agenttrace.analyzer import analyze_response, analyze_responses
 from agenttrace.logger import setup_logger
+from agenttrace.response_cache import ResponseCache
+from agenttrace.trace_store import TraceStore
+from agenttrace.turn_store import TurnStore
+
+if TYPE_CHECKING:
+    # The backends import torch and transformers; they are loaded when a backend is built.
+    from agenttrace.async_backend import AsyncLLMBackend
+    from agenttrace.llm_backend import LLMBackend
 
 logger = setup_logger("AgentTrace.conversation")
 
-class Conversation:
+@contextlib.contextmanager
+def _backend_settings(backend: "LLMBackend", seed: Optional[int],
+                      sampling: Dict[str, Any]) -> Iterator[None]:
     """
-    Manages a multi-turn conversation with an LLM.
+    Temporarily apply a seed and sampling parameters to a backend that supports them.
+    """
+    if sampling and not hasattr(backend, "generation_kwargs"):
+        raise ValueError(f"{type(backend).__name__} does not support sampling settings.")
+    original_seed = getattr(backend, "seed", None)
+    original_kwargs = getattr(backend, "generation_kwargs", None)
+    if hasattr(backend, "seed"):
+        backend.seed = seed
+    if sampling:
+        backend.generation_kwargs = {**original_kwargs, **sampling}
+    try:
+        yield
+    finally:
+        if hasattr(backend, "seed"):
+            backend.seed = original_seed
+        if sampling:
+            backend.generation_kwargs = original_kwargs
+
+class _TurnHistory:
     """
-    def __init__(self, model_name: str, max_length: int = 50, backend_type: str = "huggingface") -> None:
+    Turn history shared by Conversation and AsyncConversation: the turn store, cached
+    per-turn analysis, the metrics hook and trace-store recording of every turn.
+
+    Every conversation has a `session_id` (a new UUID unless one is given). Exports
+    and the trace store carry it, so passing it again continues an earlier session,
+    e.g. when resuming a JSON Lines export.
+    """
+    def __init__(self, model_name: str, max_length: int, history_window: Optional[int],
+                 spill_dir: Optional[str], trace_store: Optional[TraceStore],
+                 on_turn_metrics: Optional[Callable[[int, Dict[str, Any]], None]],
+                 session_id: Optional[str] = None) -> None:
         self.model_name = model_name
         self.max_length = max_length
-        self.history: List[Dict[str, str]] = []  # List of turns
+        self.history = TurnStore(history_window, spill_dir)  # List of turns
+        self.trace_store = trace_store
+        self.on_turn_metrics = on_turn_metrics
+        self.session_id = session_id or uuid.uuid4().hex
+        if trace_store is not None:
+            trace_store.start_session(model_name, max_length, session_id=self.session_id)
+
+    def _append_turn(self, prompt: str, response: str, metrics: Optional[Dict[str, Any]]) -> None:
+        self.history.append({"prompt": prompt, "response": response, "metrics": metrics})
+        self._record_turn(len(self.history) - 1)
+
+    def _record_turn(self, index: int) -> None:
+        turn = self.history[index]
+        if self.on_turn_metrics is not None and turn.metrics is not None:
+            try:
+                self.on_turn_metrics(index, turn.metrics)
+            except Exception as e:
+                # A failing metrics sink must not lose the turn.
+                logger.error(f"Turn metrics hook failed for turn {index + 1}: {e}")
+        if self.trace_store is None:
+            return
+        self.trace_store.add_turn(self.session_id, self.model_name, index, turn.prompt, turn.response,
+                                  self.get_analysis(index), turn.metrics)
+
+    def get_history(self) -> TurnStore:
+        """
+        Returns the conversation history.
+        """
+        return self.history
+
+    def get_analysis(self, index: int) -> Dict[str, float]:
+        """
+        Returns the analysis of a turn (see analyzer.analyze_response).
+        It is computed on first use and recomputed only if the turn's prompt or response changes.
+        """
+        if index < 0 or index >= len(self.history):
+            raise IndexError("Invalid conversation turn index.")
+        turn = self.history[index]
+        if turn.analysis is None:
+            turn.analysis = analyze_response(turn.prompt, turn.response)
+            if self.history.is_spilled(index):
+                self.history[index] = turn
+        return turn.analysis
+
+    def get_analyses(self) -> List[Dict[str, float]]:
+        """
+        Returns the analysis of every turn, analysing the turns without a valid cached result in one batch.
+        """
+        analyses: List[Optional[Dict[str, float]]] = []
+        stale = {}
+        for index, turn in enumerate(self.history):
+            analyses.append(turn.analysis)
+            if turn.analysis is None:
+                stale[index] = turn
+        if stale:
+            for (index, turn), analysis in zip(stale.items(), analyze_responses(list(stale.values()))):
+                turn.analysis = analysis
+                analyses[index] = analysis
+                if self.history.is_spilled(index):
+                    self.history[index] = turn
+        return analyses
+
+class Conversation(_TurnHistory):
+    """
+    Manages a multi-turn conversation with an LLM.
+
+    With `history_window` set, only the most recent turns are kept in memory and
+    older ones are spilled to disk (see agenttrace.turn_store); get_history()
+    still returns every turn.
+
+    With a `trace_store`, the conversation is recorded as a session: every turn
+    (with its analysis and metrics) and every token-level trace is written to it.
+
+    Each turn stores the backend's performance metrics under "metrics": tokenize,
+    prefill, decode, detokenize and trace-build durations, prompt and generated token
+    counts, tokens/sec and the peak memory increase during the generation (see
+    HuggingFaceBackend.last_metrics for how it is measured). `on_turn_metrics`, if given,
+    is called with the turn index and its metrics after every turn, e.g. to forward
+    them to a metrics pipeline.
+
+    A ready-made `backend` (e.g. a ReplayBackend for load tests) is used as-is
+    instead of building one from `backend_type`.
+    """
+    def __init__(self, model_name: str, max_length: int = 50, backend_type: str = "huggingface",
+                 seed: Optional[int] = None, response_cache: Optional[ResponseCache] = None,
+                 history_window: Optional[int] = None, spill_dir: Optional[str] = None,
+                 trace_store: Optional[TraceStore] = None,
+                 on_turn_metrics: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                 backend: Optional["LLMBackend"] = None, session_id: Optional[str] = None) -> None:
+        super().__init__(model_name, max_length, history_window, spill_dir, trace_store, on_turn_metrics,
+                         session_id)
         # Instantiate backend based on type
-        if backend_type.lower() == "huggingface":
-            self.backend: LLMBackend = HuggingFaceBackend(model_name)
+        if backend is not None:
+            self.backend = backend
+            backend_type = type(backend).__name__
+        elif backend_type.lower() == "huggingface":
+            from agenttrace.llm_backend import HuggingFaceBackend
+            self.backend: "LLMBackend" = HuggingFaceBackend(model_name, seed=seed, response_cache=response_cache,
+                                                          trace_store=trace_store, trace_session_id=self.session_id)
         else:
             raise ValueError(f"Unsupported backend type: {backend_type}")
         logger.info(f"Conversation initialized using backend '{backend_type}' with model '{model_name}'.")
@@ -29,19 +166,55 @@ class Conversation:
         Adds a turn by generating a response using the selected backend.
         """
         response = self.backend.generate(prompt, self.max_length)
-        self.history.append({"prompt": prompt, "response": response})
+        self._append_turn(prompt, response, dict(getattr(self.backend, "last_metrics", None) or {}))
         logger.info(f"Turn added. Prompt: {prompt} | Response: {response}")
         return response
 
-    def get_history(self) -> List[Dict[str, str]]:
+    def add_turn_stream(self, prompt: str) -> Iterator[str]:
         """
-        Returns the conversation history.
+        Adds a turn while streaming the response, yielding text as it is generated.
+
+        Once the stream is exhausted the turn is appended to the history with its
+        latency metrics, time to first token and inter-token latency (seconds), in
+        addition to the backend's performance metrics. Token timings are taken from
+        the yields that carry a trace entry, i.e. one per generated token; text the
+        backend flushes at the end of the stream does not count as a token.
         """
-        return self.history
+        start = time.perf_counter()
+        chunks: List[str] = []
+        token_times: List[float] = []
+        first_text_time = None
+        for delta, entry in self.backend.generate_stream(prompt, self.max_length, trace=True):
+            now = time.perf_counter() - start
+            if entry is not None:
+                token_times.append(now)
+            if delta:
+                if first_text_time is None:
+                    first_text_time = now
+                chunks.append(delta)
+                yield delta
+        total_time = time.perf_counter() - start
+
+        gaps = [later - earlier for earlier, later in zip(token_times, token_times[1:])]
+        metrics = {
+            # Backends that report metrics know the exact number of generated tokens.
+            "generated_tokens": len(token_times),
+            **(getattr(self.backend, "last_metrics", None) or {}),
+            "time_to_first_token": token_times[0] if token_times else None,
+            "time_to_first_text": first_text_time,
+            "inter_token_latency_mean": sum(gaps) / len(gaps) if gaps else None,
+            "inter_token_latency_max": max(gaps) if gaps else None,
+            "total_time": total_time,
+        }
+        response = "".join(chunks).strip()
+        self._append_turn(prompt, response, metrics)
+        logger.info(f"Streamed turn added. Prompt: {prompt} | Response: {response} | "
+                    f"TTFT: {metrics['time_to_first_token']}")
 
     def replay_turn(self, index: int, prompt_modification: str = "") -> str:
         """
         Replays a specific conversation turn with an optional prompt modification.
+        Backends with a prefix KV cache only prefill the appended modification.
         """
         if index < 0 or index >= len(self.history):
             raise IndexError("Invalid conversation turn index.")
@@ -50,3 +223,107 @@ class Conversation:
         new_response = self.backend.generate(new_prompt, self.max_length)
         logger.info(f"Replayed turn {index + 1} with modification '{prompt_modification}'. New response: {new_response}")
         return new_response
+
+    def replay_sweep(self, indices: Union[int, Sequence[int]], modifications: Sequence[str] = ("",),
+                     seeds: Optional[Sequence[Optional[int]]] = None, sampling: Sequence[Dict[str, Any]] = ({},),
+                     batch_size: int = 8) -> List[Dict[str, Any]]:
+        """
+        Replays turns across every combination of prompt modification, seed and sampling setting.
+
+        For each (seed, sampling) pair the distinct replay prompts are generated in one
+        batched backend call, so modifications or turns that produce the same prompt are
+        generated once and share the response. Every result is analyzed (see
+        analyzer.analyze_responses). The backend's seed and sampling parameters are
+        changed for the duration of the sweep, so it should not be shared with
+        concurrent callers meanwhile.
+
+        Args:
+            indices (Union[int, Sequence[int]]): Turn index or indices (e.g. a range) to replay.
+            modifications (Sequence[str]): Text appended to each prompt; "" replays it unchanged.
+            seeds (Sequence[Optional[int]], optional): Seeds to generate with; a None entry leaves
+                generation unseeded. Defaults to the backend's own seed.
+            sampling (Sequence[Dict[str, Any]]): Sampling parameter overrides, e.g. {"temperature": 0.7}.
+            batch_size (int): Batch size for generate_batch. Defaults to 8.
+
+        Returns:
+            List[Dict[str, Any]]: One row per (turn, modification, seed, sampling) with the
+            prompt, response and analysis metrics.
+        """
+        indices = [indices] if isinstance(indices, int) else list(indices)
+        for index in indices:
+            if index < 0 or index >= len(self.history):
+                raise IndexError("Invalid conversation turn index.")
+        if seeds is None:
+            seeds = (getattr(self.backend, "seed", None),)
+        variants = []
+        for index in indices:
+            original_prompt = self.history[index]["prompt"]
+            for modification in modifications:
+                prompt = f"{original_prompt} {modification}".strip() if modification else original_prompt
+                variants.append((index, modification, prompt))
+        prompts = list(dict.fromkeys(prompt for _, _, prompt in variants))
+
+        rows = []
+        for seed, setting in itertools.product(seeds, sampling):
+            with _backend_settings(self.backend, seed, setting):
+                responses = dict(zip(prompts, self.backend.generate_batch(prompts, self.max_length, batch_size)))
+            for index, modification, prompt in variants:
+                rows.append({"turn": index, "modification": modification, "seed": seed,
+                             "sampling": dict(setting), "prompt": prompt, "response": responses[prompt]})
+        for row, analysis in zip(rows, analyze_responses(rows)):
+            row.update(analysis)
+        logger.info(f"Replay sweep over {len(indices)} turns: {len(rows)} results from "
+                    f"{len(prompts) * len(seeds) * len(sampling)} generations.")
+        return rows
+
+
+class AsyncConversation(_TurnHistory):
+    """
+    Asyncio counterpart of Conversation: turns are generated on the async backend's
+    bounded worker pool, so many conversations can be served from one event loop.
+    Turns are stored, analysed and recorded exactly as in Conversation, including
+    their metrics, the `on_turn_metrics` hook and the `trace_store` session.
+    """
+    def __init__(self, model_name: str, max_length: int = 50, backend_type: str = "huggingface",
+                 max_concurrency: int = 2, timeout: Optional[float] = None,
+                 history_window: Optional[int] = None, spill_dir: Optional[str] = None,
+                 trace_store: Optional[TraceStore] = None,
+                 on_turn_metrics: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                 backend: Optional["AsyncLLMBackend"] = None, session_id: Optional[str] = None) -> None:
+        super().__init__(model_name, max_length, history_window, spill_dir, trace_store, on_turn_metrics,
+                         session_id)
+        if backend is not None:
+            self.backend = backend
+            backend_type = type(backend).__name__
+        elif backend_type.lower() == "huggingface":
+            from agenttrace.async_backend import AsyncHuggingFaceBackend
+            self.backend: "AsyncLLMBackend" = AsyncHuggingFaceBackend(
+                model_name, max_concurrency=max_concurrency, timeout=timeout,
+                trace_store=trace_store, trace_session_id=self.session_id
+            )
+        else:
+            raise ValueError(f"Unsupported backend type: {backend_type}")
+        logger.info(f"Async conversation initialized using backend '{backend_type}' with model '{model_name}'.")
+
+    async def add_turn(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Adds a turn by generating a response without blocking the event loop.
+        Raises asyncio.TimeoutError if the generation exceeds `timeout` seconds.
+        """
+        response, _, metrics = await self.backend.agenerate_with_metrics(prompt, self.max_length, timeout)
+        self._append_turn(prompt, response, metrics)
+        logger.info(f"Turn added. Prompt: {prompt} | Response: {response}")
+        return response
+
+    async def replay_turn(self, index: int, prompt_modification: str = "",
+                          timeout: Optional[float] = None) -> str:
+        """
+        Replays a specific conversation turn with an optional prompt modification.
+        """
+        if index < 0 or index >= len(self.history):
+            raise IndexError("Invalid conversation turn index.")
+        original_prompt = self.history[index]["prompt"]
+        new_prompt = f"{original_prompt} {prompt_modification}".strip() if prompt_modification else original_prompt
+        new_response = await self.backend.agenerate(new_prompt, self.max_length, timeout)
+        logger.info(f"Replayed turn {index + 1} with modification '{prompt_modification}'. New response: {new_response}")
+        return new_response
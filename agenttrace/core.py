@@ -5,10 +5,11 @@ This module provides an abstract function to load any LLM using Hugging Face's T
 """
 
 import logging
-from typing import Any
-from transformers import pipeline
+from typing import Any, Optional
+from agenttrace.response_cache import ResponseCache
 
-def load_llm(model_name: str, prompt: str, max_length: int = 50) -> str:
+def load_llm(model_name: str, prompt: str, max_length: int = 50, seed: Optional[int] = None,
+             response_cache: Optional[ResponseCache] = None) -> str:
     """
     Load a large language model and generate text based on the prompt.
     
@@ -16,18 +17,35 @@ def load_llm(model_name: str, prompt: str, max_length: int = 50) -> str:
         model_name (str): The identifier of the model (e.g., "distilgpt2" or any supported model).
         prompt (str): The input prompt to generate text from.
         max_length (int): The maximum length of generated output. Defaults to 50.
+        seed (int, optional): Seed for reproducible sampling. Required for caching.
+        response_cache (ResponseCache, optional): Cache consulted for seeded generations.
         
     Returns:
         str: The generated text (chain-of-thought).
     """
     logger = logging.getLogger("AgentTrace.core")
     try:
+        cache_key = None
+        if response_cache is not None and seed is not None:
+            cache_key = response_cache.make_key(model_name, prompt, max_length,
+                                                {"do_sample": True, "source": "pipeline"}, seed)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Returning cached generation.")
+                return cached["text"]
         logger.info(f"Initializing text generation pipeline for model '{model_name}'")
-        generator = pipeline("text-generation", model=model_name)
+        # Imported here so importing this module does not load torch and transformers.
+        from agenttrace.llm_backend import seeded_generation
+        from agenttrace.model_registry import get_registry
+        generator = get_registry().pipeline(model_name)
         logger.info("Pipeline initialized. Generating output...")
-        outputs = generator(prompt, max_length=max_length, do_sample=True)
+        # Reseed and sample under the global RNG lock so concurrent generations cannot interleave.
+        with seeded_generation(seed):
+            outputs = generator(prompt, max_length=max_length, do_sample=True)
         generated_text = outputs[0]["generated_text"]
         logger.info("Text generated successfully.")
+        if cache_key is not None:
+            response_cache.put(cache_key, {"text": generated_text})
         return generated_text
     except Exception as e:
         logger.error(f"Error generating text from model '{model_name}': {e}")
@@ -1,41 +1,51 @@
 """
 Module: agenttrace.exporter
-Exports the conversation session along with analysis metrics to a JSON structure.
+Exports the conversation session along with analysis metrics to a JSON structure,
+or incrementally to a JSON Lines file with one line per turn.
 """
 
 import json
-from typing import Dict, Any, List
-from agenttrace.conversation import Conversation
-from agenttrace.analyzer import analyze_response
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+from agenttrace.logger import setup_logger
 import time
 
-def export_session(conversation: Conversation) -> Dict[str, Any]:
+if TYPE_CHECKING:
+    # Only needed for annotations; keeps this module importable without the model stack.
+    from agenttrace.conversation import Conversation
+
+logger = setup_logger("AgentTrace.exporter")
+
+def export_session(conversation: "Conversation") -> Dict[str, Any]:
     """
     Export the conversation history along with analysis metrics for each turn.
+    Analyses are cached on the conversation, so repeated exports only analyse new turns.
     
     Returns:
         A dictionary representing the session data.
     """
     session_data: Dict[str, Any] = {
+        "session_id": conversation.session_id,
         "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         "model_name": conversation.model_name,
         "max_length": conversation.max_length,
         "turns": []
     }
     
-    for turn in conversation.get_history():
-        # Analyze each turn response
-        analysis = analyze_response(turn["prompt"], turn["response"])
+    for turn, analysis in zip(conversation.get_history(), conversation.get_analyses()):
         turn_data = {
             "prompt": turn["prompt"],
             "response": turn["response"],
             "analysis": analysis
         }
+        if "metrics" in turn:
+            turn_data["metrics"] = turn["metrics"]
         session_data["turns"].append(turn_data)
     
     return session_data
 
-def export_session_to_json(conversation: Conversation, file_path: str) -> None:
+def export_session_to_json(conversation: "Conversation", file_path: str) -> None:
     """
     Export the conversation session to a JSON file.
     
@@ -46,3 +56,125 @@ def export_session_to_json(conversation: Conversation, file_path: str) -> None:
     session_data = export_session(conversation)
     with open(file_path, "w") as f:
         json.dump(session_data, f, indent=4)
+
+
+def _turn_record(conversation: "Conversation", index: int) -> Dict[str, Any]:
+    turn = conversation.get_history()[index]
+    record = {
+        "type": "turn",
+        "index": index,
+        "prompt": turn["prompt"],
+        "response": turn["response"],
+        "analysis": conversation.get_analysis(index)
+    }
+    if "metrics" in turn:
+        record["metrics"] = turn["metrics"]
+    return record
+
+def _last_line(file_path: str, block_size: int = 4096) -> Optional[str]:
+    """
+    Return the last non-empty line of a file by reading backwards from its end.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.rstrip(b"\n").split(b"\n")
+            if len(lines) > 1 or end == 0:
+                return lines[-1].decode("utf-8") if lines[-1] else None
+    return None
+
+class JSONLSessionExporter:
+    """
+    Appends a conversation session to a JSON Lines file.
+
+    The first line is a session header ({"type": "session", "session_id", ...}); every following
+    line is one turn ({"type": "turn", "index": ..., "prompt", "response", "analysis"},
+    plus "metrics" when the turn has them). Each call to `export` appends only the
+    turns added since the previous call and flushes, so the file can be tailed while
+    a session is running and memory use is bounded by a single turn.
+
+    Exported lines are never rewritten: turns edited after they were exported keep
+    their exported content. A file only ever holds one session: exporting a
+    conversation whose session_id differs from the file's raises ValueError.
+
+    Args:
+        file_path (str): The output file path.
+        resume (bool): If the file already holds an export of the same session (see
+            Conversation's `session_id`), continue after its last turn. Otherwise the
+            file is truncated on the first export. Defaults to False.
+    """
+    def __init__(self, file_path: str, resume: bool = False) -> None:
+        self.file_path = file_path
+        self.exported_turns = 0
+        self.session_id: Optional[str] = None
+        self._needs_header = True
+        self._truncate = not resume
+        self._lock = threading.Lock()
+        if resume and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            with open(file_path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+            # Files written before session ids were recorded cannot be resumed.
+            self.session_id = header.get("session_id", "")
+            last = _last_line(file_path)
+            record = json.loads(last) if last else {}
+            self._needs_header = False
+            if record.get("type") == "turn":
+                self.exported_turns = record["index"] + 1
+            logger.info(f"Resuming export to {file_path} after {self.exported_turns} turns.")
+
+    def export(self, conversation: "Conversation") -> int:
+        """
+        Append the turns added since the last export.
+
+        Args:
+            conversation (Conversation): The conversation instance.
+
+        Returns:
+            int: The number of turns written.
+        """
+        with self._lock:
+            if self.session_id is not None and conversation.session_id != self.session_id:
+                raise ValueError(f"{self.file_path} holds session '{self.session_id}', not "
+                                 f"'{conversation.session_id}'; export to another file or use resume=False.")
+            total = len(conversation.get_history())
+            if total < self.exported_turns:
+                raise ValueError(
+                    f"Conversation has {total} turns but {self.exported_turns} were already exported."
+                )
+            mode = "w" if self._truncate else "a"
+            with open(self.file_path, mode, encoding="utf-8") as f:
+                if self._needs_header:
+                    header = {
+                        "type": "session",
+                        "session_id": conversation.session_id,
+                        "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "model_name": conversation.model_name,
+                        "max_length": conversation.max_length
+                    }
+                    f.write(json.dumps(header) + "\n")
+                for index in range(self.exported_turns, total):
+                    f.write(json.dumps(_turn_record(conversation, index)) + "\n")
+                    f.flush()
+            written = total - self.exported_turns
+            self.exported_turns = total
+            self._needs_header = False
+            self._truncate = False
+            self.session_id = conversation.session_id
+        logger.info(f"Appended {written} turns to {self.file_path}.")
+        return written
+
+def export_session_to_jsonl(conversation: "Conversation", file_path: str) -> None:
+    """
+    Export the whole conversation session to a JSON Lines file, one turn at a time.
+
+    Args:
+        conversation (Conversation): The conversation instance.
+        file_path (str): The output file path. An existing file is overwritten.
+    """
+    JSONLSessionExporter(file_path, resume=False).export(conversation)
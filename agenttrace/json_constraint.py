@@ -0,0 +1,424 @@
+"""
+Module: agenttrace.json_constraint
+Grammar-constrained JSON decoding. A character-level pushdown automaton tracks
+the JSON generated so far, optionally restricted to a JSON-Schema subset; a
+LogitsProcessor masks every token that cannot continue valid JSON, and a
+StoppingCriteria ends generation as soon as the top-level object closes.
+
+Supported schema keywords: "type" (object, array, string, integer, number,
+boolean, null), "properties" and "required" for objects (objects with
+"properties" only accept those keys) and "items" and "minItems" for arrays. A
+schema of None accepts any JSON value; the top-level value is always an object.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.json_constraint")
+
+# Schema of the plans requested by orchestrator.create_agent_chain.
+PLAN_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "plan": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "step_number": {"type": "integer"},
+                    "description": {"type": "string"},
+                    "notes": {"type": "string"},
+                },
+                "required": ["step_number", "description", "notes"],
+            },
+        },
+    },
+    "required": ["plan"],
+}
+
+# Consecutive whitespace characters allowed between JSON tokens, so the model
+# cannot spend its budget on blank lines.
+MAX_WHITESPACE_RUN = 2
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_PREFIX = re.compile(r"-?(?:(?:0|[1-9]\d*)(?:\.\d*)?(?:(?<=\d)[eE][+-]?\d*)?)?\Z")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?\Z")
+_INTEGER_PREFIX = re.compile(r"-?(?:0|[1-9]\d*)?\Z")
+_INTEGER = re.compile(r"-?(?:0|[1-9]\d*)\Z")
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+_HEX = "0123456789abcdefABCDEF"
+
+# A parser state is (stack, whitespace run). The stack holds immutable frames, so
+# trying a token never copies more than the frames it changes:
+#   ("val", schema)                            expecting a value
+#   ("obj", schema, phase, seen_keys, key)     phase: open, key, value, next, comma
+#   ("arr", schema, phase, items)              phase: open, next, comma
+#   ("str", allowed_keys, text, escape, is_key)
+#   ("num", integer_only, text)
+#   ("lit", remaining)
+# An empty stack means the top-level object is complete.
+State = Tuple[Tuple[tuple, ...], int]
+
+
+def _type_allows(schema: Optional[Dict[str, Any]], *types: str) -> bool:
+    return schema is None or schema.get("type") is None or schema["type"] in types
+
+
+def initial_state(schema: Optional[Dict[str, Any]] = None) -> State:
+    """
+    Parser state before the first character: expecting a top-level object matching `schema`.
+    """
+    return ((("val", schema if schema is not None else {"type": "object"}),), 0)
+
+
+def is_complete(state: State) -> bool:
+    return not state[0]
+
+
+def _complete(stack: Tuple[tuple, ...]) -> Tuple[tuple, ...]:
+    """
+    Pop a finished value and advance its parent.
+    """
+    stack = stack[:-1]
+    if not stack:
+        return stack
+    parent = stack[-1]
+    if parent[0] == "obj":
+        _, schema, _, seen, key = parent
+        return stack[:-1] + (("obj", schema, "next", seen | {key}, None),)
+    return stack[:-1] + (("arr", parent[1], "next", parent[3] + 1),)
+
+
+def _open_key(schema: Optional[Dict[str, Any]], seen: frozenset) -> Optional[tuple]:
+    properties = (schema or {}).get("properties")
+    if properties is None:
+        return ("str", None, "", 0, True)
+    remaining = tuple(key for key in properties if key not in seen)
+    return ("str", remaining, "", 0, True) if remaining else None
+
+
+def _can_close(schema: Optional[Dict[str, Any]], seen: frozenset) -> bool:
+    schema = schema or {}
+    required = schema.get("required", list(schema.get("properties", {})))
+    return all(key in seen for key in required)
+
+
+def _start_value(stack: Tuple[tuple, ...], schema: Optional[Dict[str, Any]], ch: str) -> Optional[Tuple[tuple, ...]]:
+    """
+    Replace the ("val", schema) frame on top of `stack` by the value that `ch` starts.
+    """
+    base = stack[:-1]
+    if ch == "{" and _type_allows(schema, "object"):
+        return base + (("obj", schema, "open", frozenset(), None),)
+    if ch == "[" and _type_allows(schema, "array"):
+        return base + (("arr", schema, "open", 0),)
+    if ch == '"' and _type_allows(schema, "string"):
+        return base + (("str", None, "", 0, False),)
+    if ch == "-" or ch.isdigit():
+        integer_only = schema is not None and schema.get("type") == "integer"
+        if _type_allows(schema, "number", "integer") and ch.isascii():
+            return base + (("num", integer_only, ch),)
+        return None
+    literal = _LITERALS.get(ch)
+    if literal is not None and _type_allows(schema, "boolean" if literal != "null" else "null"):
+        return base + (("lit", literal[1:]),)
+    return None
+
+
+def advance(state: State, text: str) -> Optional[State]:
+    """
+    Feed `text` to the parser.
+
+    Returns:
+        Optional[State]: The new state, or None if `text` cannot continue valid JSON.
+    """
+    stack, whitespace = state
+    for ch in text:
+        stack, whitespace = _feed(stack, whitespace, ch)
+        if stack is None:
+            return None
+    return stack, whitespace
+
+
+def _feed(stack: Tuple[tuple, ...], whitespace: int, ch: str) -> Tuple[Optional[Tuple[tuple, ...]], int]:
+    if not stack:
+        # Only trailing whitespace may follow the closed top-level object.
+        return (stack if ch in _WHITESPACE else None), whitespace
+    top = stack[-1]
+    kind = top[0]
+
+    if kind == "str":
+        _, allowed, text, escape, is_key = top
+        if escape == 1:
+            if ch == "u":
+                return stack[:-1] + (("str", allowed, text, 2, is_key),), 0
+            if ch in '"\\/bfnrt':
+                return stack[:-1] + (("str", allowed, text + "\\" + ch, 0, is_key),), 0
+            return None, 0
+        if escape >= 2:
+            if ch not in _HEX:
+                return None, 0
+            next_escape = escape + 1 if escape < 5 else 0
+            return stack[:-1] + (("str", allowed, text, next_escape, is_key),), 0
+        if ch == '"':
+            if allowed is not None and text not in allowed:
+                return None, 0
+            if is_key:
+                _, schema, _, seen, _ = stack[-2]
+                return stack[:-2] + (("obj", schema, "key", seen, text),), 0
+            return _complete(stack), 0
+        if ch == "\\":
+            # Constrained keys are plain identifiers; free strings may contain escapes.
+            return (None if allowed is not None else stack[:-1] + (("str", allowed, text, 1, is_key),)), 0
+        if ord(ch) < 0x20:
+            return None, 0
+        text += ch
+        if allowed is not None and not any(key.startswith(text) for key in allowed):
+            return None, 0
+        # Value strings are not kept, only keys need their text.
+        return stack[:-1] + (("str", allowed, text if is_key else "", 0, is_key),), 0
+
+    if kind == "num":
+        _, integer_only, text = top
+        candidate = text + ch
+        if (_INTEGER_PREFIX if integer_only else _NUMBER_PREFIX).match(candidate) and ch.isascii():
+            return stack[:-1] + (("num", integer_only, candidate),), 0
+        if not (_INTEGER if integer_only else _NUMBER).match(text):
+            return None, 0
+        # The number ended; the character belongs to the enclosing value.
+        return _feed(_complete(stack), 0, ch)
+
+    if kind == "lit":
+        remaining = top[1]
+        if ch != remaining[0]:
+            return None, 0
+        if len(remaining) == 1:
+            return _complete(stack), 0
+        return stack[:-1] + (("lit", remaining[1:]),), 0
+
+    if ch in _WHITESPACE:
+        if whitespace >= MAX_WHITESPACE_RUN:
+            return None, whitespace
+        return stack, whitespace + 1
+
+    if kind == "val":
+        return _start_value(stack, top[1], ch), 0
+
+    if kind == "obj":
+        _, schema, phase, seen, key = top
+        if phase in ("open", "comma") and ch == '"':
+            key_frame = _open_key(schema, seen)
+            return (stack + (key_frame,) if key_frame is not None else None), 0
+        if phase in ("open", "next") and ch == "}":
+            return (_complete(stack) if _can_close(schema, seen) else None), 0
+        if phase == "next" and ch == ",":
+            if _open_key(schema, seen) is None:
+                return None, 0
+            return stack[:-1] + (("obj", schema, "comma", seen, None),), 0
+        if phase == "key" and ch == ":":
+            value_schema = (schema or {}).get("properties", {}).get(key)
+            return stack[:-1] + (("obj", schema, "value", seen, key), ("val", value_schema)), 0
+        return None, 0
+
+    # kind == "arr"
+    _, schema, phase, count = top
+    if phase in ("open", "next") and ch == "]":
+        return (_complete(stack) if count >= (schema or {}).get("minItems", 0) else None), 0
+    if phase == "next" and ch == ",":
+        return stack[:-1] + (("arr", schema, "comma", count),), 0
+    if phase in ("open", "comma"):
+        items = (schema or {}).get("items")
+        return _feed(stack[:-1] + (("arr", schema, "next", count), ("val", items)), 0, ch)
+    return None, 0
+
+
+_token_text_cache: Dict[Tuple[str, int], List[Optional[str]]] = {}
+_prefix_index_cache: Dict[Tuple[str, int], Dict[str, Dict[str, torch.Tensor]]] = {}
+
+
+def _token_texts(tokenizer: Any) -> List[Optional[str]]:
+    """
+    Decoded text of every token id, or None for special tokens and partial UTF-8 sequences.
+    """
+    key = (getattr(tokenizer, "name_or_path", ""), len(tokenizer))
+    if key not in _token_text_cache:
+        texts = tokenizer.batch_decode([[token_id] for token_id in range(len(tokenizer))],
+                                       clean_up_tokenization_spaces=False)
+        special = set(tokenizer.all_special_ids)
+        _token_text_cache[key] = [
+            None if token_id in special or not text or "�" in text else text
+            for token_id, text in enumerate(texts)
+        ]
+    return _token_text_cache[key]
+
+
+def _prefix_index(tokenizer: Any) -> Dict[str, Dict[str, torch.Tensor]]:
+    """
+    Token ids grouped by their first character and then by their first two characters.
+    """
+    key = (getattr(tokenizer, "name_or_path", ""), len(tokenizer))
+    if key not in _prefix_index_cache:
+        groups: Dict[str, Dict[str, List[int]]] = {}
+        for token_id, text in enumerate(_token_texts(tokenizer)):
+            if text is not None:
+                groups.setdefault(text[0], {}).setdefault(text[:2], []).append(token_id)
+        _prefix_index_cache[key] = {
+            first: {prefix: torch.tensor(ids) for prefix, ids in prefixes.items()}
+            for first, prefixes in groups.items()
+        }
+    return _prefix_index_cache[key]
+
+
+class JSONConstraint:
+    """
+    Tracks the JSON generated so far for each row of a generation and reports tokens saved.
+
+    One instance serves a single generate call: pass `logits_processor()` and
+    `stopping_criteria()` to model.generate (or a text-generation pipeline).
+
+    Args:
+        tokenizer (Any): The model's tokenizer.
+        schema (Dict[str, Any], optional): JSON-Schema subset the object must follow. Defaults to any object.
+        max_new_tokens (int, optional): The generation budget, used to report tokens saved.
+        max_candidates (int): Number of highest-scoring valid tokens left unmasked per step. Defaults to 32.
+
+    Each step only tests tokens whose first two characters can continue the JSON
+    (looked up in a prefix index), best-scoring first, in windows of a few times
+    max_candidates, so structural positions cost a few prefix checks rather than a
+    pass over the vocabulary.
+    """
+    def __init__(self, tokenizer: Any, schema: Optional[Dict[str, Any]] = None,
+                 max_new_tokens: Optional[int] = None, max_candidates: int = 32) -> None:
+        self.tokenizer = tokenizer
+        self.schema = schema
+        self.max_new_tokens = max_new_tokens
+        self.max_candidates = max_candidates
+        self.token_texts = _token_texts(tokenizer)
+        self.prefix_index = _prefix_index(tokenizer)
+        self.eos_token_id = tokenizer.eos_token_id
+        self.states: List[Optional[State]] = []
+        self.prompt_length: Optional[int] = None
+        self._consumed = 0
+
+    def update(self, input_ids: torch.LongTensor) -> None:
+        """
+        Feed the tokens generated since the last call to each row's parser.
+        """
+        if self.prompt_length is None:
+            self.prompt_length = self._consumed = input_ids.shape[1]
+            self.states = [initial_state(self.schema) for _ in range(input_ids.shape[0])]
+        for position in range(self._consumed, input_ids.shape[1]):
+            for row, token_id in enumerate(input_ids[:, position].tolist()):
+                state = self.states[row]
+                if state is None or is_complete(state):
+                    continue
+                text = self.token_texts[token_id] if token_id < len(self.token_texts) else None
+                self.states[row] = advance(state, text) if text is not None else None
+        self._consumed = input_ids.shape[1]
+
+    def allowed_tokens(self, row: int, scores: torch.FloatTensor) -> List[int]:
+        """
+        Up to max_candidates grammar-valid token ids for `row`, highest score first.
+        """
+        state = self.states[row]
+        if state is None or is_complete(state):
+            return [self.eos_token_id] if self.eos_token_id is not None else []
+        candidates = self._candidates(state)
+        if not len(candidates):
+            return []
+        candidate_scores = scores[candidates.to(scores.device)]
+        allowed: List[int] = []
+        checked = 0
+        window = 4 * self.max_candidates
+        while checked < len(candidates) and len(allowed) < self.max_candidates:
+            window = min(len(candidates), max(window, 2 * checked))
+            top = torch.topk(candidate_scores, window).indices.tolist()
+            for position in top[checked:]:
+                token_id = int(candidates[position])
+                if advance(state, self.token_texts[token_id]) is not None:
+                    allowed.append(token_id)
+                    if len(allowed) >= self.max_candidates:
+                        break
+            checked = window
+        return allowed
+
+    def _candidates(self, state: State) -> torch.Tensor:
+        """
+        Ids of the tokens whose first two characters can continue `state`.
+        """
+        groups = []
+        for first, prefixes in self.prefix_index.items():
+            after_first = advance(state, first)
+            if after_first is None:
+                continue
+            for prefix, ids in prefixes.items():
+                if len(prefix) == 1 or advance(after_first, prefix[1]) is not None:
+                    groups.append(ids)
+        return torch.cat(groups) if groups else torch.empty(0, dtype=torch.long)
+
+    def logits_processor(self) -> "JSONLogitsProcessor":
+        return JSONLogitsProcessor(self)
+
+    def stopping_criteria(self) -> "JSONStoppingCriteria":
+        return JSONStoppingCriteria(self)
+
+    @property
+    def completed(self) -> bool:
+        """
+        Whether every row produced a complete top-level object.
+        """
+        return bool(self.states) and all(state is not None and is_complete(state) for state in self.states)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Generated tokens, the budget, tokens saved by stopping early and whether the JSON is complete.
+        """
+        generated = self._consumed - self.prompt_length if self.prompt_length is not None else 0
+        saved = max(0, self.max_new_tokens - generated) if self.max_new_tokens is not None else None
+        return {"generated_tokens": generated, "max_new_tokens": self.max_new_tokens,
+                "tokens_saved": saved, "completed": self.completed}
+
+
+class JSONLogitsProcessor(LogitsProcessor):
+    """
+    Masks every token that cannot continue valid JSON, keeping the JSONConstraint's
+    max_candidates best valid tokens. Once a row's object is complete only EOS is allowed.
+    """
+    def __init__(self, constraint: JSONConstraint) -> None:
+        self.constraint = constraint
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        self.constraint.update(input_ids)
+        masked = torch.full_like(scores, float("-inf"))
+        for row in range(scores.shape[0]):
+            allowed = self.constraint.allowed_tokens(row, scores[row])
+            if not allowed:
+                # No token continues the JSON (e.g. an ill-formed prefix); leave the row unconstrained.
+                masked[row] = scores[row]
+                continue
+            index = torch.tensor(allowed, device=scores.device)
+            masked[row, index] = scores[row, index]
+            if torch.isinf(masked[row, index]).all():
+                # An earlier processor (e.g. a minimum length) ruled out every valid token; keep them anyway.
+                masked[row, index] = 0.0
+        return masked
+
+
+class JSONStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row as soon as its top-level JSON object is complete.
+    """
+    def __init__(self, constraint: JSONConstraint) -> None:
+        self.constraint = constraint
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        self.constraint.update(input_ids)
+        done = [state is not None and is_complete(state) for state in self.constraint.states]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
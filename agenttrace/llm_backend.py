@@ -1,56 +1,1025 @@
-from abc import ABC, abstractmethod
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+from collections import OrderedDict, deque
+import contextlib
+import copy
+import queue
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+from agenttrace.backend_base import LLMBackend
+from agenttrace.logger import setup_logger
+from agenttrace.model_registry import ModelRegistry, dtype_name, get_registry, rss_mb
+from agenttrace.response_cache import ResponseCache, is_deterministic
+from agenttrace.trace_store import TraceStore
 
 torch.classes.__path__ = []
 
-class LLMBackend(ABC):
-    @abstractmethod
-    def generate(self, prompt: str, max_length: int) -> str:
-        pass
+# Number of generation steps whose scores are stacked together when building a trace.
+_TRACE_BLOCK_STEPS = 256
+
+logger = setup_logger("AgentTrace.llm_backend")
+
+def configure_threads(num_threads: Optional[int] = None, num_interop_threads: Optional[int] = None) -> None:
+    """
+    Set torch's intra-op and inter-op CPU thread counts for this process.
+
+    Both settings are process-wide. The inter-op count can only be set before torch
+    runs any parallel work; later attempts are logged and ignored.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None and torch.get_num_interop_threads() != num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads to {num_interop_threads}: {e}")
+
+def _crop_cache(past_key_values: Any, length: int) -> None:
+    """
+    Crop a KV cache in place to its first `length` positions.
+    """
+    excess = past_key_values.get_seq_length() - length
+    if excess > 0:
+        past_key_values.crop(-excess)
+
+class _RNGLock:
+    """
+    Shared/exclusive lock around torch's process-wide random generator.
+
+    Seeded sampling reseeds the global generator, so it runs exclusively: no other
+    sampling generation may draw from the generator until it finishes. Unseeded
+    sampling calls only need to keep seeded ones out and run concurrently. Waiting
+    exclusive holders take precedence over new shared ones.
+    """
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._condition:
+            while self._exclusive or self._waiting:
+                self._condition.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._condition:
+            self._waiting += 1
+            while self._exclusive or self._shared:
+                self._condition.wait()
+            self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+_rng_lock = _RNGLock()
+
+
+@contextlib.contextmanager
+def seeded_generation(seed: Optional[int], do_sample: bool = True) -> Iterator[None]:
+    """
+    Scope of one generation with respect to the global torch RNG.
+
+    Greedy generation draws no random numbers and is not locked. Seeded sampling
+    reseeds torch and holds the RNG exclusively, so concurrent generations (e.g.
+    ExecutorBackend workers or run_workflow agents) cannot interleave and its result
+    stays reproducible; unseeded sampling holds it shared.
+
+    Args:
+        seed (int, optional): Seed applied before generating, or None for unseeded sampling.
+        do_sample (bool): Whether the generation samples. Defaults to True.
+    """
+    if not do_sample:
+        yield
+    elif seed is not None:
+        with _rng_lock.exclusive():
+            torch.manual_seed(seed)
+            yield
+    else:
+        with _rng_lock.shared():
+            yield
+
+class _StopOnEvent(StoppingCriteria):
+    """
+    Stops generation once the given threading.Event is set, e.g. when the caller cancels.
+    """
+    def __init__(self, stop_event: threading.Event) -> None:
+        self.stop_event = stop_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class _StepTimer(_StopOnEvent):
+    """
+    Records when the first and the latest generation steps finished. Stopping criteria
+    run once per step, so the first call marks the end of the prefill. With `sample_memory`
+    set (a callable returning MB or None), it also keeps the highest value seen at any step.
+    """
+    def __init__(self, stop_event: Optional[threading.Event] = None) -> None:
+        super().__init__(stop_event if stop_event is not None else threading.Event())
+        self.first_step: Optional[float] = None
+        self.last_step: Optional[float] = None
+        self.sample_memory: Optional[Callable[[], Optional[float]]] = None
+        self.peak_memory_mb: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        self.last_step = time.perf_counter()
+        if self.first_step is None:
+            self.first_step = self.last_step
+        if self.sample_memory is not None:
+            memory = self.sample_memory()
+            if memory is not None and (self.peak_memory_mb is None or memory > self.peak_memory_mb):
+                self.peak_memory_mb = memory
+        return super().__call__(input_ids, scores, **kwargs)
+
+class _TokenTap(_StepTimer):
+    """
+    Stopping criterion that forwards each newly sampled token id, with the step's
+    processed scores when available, to a queue. Like _StopOnEvent, setting
+    `stop_event` (e.g. when a stream consumer goes away) ends the generation.
+    """
+    def __init__(self, token_queue: "queue.Queue", stop_event: threading.Event) -> None:
+        super().__init__(stop_event)
+        self.token_queue = token_queue
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        step_scores = scores[-1] if scores else None
+        self.token_queue.put((int(input_ids[0, -1]), step_scores))
+        return super().__call__(input_ids, scores, **kwargs)
+
+# Assisted-generation tracker of the current thread, picked up by _install_assist_hook.
+_assist_local = threading.local()
+
+def _install_assist_hook(model: Any) -> None:
+    """
+    Wrap the model's candidate-generator factory (once per model) so the calling
+    thread's _AssistTracker, if any, is attached to every assisted generation.
+    """
+    if getattr(model, "_agenttrace_assist_hook", False):
+        return
+    original = model._get_candidate_generator
+
+    def get_candidate_generator(*args: Any, **kwargs: Any) -> Any:
+        generator = original(*args, **kwargs)
+        tracker = getattr(_assist_local, "tracker", None)
+        if tracker is not None:
+            tracker.attach(generator)
+        return generator
+
+    model._get_candidate_generator = get_candidate_generator
+    model._agenttrace_assist_hook = True
+
+class _AssistTracker(_StepTimer):
+    """
+    Step timer for assisted generation that also records, for every verification
+    round, how many tokens the draft proposed and how many the model accepted.
+    Both come from the candidate generator: proposals from the length of the
+    candidate sequences, acceptances from the match count transformers reports
+    back to it. Used as a context manager, it is active for the calling thread only.
+    """
+    def __init__(self, model: Any, stop_event: Optional[threading.Event] = None) -> None:
+        super().__init__(stop_event)
+        _install_assist_hook(model)
+        # (proposed, accepted) per verification round.
+        self.rounds: List[Tuple[int, int]] = []
+        self._proposed = 0
+
+    def attach(self, generator: Any) -> None:
+        get_candidates = generator.get_candidates
+        update_candidate_strategy = generator.update_candidate_strategy
+
+        def tracked_get_candidates(input_ids: torch.LongTensor, *args: Any, **kwargs: Any) -> Any:
+            candidate_ids, candidate_logits = get_candidates(input_ids, *args, **kwargs)
+            self._proposed = candidate_ids.shape[1] - input_ids.shape[1]
+            return candidate_ids, candidate_logits
+
+        def tracked_update(input_ids: torch.LongTensor, scores: Any, num_matches: int) -> Any:
+            self.rounds.append((self._proposed, int(num_matches)))
+            return update_candidate_strategy(input_ids, scores, num_matches)
+
+        generator.get_candidates = tracked_get_candidates
+        generator.update_candidate_strategy = tracked_update
+
+    def __enter__(self) -> "_AssistTracker":
+        _assist_local.tracker = self
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        _assist_local.tracker = None
 
-    @abstractmethod
-    def generate_with_trace(self, prompt: str, max_length: int) -> (str, list):
+    def stats(self, generated_tokens: int) -> Tuple[List[str], Dict[str, Any]]:
         """
-        Generate text and return chain-of-thought details (token-level trace).
+        Attribute each generated token to the draft or the target model and summarise
+        the acceptance rate.
+
+        Each round, the model keeps the accepted prefix of the draft's proposals and
+        adds one token of its own.
+
+        Returns:
+            Tuple[List[str], Dict[str, Any]]: The source ("draft" or "target") of every
+            generated token, and the round, proposal and acceptance counts.
+        """
+        sources: List[str] = []
+        for _, accepted in self.rounds:
+            sources.extend(["draft"] * accepted + ["target"])
+        # The last round may have been cut short by max_length or a stopping criterion.
+        sources = sources[:generated_tokens] + ["target"] * (generated_tokens - len(sources))
+        proposed_total = sum(proposed for proposed, _ in self.rounds)
+        accepted_total = sum(accepted for _, accepted in self.rounds)
+        return sources, {
+            "rounds": len(self.rounds),
+            "draft_tokens": proposed_total,
+            "accepted_tokens": accepted_total,
+            "acceptance_rate": accepted_total / proposed_total if proposed_total else None,
+            "tokens_per_round": generated_tokens / len(self.rounds) if self.rounds else None,
+        }
+
+class RepetitionDetector:
+    """
+    Online detector of degenerate repetition over generated token ids.
+
+    Keeps a rolling hash of the last `ngram` tokens and the counts of the n-gram
+    hashes within the latest `window` n-grams, so each token is processed in O(1).
+    The repetition ratio is the share of n-grams in the window that duplicate
+    another one (1 - distinct / total); once at least `min_ngrams` n-grams have been
+    seen and the ratio reaches `threshold`, the detector triggers.
+
+    Args:
+        ngram (int): N-gram length in tokens. Defaults to 4.
+        window (int): Number of most recent n-grams considered. Defaults to 64.
+        threshold (float): Repetition ratio that stops the generation. Defaults to 0.5.
+        min_ngrams (int): N-grams required before the detector may trigger. Defaults to 16.
+    """
+    _BASE = 1_000_003
+    _MODULUS = (1 << 61) - 1
+
+    def __init__(self, ngram: int = 4, window: int = 64, threshold: float = 0.5, min_ngrams: int = 16) -> None:
+        if ngram < 1 or window < 1:
+            raise ValueError("ngram and window must be at least 1.")
+        self.ngram = ngram
+        self.window = window
+        self.threshold = threshold
+        self.min_ngrams = min(min_ngrams, window)
+        self._tokens: "deque[int]" = deque()
+        self._hash = 0
+        # Weight of the token leaving the n-gram: BASE ** (ngram - 1).
+        self._drop_weight = pow(self._BASE, ngram - 1, self._MODULUS)
+        self._ngrams: "deque[int]" = deque()
+        self._counts: Dict[int, int] = {}
+        self.tokens_seen = 0
+        self.triggered_at: Optional[int] = None
+
+    @property
+    def ratio(self) -> float:
+        if not self._ngrams:
+            return 0.0
+        return 1.0 - len(self._counts) / len(self._ngrams)
+
+    @property
+    def triggered(self) -> bool:
+        return self.triggered_at is not None
+
+    def push(self, token_id: int) -> bool:
+        """
+        Add the next generated token. Returns True once repetition has passed the threshold.
+        """
+        self.tokens_seen += 1
+        if len(self._tokens) == self.ngram:
+            dropped = self._tokens.popleft()
+            self._hash = (self._hash - (dropped + 1) * self._drop_weight) % self._MODULUS
+        self._tokens.append(token_id)
+        self._hash = (self._hash * self._BASE + token_id + 1) % self._MODULUS
+        if len(self._tokens) == self.ngram:
+            if len(self._ngrams) == self.window:
+                evicted = self._ngrams.popleft()
+                self._counts[evicted] -= 1
+                if not self._counts[evicted]:
+                    del self._counts[evicted]
+            self._ngrams.append(self._hash)
+            self._counts[self._hash] = self._counts.get(self._hash, 0) + 1
+            if (self.triggered_at is None and len(self._ngrams) >= self.min_ngrams
+                    and self.ratio >= self.threshold):
+                self.triggered_at = self.tokens_seen
+        return self.triggered
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Settings and current state, as recorded with a generation that it stopped.
         """
-        pass
+        return {"ngram": self.ngram, "window": self.window, "threshold": self.threshold,
+                "ratio": self.ratio, "ngrams": len(self._ngrams), "distinct_ngrams": len(self._counts),
+                "tokens_seen": self.tokens_seen, "triggered_at": self.triggered_at}
+
+class _RepetitionStop(StoppingCriteria):
+    """
+    Feeds the tokens generated since the previous call (one per step, several per
+    assisted-decoding round) to a RepetitionDetector and stops once it triggers.
+    With one detector, as in generate_with_trace and generate_stream, the first row
+    is tracked and decides for the batch; with one detector per row, as in
+    generate_batch_with_trace, each row stops on its own.
+    """
+    def __init__(self, detector: Union[RepetitionDetector, List[RepetitionDetector]], prompt_length: int) -> None:
+        self.detectors = detector if isinstance(detector, list) else [detector]
+        self.detector = self.detectors[0]
+        self.consumed = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        for row, detector in enumerate(self.detectors):
+            if detector.triggered:
+                # The row has stopped; later ids are padding.
+                continue
+            for token_id in input_ids[row, self.consumed:].tolist():
+                if detector.push(token_id):
+                    break
+        self.consumed = input_ids.shape[1]
+        if len(self.detectors) == 1:
+            return torch.full((input_ids.shape[0],), self.detector.triggered, dtype=torch.bool,
+                              device=input_ids.device)
+        return torch.tensor([detector.triggered for detector in self.detectors], dtype=torch.bool,
+                            device=input_ids.device)
+
+class _BudgetStop(StoppingCriteria):
+    """
+    Marks each row of a left-padded batch finished once it has generated its own
+    token budget, so rows with longer prompts stop at their own max_length.
+    """
+    def __init__(self, budgets: List[int], prompt_length: int) -> None:
+        self.budgets = budgets
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: Any, **kwargs: Any) -> torch.BoolTensor:
+        generated = input_ids.shape[1] - self.prompt_length
+        return torch.tensor([generated >= budget for budget in self.budgets], dtype=torch.bool,
+                            device=input_ids.device)
+
+def _generation_metrics(start: float, tokenized: float, generate_start: float, timer: _StepTimer,
+                        generate_end: float, detokenize_time: float, trace_time: float,
+                        prompt_tokens: int, generated_tokens: int, memory_before: Optional[float],
+                        peak_memory: Optional[float]) -> Dict[str, Any]:
+    """
+    Assemble the per-generation performance record stored with each turn.
+    """
+    first_step = timer.first_step if timer.first_step is not None else generate_end
+    generation_time = generate_end - generate_start
+    return {
+        "tokenize_time": tokenized - start,
+        "prefill_time": first_step - generate_start,
+        "decode_time": generate_end - first_step,
+        "detokenize_time": detokenize_time,
+        "trace_time": trace_time,
+        "total_time": time.perf_counter() - start,
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": generated_tokens,
+        "tokens_per_sec": generated_tokens / generation_time if generation_time > 0 else None,
+        "peak_memory_delta_mb": (peak_memory - memory_before
+                                 if memory_before is not None and peak_memory is not None else None),
+        "cached": False,
+    }
 
 class HuggingFaceBackend(LLMBackend):
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, dtype: Any = None, device: str = "cpu",
+                 registry: Optional[ModelRegistry] = None, prefix_cache_size: int = 8,
+                 generation_kwargs: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+                 response_cache: Optional[ResponseCache] = None, trace_store: Optional[TraceStore] = None,
+                 trace_session_id: Optional[str] = None, num_threads: Optional[int] = None,
+                 num_interop_threads: Optional[int] = None, assistant_model: Optional[str] = None,
+                 num_assistant_tokens: Optional[int] = None,
+                 repetition_stop: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            model_name (str): Hub id or local path of the model.
+            dtype (Any, optional): Weight dtype: "float32", "float16", "bfloat16", "auto", or
+                "int8" for dynamically quantized linear layers on CPU. Defaults to the checkpoint's dtype.
+            device (str): Device to run on. Defaults to "cpu".
+            num_threads (int, optional): torch intra-op thread count (process-wide).
+            num_interop_threads (int, optional): torch inter-op thread count (process-wide).
+            assistant_model (str, optional): Hub id or local path of a smaller draft model with
+                the same tokenizer. generate_with_trace then uses assisted (speculative)
+                decoding: the draft proposes tokens and the model verifies them in one pass.
+            num_assistant_tokens (int, optional): Initial number of tokens the draft proposes
+                per round. Defaults to the transformers default.
+            repetition_stop (Dict[str, Any], optional): RepetitionDetector settings (e.g.
+                {"threshold": 0.5}); generations stop as soon as their repetition ratio
+                reaches the threshold. Defaults to no repetition stop.
+
+        Generation always runs under torch.inference_mode().
+        """
         self.model_name = model_name
-        # Load the model and tokenizer directly for advanced generation.
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
-        self.model.eval()
+        self.model_id = f"{model_name}@{dtype_name(dtype)}"
+        configure_threads(num_threads, num_interop_threads)
+        # Sampling parameters passed to every model.generate call.
+        self.generation_kwargs: Dict[str, Any] = {"do_sample": True, **(generation_kwargs or {})}
+        # With a seed, every generation reseeds torch first and is reproducible, also
+        # across threads: seeded sampling holds the global RNG exclusively.
+        self.seed = seed
+        # Optional cache for deterministic (seeded or greedy) generate_with_trace calls.
+        self.response_cache = response_cache
+        # Optional persistent store receiving every generate_with_trace result.
+        self.trace_store = trace_store
+        self.trace_session_id = trace_session_id
+        # Model and tokenizer are shared through the process-wide registry, so
+        # several backends for the same model never load the weights twice.
+        self.registry = registry if registry is not None else get_registry()
+        self.model, self.tokenizer = self.registry.get(model_name, dtype=dtype, device=device)
+        self.assistant_model_name = assistant_model
+        self.num_assistant_tokens = num_assistant_tokens
+        self.repetition_stop = repetition_stop
+        self.assistant_model = None
+        if assistant_model is not None:
+            self.assistant_model, assistant_tokenizer = self.registry.get(assistant_model, dtype=dtype, device=device)
+            # Draft tokens are verified by id, so both models must share one vocabulary.
+            if assistant_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+                raise ValueError(f"Assistant model '{assistant_model}' does not share the tokenizer of '{model_name}'.")
+        # KV caches of recent prompts, keyed by their token ids, so a prompt that
+        # extends one of them (e.g. a replay with an appended modification) only
+        # needs to prefill the new suffix. Bounded LRU; 0 disables it.
+        self.prefix_cache_size = prefix_cache_size
+        self._prefix_cache: "OrderedDict[Tuple[int, ...], Any]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        self.prefix_cache_stats = {"hits": 0, "misses": 0, "reused_tokens": 0}
+        # Performance record of the calling thread's latest generation (see last_metrics).
+        self._local = threading.local()
+
+    @property
+    def last_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        Timings (seconds), token counts, tokens/sec and peak memory increase (MB) of the
+        latest generate_with_trace or generate_stream call made from the current thread.
+
+        `peak_memory_delta_mb` is the peak memory during the generation minus the memory
+        in use when it started. On CUDA both come from the allocator (memory_allocated
+        and max_memory_allocated). On CPU they are the current resident set size
+        (/proc/self/statm, or psutil), sampled before generating and after every step;
+        None where neither is available. RSS is process-wide, so concurrent work in
+        other threads is included.
+        """
+        return getattr(self._local, "metrics", None)
+
+    def _start_memory(self, timer: _StepTimer) -> Optional[float]:
+        """
+        Return the memory in use (MB) before a generation and arm `timer` so that
+        _peak_memory_mb can report the highest value reached during it.
+        """
+        if self.model.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.model.device)
+            return torch.cuda.memory_allocated(self.model.device) / 2**20
+        timer.sample_memory = rss_mb
+        return rss_mb()
+
+    def _peak_memory_mb(self, timer: _StepTimer) -> Optional[float]:
+        if self.model.device.type == "cuda":
+            return torch.cuda.max_memory_allocated(self.model.device) / 2**20
+        samples = [memory for memory in (timer.peak_memory_mb, rss_mb()) if memory is not None]
+        return max(samples) if samples else None
 
     def generate(self, prompt: str, max_length: int) -> str:
         # Use generate_with_trace and ignore the trace
         output, _ = self.generate_with_trace(prompt, max_length)
         return output
 
-    def generate_with_trace(self, prompt: str, max_length: int) -> (str, list):
-        inputs = self.tokenizer(prompt, return_tensors="pt")
+    def generate_with_trace(self, prompt: str, max_length: int, top_k: int = 0,
+                            detailed: bool = False, stop_event: Optional[threading.Event] = None) -> (str, list):
+        """
+        Generate text and return a token-level trace.
+
+        Each trace entry holds the most likely token at that step and its probability.
+        With `top_k` > 0 the entry also lists the top-k alternatives; with `detailed`
+        it adds the token that was actually sampled, its probability and the entropy
+        of the step's distribution. Setting `stop_event` from another thread ends the
+        generation early and returns what was produced so far.
+
+        When a response cache is configured and the generation is deterministic, the
+        result is served from (and stored in) the cache.
+
+        With an assistant model, every trace entry also records whether the token was
+        proposed by the draft and accepted ("draft") or produced by the model itself
+        ("target"), and last_metrics["assisted"] holds the number of verification
+        rounds, proposed and accepted draft tokens and the acceptance rate. The
+        probabilities in the trace are always the model's own.
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.response_cache is not None and is_deterministic(self.generation_kwargs, self.seed):
+            cache_key = self._cache_key(prompt, max_length, top_k, detailed)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self._local.metrics = {"total_time": time.perf_counter() - start,
+                                       "generated_tokens": len(cached["trace"]), "cached": True}
+                self._record_trace(prompt, cached["text"], cached["trace"])
+                return cached["text"], cached["trace"]
+
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        tokenized = time.perf_counter()
         prompt_length = inputs['input_ids'].shape[1]
-        outputs = self.model.generate(
-            **inputs,
-            max_length=max_length,
-            do_sample=True,
-            output_scores=True,
-            return_dict_in_generate=True
-        )
+        prompt_ids = inputs['input_ids'][0].tolist()
+        generate_kwargs = {}
+        if self.assistant_model is not None:
+            # Assisted generation keeps its own caches for both models, so the prefix cache is bypassed.
+            timer = assist_context = _AssistTracker(self.model, stop_event)
+            generate_kwargs["assistant_model"] = self.assistant_model
+            if self.num_assistant_tokens is not None:
+                generate_kwargs["num_assistant_tokens"] = self.num_assistant_tokens
+        else:
+            past_key_values = self._lookup_prefix_cache(prompt_ids)
+            if past_key_values is not None:
+                generate_kwargs["past_key_values"] = past_key_values
+            timer = _StepTimer(stop_event)
+            assist_context = contextlib.nullcontext()
+        repetition_stop = self._repetition_criteria(prompt_length)
+        memory_before = self._start_memory(timer)
+        generate_start = time.perf_counter()
+        with torch.inference_mode(), assist_context, self._seeded_generation():
+            outputs = self.model.generate(
+                **inputs,
+                **generate_kwargs,
+                max_length=max_length,
+                **self.generation_kwargs,
+                output_scores=True,
+                return_dict_in_generate=True,
+                stopping_criteria=StoppingCriteriaList([timer, *repetition_stop])
+            )
+        generate_end = time.perf_counter()
+        peak_memory = self._peak_memory_mb(timer)
+        if self.assistant_model is None:
+            self._store_prefix_cache(prompt_ids, getattr(outputs, "past_key_values", None))
         # Decode the full output and then remove the prompt part if it exists.
         full_text = self.tokenizer.decode(outputs.sequences[0], skip_special_tokens=True)
         if full_text.startswith(prompt):
             generated_text = full_text[len(prompt):].strip()
         else:
             generated_text = full_text
+        detokenized = time.perf_counter()
 
-        # Build chain-of-thought trace: For each generation step, get the top token and its confidence.
-        trace_info = []
-        for step, logits in enumerate(outputs.scores):
-            probs = torch.softmax(logits, dim=-1)
-            top_prob, top_idx = torch.topk(probs, 1)
-            token_str = self.tokenizer.decode(top_idx[0])
-            trace_info.append({"token": token_str.strip(), "confidence": top_prob.item()})
+        generated_ids = outputs.sequences[0, prompt_length:].tolist()[:len(outputs.scores)]
+        trace_info = self._build_traces(outputs.scores, [generated_ids], top_k, detailed)[0]
+        self._local.metrics = _generation_metrics(
+            start, tokenized, generate_start, timer, generate_end, detokenized - generate_end,
+            time.perf_counter() - detokenized, prompt_length, len(generated_ids), memory_before, peak_memory
+        )
+        if isinstance(timer, _AssistTracker):
+            sources, assisted = timer.stats(len(generated_ids))
+            for entry, source in zip(trace_info, sources):
+                entry["source"] = source
+            self._local.metrics["assisted"] = {"draft_model": self.assistant_model_name, **assisted}
+        self._record_stop(self._local.metrics, repetition_stop, stop_event,
+                          outputs.sequences[0, prompt_length:].tolist(), trace_info)
+        # A generation cut short by stop_event is not a reproducible result.
+        if cache_key is not None and not (stop_event is not None and stop_event.is_set()):
+            self.response_cache.put(cache_key, {"text": generated_text, "trace": trace_info})
+        self._record_trace(prompt, generated_text, trace_info)
         return generated_text, trace_info
+
+    def _cache_key(self, prompt: str, max_length: int, top_k: int, detailed: bool) -> str:
+        """
+        Response cache key of a generation with the backend's current settings.
+        """
+        params = {**self.generation_kwargs, "trace_top_k": top_k, "trace_detailed": detailed}
+        if self.assistant_model is not None:
+            # Greedy results do not depend on the draft, but seeded sampling does.
+            params["assistant_model"] = self.assistant_model_name
+        if self.repetition_stop is not None:
+            params["repetition_stop"] = self.repetition_stop
+        return self.response_cache.make_key(self.model_id, prompt, max_length, params, self.seed)
+
+    def _repetition_criteria(self, prompt_length: int) -> List[_RepetitionStop]:
+        """
+        A fresh repetition stopping criterion for one generation, if repetition_stop is configured.
+        """
+        if self.repetition_stop is None:
+            return []
+        return [_RepetitionStop(RepetitionDetector(**self.repetition_stop), prompt_length)]
+
+    def _record_stop(self, metrics: Dict[str, Any], repetition_stop: List[_RepetitionStop],
+                     stop_event: Optional[threading.Event], generated_ids: List[int],
+                     trace_info: Optional[list] = None) -> None:
+        """
+        Record why the generation ended ("repetition", "cancelled", "eos" or "max_length")
+        in its metrics and, for repetition stops, in the final trace entry along with
+        the detector state.
+        """
+        eos_ids = self.model.generation_config.eos_token_id
+        eos_ids = [eos_ids] if isinstance(eos_ids, int) else (eos_ids or [])
+        detector = repetition_stop[0].detector if repetition_stop else None
+        if detector is not None and detector.triggered:
+            reason = "repetition"
+        elif stop_event is not None and stop_event.is_set():
+            reason = "cancelled"
+        elif generated_ids and generated_ids[-1] in eos_ids:
+            reason = "eos"
+        else:
+            reason = "max_length"
+        metrics["stop_reason"] = reason
+        if detector is not None:
+            metrics["repetition"] = detector.state()
+            if reason == "repetition" and trace_info:
+                trace_info[-1]["stop_reason"] = reason
+                trace_info[-1]["repetition"] = detector.state()
+
+    def _record_trace(self, prompt: str, generated_text: str, trace_info: list) -> None:
+        if self.trace_store is not None:
+            self.trace_store.add_generation(self.model_id, prompt, generated_text, trace_info,
+                                            session_id=self.trace_session_id)
+
+    def _seeded_generation(self) -> ContextManager[None]:
+        """
+        Scope of one model.generate call with respect to the global torch RNG (see seeded_generation).
+        """
+        return seeded_generation(self.seed, bool(self.generation_kwargs.get("do_sample")))
+
+    def _lookup_prefix_cache(self, prompt_ids: List[int]) -> Any:
+        """
+        Return a private copy of the cached KV state sharing the longest token prefix
+        with `prompt_ids`, cropped to that prefix, or None when nothing matches.
+        At least one prompt token is always left uncached for generate to process.
+        """
+        if self.prefix_cache_size <= 0:
+            return None
+        best_key, best_length = None, 0
+        with self._prefix_lock:
+            for key in self._prefix_cache:
+                limit = min(len(key), len(prompt_ids) - 1)
+                length = 0
+                while length < limit and key[length] == prompt_ids[length]:
+                    length += 1
+                if length > best_length:
+                    best_key, best_length = key, length
+            if best_key is None:
+                self.prefix_cache_stats["misses"] += 1
+                return None
+            self._prefix_cache.move_to_end(best_key)
+            self.prefix_cache_stats["hits"] += 1
+            self.prefix_cache_stats["reused_tokens"] += best_length
+            # generate extends the cache in place, so hand out a copy.
+            past_key_values = copy.deepcopy(self._prefix_cache[best_key])
+        _crop_cache(past_key_values, best_length)
+        return past_key_values
+
+    def _store_prefix_cache(self, prompt_ids: List[int], past_key_values: Any) -> None:
+        """
+        Keep the prompt part of a generation's KV cache for later prefix reuse.
+        Caches that cannot be cropped (legacy tuple format) are not stored.
+        """
+        if self.prefix_cache_size <= 0 or len(prompt_ids) < 2 or not hasattr(past_key_values, "crop"):
+            return
+        # Keep all but the last prompt token so an identical prompt can reuse the entry too.
+        key = tuple(prompt_ids[:-1])
+        _crop_cache(past_key_values, len(key))
+        with self._prefix_lock:
+            self._prefix_cache[key] = past_key_values
+            self._prefix_cache.move_to_end(key)
+            while len(self._prefix_cache) > self.prefix_cache_size:
+                self._prefix_cache.popitem(last=False)
+
+    def clear_prefix_cache(self) -> None:
+        """
+        Drop all cached prompt KV states.
+        """
+        with self._prefix_lock:
+            self._prefix_cache.clear()
+
+    def _build_traces(self, scores: Sequence[torch.Tensor], generated_ids: List[List[int]],
+                      top_k: int = 0, detailed: bool = False) -> List[list]:
+        """
+        Build the chain-of-thought trace for every row of a (possibly batched) generation.
+
+        The per-step score tensors are stacked so softmax, top-k and entropy run once per
+        block of steps instead of once per token, and every token string is produced by
+        a single batch_decode call.
+
+        Args:
+            scores (Sequence[torch.Tensor]): Per-step scores of shape [batch, vocab], as returned by generate.
+            generated_ids (List[List[int]]): Generated token ids for each row; a row's trace covers len(ids) steps.
+            top_k (int): Number of alternative tokens to report per step (0 disables alternatives).
+            detailed (bool): Also report the sampled token, its probability and the step entropy.
+
+        Returns:
+            List[list]: One list of trace entries per row.
+        """
+        num_steps = min(len(scores), max((len(ids) for ids in generated_ids), default=0))
+        if num_steps == 0:
+            return [[] for _ in generated_ids]
+        k = max(1, top_k)
+        top_probs: List[list] = [[] for _ in generated_ids]
+        top_ids: List[list] = [[] for _ in generated_ids]
+        chosen_probs: List[list] = [[] for _ in generated_ids]
+        entropies: List[list] = [[] for _ in generated_ids]
+        # Process steps in blocks to bound the extra memory of the stacked copy.
+        for block_start in range(0, num_steps, _TRACE_BLOCK_STEPS):
+            block_end = min(block_start + _TRACE_BLOCK_STEPS, num_steps)
+            probs = torch.softmax(torch.stack(tuple(scores[block_start:block_end]), dim=1).float(), dim=-1)
+            block_probs, block_ids = torch.topk(probs, k, dim=-1)
+            if detailed:
+                chosen = torch.tensor(
+                    [(ids[block_start:block_end] + [0] * (block_end - block_start))[:block_end - block_start]
+                     for ids in generated_ids],
+                    device=probs.device,
+                )
+                block_chosen = probs.gather(-1, chosen.unsqueeze(-1)).squeeze(-1).tolist()
+                block_entropy = torch.special.entr(probs).sum(dim=-1).tolist()
+            block_probs, block_ids = block_probs.tolist(), block_ids.tolist()
+            for row in range(len(generated_ids)):
+                top_probs[row].extend(block_probs[row])
+                top_ids[row].extend(block_ids[row])
+                if detailed:
+                    chosen_probs[row].extend(block_chosen[row])
+                    entropies[row].extend(block_entropy[row])
+
+        needed_ids = {token_id for row in top_ids for step in row for token_id in step}
+        if detailed:
+            needed_ids.update(token_id for ids in generated_ids for token_id in ids[:num_steps])
+        id_list = sorted(needed_ids)
+        decoded = self.tokenizer.batch_decode([[token_id] for token_id in id_list])
+        token_strings = {token_id: text.strip() for token_id, text in zip(id_list, decoded)}
+
+        traces = []
+        for row, ids in enumerate(generated_ids):
+            trace_info = []
+            for step in range(min(len(ids), num_steps)):
+                entry = {
+                    "token": token_strings[top_ids[row][step][0]],
+                    "confidence": top_probs[row][step][0],
+                }
+                if detailed:
+                    entry["chosen_token"] = token_strings[ids[step]]
+                    entry["chosen_confidence"] = chosen_probs[row][step]
+                    entry["entropy"] = entropies[row][step]
+                if top_k > 0:
+                    entry["alternatives"] = [
+                        {"token": token_strings[token_id], "confidence": prob}
+                        for token_id, prob in zip(top_ids[row][step], top_probs[row][step])
+                    ]
+                trace_info.append(entry)
+            traces.append(trace_info)
+        return traces
+
+    def generate_stream(self, prompt: str, max_length: int, trace: bool = True, top_k: int = 0,
+                        detailed: bool = False) -> Iterator[Tuple[str, Optional[dict]]]:
+        """
+        Generate text token by token, yielding (text_delta, trace_entry) pairs as they are produced.
+
+        model.generate runs on a background thread and a stopping-criteria tap hands each
+        sampled token and its step scores over a queue, so trace entries are built
+        incrementally from the same processed scores generate_with_trace uses. Closing
+        the generator early stops the underlying generation; last_metrics then covers
+        the tokens produced so far and is marked {"partial": True}.
+
+        Args:
+            prompt (str): The input prompt.
+            max_length (int): Maximum total length (prompt + generation).
+            trace (bool): Build a trace entry for every token. When False, entries are None.
+            top_k (int): Number of alternative tokens to report per trace step.
+            detailed (bool): Add sampled-token probability and entropy to each trace step.
+
+        Yields:
+            Tuple[str, Optional[dict]]: The newly decoded text (may be empty) and the step's trace entry.
+        """
+        start = time.perf_counter()
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        tokenized = time.perf_counter()
+        token_queue: "queue.Queue" = queue.Queue()
+        stop_event = threading.Event()
+        errors: List[BaseException] = []
+        tap = _TokenTap(token_queue, stop_event)
+        repetition_stop = self._repetition_criteria(inputs["input_ids"].shape[1])
+        marks: Dict[str, Optional[float]] = {}
+
+        def run() -> None:
+            try:
+                marks["memory_before"] = self._start_memory(tap)
+                marks["generate_start"] = time.perf_counter()
+                with torch.inference_mode(), self._seeded_generation():
+                    self.model.generate(
+                        **inputs,
+                        max_length=max_length,
+                        **self.generation_kwargs,
+                        output_scores=trace,
+                        return_dict_in_generate=trace,
+                        stopping_criteria=StoppingCriteriaList([tap, *repetition_stop]),
+                    )
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                marks["generate_end"] = time.perf_counter()
+                marks["peak_memory"] = self._peak_memory_mb(tap)
+                token_queue.put(None)
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        generated_ids: List[int] = []
+        emitted = ""
+        detokenize_time = trace_time = 0.0
+        finished = False
+        try:
+            while True:
+                item = token_queue.get()
+                if item is None:
+                    break
+                token_id, scores = item
+                generated_ids.append(token_id)
+                entry = None
+                step_start = time.perf_counter()
+                if scores is not None:
+                    entry = self._build_traces([scores], [[token_id]], top_k, detailed)[0][0]
+                decode_start = time.perf_counter()
+                trace_time += decode_start - step_start
+                # Re-decode the generated ids so multi-token characters come out whole;
+                # hold back text that still ends in an incomplete character.
+                text = self.tokenizer.decode(generated_ids, skip_special_tokens=True).lstrip()
+                detokenize_time += time.perf_counter() - decode_start
+                delta = ""
+                if not text.endswith("\ufffd") and text.startswith(emitted):
+                    delta = text[len(emitted):]
+                    emitted = text
+                yield delta, entry
+            # Flush anything held back, e.g. a response that really ends in U+FFFD.
+            text = self.tokenizer.decode(generated_ids, skip_special_tokens=True).lstrip()
+            if text != emitted and text.startswith(emitted):
+                yield text[len(emitted):], None
+            finished = True
+        finally:
+            stop_event.set()
+            worker.join()
+            # Always replace the previous call's metrics, even when the consumer closed the stream early.
+            self._local.metrics = None if errors else _generation_metrics(
+                start, tokenized, marks.get("generate_start", tokenized), tap, marks["generate_end"],
+                detokenize_time, trace_time, inputs["input_ids"].shape[1], len(generated_ids),
+                marks.get("memory_before"), marks.get("peak_memory")
+            )
+            if self._local.metrics is not None:
+                if finished:
+                    # stop_event is always set once the stream ends, so it says nothing about cancellation here.
+                    self._record_stop(self._local.metrics, repetition_stop, None, generated_ids)
+                else:
+                    self._local.metrics.update(partial=True, stop_reason="cancelled")
+        if errors:
+            raise errors[0]
+
+    def generate_batch_with_trace(self, prompts: Sequence[str], max_length: int, batch_size: int = 8,
+                                  top_k: int = 0, detailed: bool = False) -> List[Tuple[str, list]]:
+        """
+        Generate responses and traces for many prompts with batched model.generate calls.
+
+        Prompts are sorted by token length and split into micro-batches of at most
+        `batch_size`, so each batch carries little left padding. As in
+        generate_with_trace, `max_length` bounds prompt plus generated tokens per prompt,
+        every result is recorded in the trace store and the repetition stop applies to
+        each prompt on its own. Greedy results are served from and stored in the
+        response cache; sampled ones are not, since a sampled row depends on the other
+        prompts in its batch. last_metrics describes the whole call.
+
+        Args:
+            prompts (Sequence[str]): The prompts to generate from.
+            max_length (int): Maximum total length (prompt + generation) for each prompt.
+            batch_size (int): Maximum number of prompts per model.generate call. Defaults to 8.
+            top_k (int): Number of alternative tokens to report per trace step.
+            detailed (bool): Add sampled-token probability and entropy to each trace step.
+
+        Returns:
+            List[Tuple[str, list]]: One (generated_text, trace_info) pair per prompt, in input order.
+
+        Raises:
+            ValueError: If a prompt is at least `max_length` tokens long.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        start = time.perf_counter()
+        prompts = list(prompts)
+        encoded = self.tokenizer(prompts)["input_ids"]
+        for i, ids in enumerate(encoded):
+            if len(ids) >= max_length:
+                raise ValueError(f"Input length of prompt {i} is {len(ids)} tokens, but `max_length` is set to "
+                                 f"{max_length}; no tokens can be generated.")
+        results: List[Optional[Tuple[str, list]]] = [None] * len(prompts)
+        cache_keys: Dict[int, str] = {}
+        if self.response_cache is not None and not self.generation_kwargs.get("do_sample"):
+            for i, prompt in enumerate(prompts):
+                cache_keys[i] = self._cache_key(prompt, max_length, top_k, detailed)
+                cached = self.response_cache.get(cache_keys[i])
+                if cached is not None:
+                    results[i] = (cached["text"], cached["trace"])
+        cached_prompts = sum(result is not None for result in results)
+
+        pending = sorted((i for i, result in enumerate(results) if result is None), key=lambda i: len(encoded[i]))
+        chunks = self._micro_batches([len(encoded[i]) for i in pending], max_length, batch_size)
+        for chunk in chunks:
+            chunk = [pending[position] for position in chunk]
+            batch_results = self._generate_micro_batch([encoded[i] for i in chunk], max_length, top_k, detailed)
+            for i, result in zip(chunk, batch_results):
+                results[i] = result
+                if i in cache_keys:
+                    self.response_cache.put(cache_keys[i], {"text": result[0], "trace": result[1]})
+        for prompt, (text, trace_info) in zip(prompts, results):
+            self._record_trace(prompt, text, trace_info)
+
+        total_time = time.perf_counter() - start
+        generated_tokens = sum(len(trace_info) for _, trace_info in results)
+        self._local.metrics = {
+            "total_time": total_time,
+            "prompts": len(prompts),
+            "batches": len(chunks),
+            "prompt_tokens": sum(len(ids) for ids in encoded),
+            "generated_tokens": generated_tokens,
+            "tokens_per_sec": generated_tokens / total_time if total_time > 0 else None,
+            "cached": bool(prompts) and cached_prompts == len(prompts),
+            "cached_prompts": cached_prompts,
+            "repetition_stops": sum(1 for _, trace_info in results
+                                    if trace_info and trace_info[-1].get("stop_reason") == "repetition"),
+        }
+        return results
+
+    def _position_limit(self) -> Optional[int]:
+        return getattr(self.model.config, "max_position_embeddings", None)
+
+    def _micro_batches(self, lengths: List[int], max_length: int, batch_size: int) -> List[List[int]]:
+        """
+        Split positions of prompts sorted by token length into micro-batches of at most
+        `batch_size`. A batch is padded to its longest prompt and decodes for its
+        shortest prompt's budget, so a batch is also closed before that would run past
+        the model's position limit.
+        """
+        limit = self._position_limit()
+        chunks: List[List[int]] = []
+        for position, length in enumerate(lengths):
+            if chunks and len(chunks[-1]) < batch_size and (
+                    limit is None or length + max_length - lengths[chunks[-1][0]] <= limit):
+                chunks[-1].append(position)
+            else:
+                chunks.append([position])
+        return chunks
+
+    def _generate_micro_batch(self, input_ids: List[List[int]], max_length: int, top_k: int = 0,
+                              detailed: bool = False) -> List[Tuple[str, list]]:
+        """
+        Run one left-padded model.generate call and split the output back into per-prompt results.
+        """
+        pad_id = self.tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = self.tokenizer.eos_token_id if self.tokenizer.eos_token_id is not None else 0
+        eos_ids = self.model.generation_config.eos_token_id
+        if eos_ids is None:
+            eos_ids = []
+        elif isinstance(eos_ids, int):
+            eos_ids = [eos_ids]
+
+        width = max(len(ids) for ids in input_ids)
+        padded = [[pad_id] * (width - len(ids)) + list(ids) for ids in input_ids]
+        mask = [[0] * (width - len(ids)) + [1] * len(ids) for ids in input_ids]
+        detectors = ([RepetitionDetector(**self.repetition_stop) for _ in input_ids]
+                     if self.repetition_stop is not None else [])
+        budgets = [max_length - len(ids) for ids in input_ids]
+        max_new_tokens = max(budgets)
+        if self._position_limit() is not None:
+            max_new_tokens = min(max_new_tokens, self._position_limit() - width)
+        stopping_criteria = StoppingCriteriaList([_BudgetStop(budgets, width)])
+        if detectors:
+            stopping_criteria.append(_RepetitionStop(detectors, width))
+        with torch.inference_mode(), self._seeded_generation():
+            outputs = self.model.generate(
+                input_ids=torch.tensor(padded, device=self.model.device),
+                attention_mask=torch.tensor(mask, device=self.model.device),
+                max_new_tokens=max_new_tokens,
+                pad_token_id=pad_id,
+                **self.generation_kwargs,
+                output_scores=True,
+                return_dict_in_generate=True,
+                stopping_criteria=stopping_criteria
+            )
+
+        generated_ids = []
+        repeated: List[int] = []
+        for row, ids in enumerate(input_ids):
+            # Rows that finished early are padded up to the batch's length; cut them at
+            # their own budget and at the first end-of-sequence token.
+            new_tokens = outputs.sequences[row, width:].tolist()[:max_length - len(ids)]
+            for pos, token_id in enumerate(new_tokens):
+                if token_id in eos_ids:
+                    new_tokens = new_tokens[:pos + 1]
+                    break
+            # A row stopped for repetition is padded afterwards; drop the padding.
+            triggered_at = detectors[row].triggered_at if detectors else None
+            if triggered_at is not None and triggered_at <= len(new_tokens):
+                new_tokens = new_tokens[:triggered_at]
+                repeated.append(row)
+            generated_ids.append(new_tokens)
+        texts = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+        traces = self._build_traces(outputs.scores, generated_ids, top_k, detailed)
+        for row in repeated:
+            if traces[row]:
+                traces[row][-1]["stop_reason"] = "repetition"
+                traces[row][-1]["repetition"] = detectors[row].state()
+        return [(text.strip(), trace_info) for text, trace_info in zip(texts, traces)]
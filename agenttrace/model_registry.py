@@ -0,0 +1,369 @@
+"""
+Module: agenttrace.model_registry
+Process-wide registry that loads each model/tokenizer pair once and shares it
+between every backend, pipeline and dashboard page. Least-recently-used models
+are evicted when the resident weights exceed a configurable RAM budget.
+"""
+
+import gc
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+from agenttrace.logger import setup_logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = setup_logger("AgentTrace.model_registry")
+
+# Default RAM budget for resident models, overridable through the environment.
+DEFAULT_MAX_MEMORY_MB = float(os.environ.get("AGENTTRACE_MODEL_MEMORY_MB", 4096))
+# Directory for pre-converted local snapshots used by the fast-load path (unset = no snapshots).
+DEFAULT_SNAPSHOT_DIR = os.environ.get("AGENTTRACE_SNAPSHOT_DIR")
+
+# Weight modes produced by quantizing a full-precision model after loading.
+QUANTIZED_DTYPES = ("int8",)
+# Accepted dtype names; "auto" keeps the dtype stored in the checkpoint's config.
+SUPPORTED_DTYPES = ("float32", "float16", "bfloat16", "auto") + QUANTIZED_DTYPES
+
+RegistryKey = Tuple[str, str, str]
+
+
+def dtype_name(dtype: Any) -> str:
+    """
+    Normalise a dtype given as None, a string or a torch.dtype to a stable name.
+    """
+    if dtype is None:
+        return "default"
+    return str(dtype).replace("torch.", "")
+
+
+def rss_mb() -> Optional[float]:
+    """
+    Return the current resident set size of this process in MB, read from
+    /proc/self/statm (Linux), or from psutil where it is installed; None otherwise.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Return the peak resident set size of this process in MB, if available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _model_size_bytes(model: torch.nn.Module) -> int:
+    """
+    Estimate the resident size of a model from its parameters and buffers.
+    """
+    size = sum(p.numel() * p.element_size() for p in model.parameters())
+    size += sum(b.numel() * b.element_size() for b in model.buffers())
+    # Dynamically quantized layers keep their packed weights outside parameters().
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and not isinstance(packed, torch.nn.Module):
+            for tensor in module._weight_bias():
+                if tensor is not None:
+                    size += tensor.numel() * tensor.element_size()
+    return size
+
+
+def _quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantize the model's linear layers to int8 with dynamic activation quantization.
+
+    GPT-2 style Conv1D projections are first converted to equivalent nn.Linear layers
+    so they are quantized too. The output projection is usually tied to the input
+    embeddings and stays in full precision, so it is not duplicated.
+    """
+    from torch.ao.quantization import quantize_dynamic
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.nf)
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+                linear.bias = child.bias
+                setattr(module, child_name, linear)
+    output_embeddings = model.get_output_embeddings()
+    names = {name for name, module in model.named_modules()
+             if isinstance(module, torch.nn.Linear) and module is not output_embeddings}
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favour of torchao, which is not a dependency.
+        warnings.simplefilter("ignore", DeprecationWarning)
+        warnings.filterwarnings("ignore", message=".*quantized tensor creation functions.*")
+        return quantize_dynamic(model, names, dtype=torch.qint8, inplace=True)
+
+
+class ModelRegistry:
+    """
+    Thread-safe LRU cache of loaded causal language models and their tokenizers,
+    keyed by (model name, dtype, device).
+
+    Besides torch dtypes (e.g. "bfloat16" to halve the memory of fp32 checkpoints),
+    dtype may be "int8": the model is loaded in full precision and its linear layers
+    are dynamically quantized to int8 for CPU inference. "auto" uses the dtype the
+    checkpoint was saved in. Any other dtype raises a ValueError (see SUPPORTED_DTYPES).
+
+    Eviction drops the registry's reference only. Backends and pipelines keep the
+    model they were built with, so an evicted model's memory is released once the
+    last of them is gone; a later get() loads a fresh copy.
+    """
+    def __init__(self, max_memory_mb: Optional[float] = None, fast_load: bool = True,
+                 snapshot_dir: Optional[str] = None) -> None:
+        self.max_memory_mb = DEFAULT_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+        self.fast_load = fast_load
+        self.snapshot_dir = DEFAULT_SNAPSHOT_DIR if snapshot_dir is None else snapshot_dir
+        self._entries: "OrderedDict[RegistryKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[RegistryKey, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_load_time = 0.0
+        self.load_stats: Dict[str, Dict[str, Any]] = {}
+
+    def _make_key(self, model_name: str, dtype: Any, device: str) -> RegistryKey:
+        if dtype is not None and dtype_name(dtype) not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype_name(dtype)}'; expected one of {', '.join(SUPPORTED_DTYPES)}.")
+        return (model_name, dtype_name(dtype), str(device))
+
+    def _snapshot_path(self, model_name: str, dtype: Any) -> Optional[str]:
+        # Quantized modules cannot be saved as safetensors; they are re-quantized on load.
+        if not self.fast_load or not self.snapshot_dir or dtype_name(dtype) in QUANTIZED_DTYPES:
+            return None
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name).strip("-")
+        return os.path.join(self.snapshot_dir, f"{safe_name}__{dtype_name(dtype)}")
+
+    def _load(self, model_name: str, dtype: Any, device: str) -> Tuple[Any, Any, Optional[str]]:
+        """
+        Load a model and tokenizer from the Hugging Face hub or a local path.
+
+        In fast-load mode safetensors weights are memory-mapped and materialised
+        directly in their final dtype (low_cpu_mem_usage), avoiding a second full copy
+        of the weights during load. With a snapshot directory configured, the first
+        load also writes a local safetensors snapshot already converted to the
+        requested dtype, and later loads (e.g. after a restart) read from it.
+
+        Returns the model, the tokenizer and the snapshot path it was read from, if any.
+        """
+        quantize = dtype_name(dtype) in QUANTIZED_DTYPES
+        if quantize and str(device) != "cpu":
+            raise ValueError(f"dtype '{dtype_name(dtype)}' is only supported on CPU.")
+        load_kwargs: Dict[str, Any] = {}
+        if dtype_name(dtype) == "auto":
+            load_kwargs["dtype"] = "auto"
+        elif dtype is not None and not quantize:
+            load_kwargs["dtype"] = getattr(torch, dtype_name(dtype))
+        if self.fast_load:
+            load_kwargs["low_cpu_mem_usage"] = True
+
+        snapshot = self._snapshot_path(model_name, dtype)
+        source = model_name
+        if snapshot is not None and os.path.isfile(os.path.join(snapshot, "config.json")):
+            source = snapshot
+        tokenizer = AutoTokenizer.from_pretrained(source)
+        model = AutoModelForCausalLM.from_pretrained(source, **load_kwargs)
+        if snapshot is not None and source != snapshot:
+            self._write_snapshot(model, tokenizer, snapshot)
+        if quantize:
+            model = _quantize_dynamic_int8(model)
+        if str(device) != "cpu":
+            model.to(device)
+        model.eval()
+        return model, tokenizer, source if source == snapshot else None
+
+    def _write_snapshot(self, model: Any, tokenizer: Any, snapshot: str) -> None:
+        """
+        Save a safetensors snapshot, writing to a temporary directory first so a
+        crash never leaves a half-written snapshot behind.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".snapshot-", dir=self.snapshot_dir)
+        try:
+            model.save_pretrained(tmp_dir, safe_serialization=True)
+            tokenizer.save_pretrained(tmp_dir)
+            os.replace(tmp_dir, snapshot)
+            logger.info(f"Wrote model snapshot to '{snapshot}'.")
+        except OSError as e:
+            logger.warning(f"Could not write model snapshot to '{snapshot}': {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get(self, model_name: str, dtype: Any = None, device: str = "cpu") -> Tuple[Any, Any]:
+        """
+        Return the shared (model, tokenizer) pair, loading it on first use.
+
+        Args:
+            model_name (str): The identifier of the model (hub id or local path).
+            dtype (Any, optional): Weight dtype as a string or torch.dtype. Defaults to the checkpoint's dtype.
+            device (str): Device the model should live on. Defaults to "cpu".
+
+        Returns:
+            Tuple[Any, Any]: The loaded model and tokenizer.
+        """
+        key = self._make_key(model_name, dtype, device)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["model"], entry["tokenizer"]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait and then hit the cache.
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["model"], entry["tokenizer"]
+                self.misses += 1
+
+            rss_before, peak_before = rss_mb(), peak_rss_mb()
+            start = time.perf_counter()
+            model, tokenizer, loaded_snapshot = self._load(model_name, dtype, device)
+            load_time = time.perf_counter() - start
+            rss_after, peak_after = rss_mb(), peak_rss_mb()
+            size_bytes = _model_size_bytes(model)
+
+            with self._lock:
+                self._entries[key] = {
+                    "model": model,
+                    "tokenizer": tokenizer,
+                    "size_bytes": size_bytes,
+                    "load_time": load_time,
+                }
+                self.total_load_time += load_time
+                self.load_stats["/".join(key)] = {
+                    "load_time": load_time,
+                    "size_mb": size_bytes / 2**20,
+                    "rss_delta_mb": rss_after - rss_before if rss_before is not None else None,
+                    "peak_rss_mb": peak_after,
+                    "peak_rss_increase_mb": peak_after - peak_before if peak_before is not None else None,
+                    "fast_load": self.fast_load,
+                    "snapshot": loaded_snapshot,
+                }
+                self._evict(keep=key)
+        logger.info(f"Loaded model '{model_name}' ({key[1]}, {key[2]}) in {load_time:.2f}s, "
+                    f"{size_bytes / 2**20:.1f} MB resident.")
+        return model, tokenizer
+
+    def pipeline(self, model_name: str, dtype: Any = None, device: str = "cpu", **pipeline_kwargs: Any) -> Any:
+        """
+        Build a text-generation pipeline around the shared model and tokenizer.
+
+        Constructing the pipeline object is cheap; the weights come from the registry.
+        """
+        model, tokenizer = self.get(model_name, dtype=dtype, device=device)
+        return pipeline("text-generation", model=model, tokenizer=tokenizer, **pipeline_kwargs)
+
+    def memory_bytes(self) -> int:
+        """
+        Return the estimated size of all resident models in bytes.
+        """
+        with self._lock:
+            return sum(entry["size_bytes"] for entry in self._entries.values())
+
+    def _evict(self, keep: Optional[RegistryKey] = None) -> None:
+        """
+        Drop least-recently-used models until the budget is respected.
+        The most recently requested model is always kept, even if it alone exceeds the budget.
+        Models still referenced elsewhere (e.g. by a live backend) stay in memory.
+        """
+        budget = self.max_memory_mb * 2**20
+        evicted: Dict[RegistryKey, "weakref.ref"] = {}
+        while len(self._entries) > 1 and self.memory_bytes() > budget:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            entry = self._entries.pop(key)
+            self.evictions += 1
+            evicted[key] = weakref.ref(entry["model"])
+            logger.info(f"Evicted model '{key[0]}' ({key[1]}, {key[2]}), "
+                        f"{entry['size_bytes'] / 2**20:.1f} MB.")
+            del entry
+        if evicted:
+            gc.collect()
+            for key, model_ref in evicted.items():
+                if model_ref() is not None:
+                    logger.warning(f"Evicted model '{key[0]}' ({key[1]}, {key[2]}) is still in use; "
+                                   f"its memory is freed once the backends holding it are dropped.")
+
+    def set_max_memory_mb(self, max_memory_mb: float) -> None:
+        """
+        Change the RAM budget and evict immediately if it is now exceeded.
+        """
+        with self._lock:
+            self.max_memory_mb = max_memory_mb
+            self._evict()
+
+    def clear(self) -> None:
+        """
+        Drop every resident model.
+        """
+        with self._lock:
+            self._entries.clear()
+        gc.collect()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report cache hits, misses, evictions, load times and resident models.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "load_stats": {key: dict(stats) for key, stats in self.load_stats.items()},
+                "total_load_time": self.total_load_time,
+                "resident_models": ["/".join(key) for key in self._entries],
+                "resident_mb": self.memory_bytes() / 2**20,
+                "max_memory_mb": self.max_memory_mb,
+            }
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """
+    Return the process-wide model registry, creating it on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -1,19 +1,32 @@
 # agenttrace/orchestrator.py
-import torch
-
-from langchain.prompts import PromptTemplate
-from langchain_huggingface import HuggingFacePipeline
-from transformers import pipeline
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableSequence
+from agenttrace.response_cache import ResponseCache
+from typing import TYPE_CHECKING, Any, Dict, Optional
 import json
 import logging
+import threading
+
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableSequence
 
 logger = logging.getLogger(__name__)
 
+# Tokens generated and saved by the calling thread's latest constrained generation.
+_local = threading.local()
+
+def last_constrained_stats() -> Optional[Dict[str, Any]]:
+    """
+    Returns the stats of the current thread's latest constrained chain generation
+    (see json_constraint.JSONConstraint.stats), or None if there was none.
+    """
+    return getattr(_local, "stats", None)
+
 def create_agent_chain(model_name: str, max_length: int, 
                        task_description: str, 
-                       custom_template: str = None) -> RunnableSequence:
+                       custom_template: str = None,
+                       seed: Optional[int] = None,
+                       response_cache: Optional[ResponseCache] = None,
+                       constrained_json: bool = False,
+                       schema: Optional[Dict[str, Any]] = None) -> "RunnableSequence":
     """
     Creates a RunnableSequence that functions as an agent workflow for generating a detailed plan.
     
@@ -22,6 +35,14 @@ def create_agent_chain(model_name: str, max_length: int,
         max_length (int): The maximum output length for the generation.
         task_description (str): The description of the task for which to generate a plan.
         custom_template (str, optional): An editable prompt template containing the '{task}' placeholder.
+        seed (int, optional): Seed applied before each generation for reproducible output.
+        response_cache (ResponseCache, optional): Cache for seeded generations, so re-running the
+            same prompt (e.g. in regression suites or run_workflow) skips the model.
+        constrained_json (bool): Mask the model's logits to JSON matching `schema` and stop as
+            soon as the top-level object closes, so the output always parses unless the
+            token budget runs out first. Tokens saved are reported by last_constrained_stats().
+        schema (Dict[str, Any], optional): JSON-Schema subset for constrained_json (see
+            agenttrace.json_constraint). Defaults to the plan schema of the default template.
         
     Returns:
         RunnableSequence: A configured sequence ready to run the agent workflow.
@@ -35,31 +56,71 @@ def create_agent_chain(model_name: str, max_length: int,
         "Task: {task}\n\n"
         "Ensure that your output is strictly in JSON format."
     )
+    # LangChain, torch and transformers are only imported once a chain is actually built.
+    from langchain.prompts import PromptTemplate
+    from langchain_huggingface import HuggingFacePipeline
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda
+    from agenttrace.llm_backend import seeded_generation
+    from agenttrace.model_registry import get_registry
+
     template_str = custom_template if custom_template else default_template
     prompt = PromptTemplate(template=template_str, input_variables=["task"])
     
-    # Create a HuggingFace text-generation pipeline with the specified model and parameters.
-    hf_pipeline = pipeline(
-        "text-generation",
-        model=model_name,
-        tokenizer=model_name,
+    # Create a HuggingFace text-generation pipeline around the shared model and tokenizer.
+    sampling_params = {"do_sample": True, "temperature": 0.9, "top_p": 0.95, "top_k": 50}
+    hf_pipeline = get_registry().pipeline(
+        model_name,
         max_new_tokens=max_length,
-        do_sample=True,
-        temperature=0.9,
-        top_p=0.95,
-        top_k=50,
+        **sampling_params,
         return_full_text=False
     )
     
     # Wrap the pipeline using LangChain's HuggingFacePipeline wrapper.
     llm = HuggingFacePipeline(pipeline=hf_pipeline)
-    
+    json_schema = None
+    if constrained_json:
+        from agenttrace.json_constraint import PLAN_SCHEMA
+        json_schema = schema if schema is not None else PLAN_SCHEMA
+
+    def generate_constrained(prompt_text: str) -> str:
+        from transformers import LogitsProcessorList, StoppingCriteriaList
+        from agenttrace.json_constraint import JSONConstraint
+        # Parser state is per generation, so every call gets a fresh constraint.
+        constraint = JSONConstraint(hf_pipeline.tokenizer, json_schema, max_new_tokens=max_length)
+        outputs = hf_pipeline(prompt_text, logits_processor=LogitsProcessorList([constraint.logits_processor()]),
+                              stopping_criteria=StoppingCriteriaList([constraint.stopping_criteria()]))
+        _local.stats = constraint.stats()
+        logger.info(f"Constrained JSON generation: {_local.stats['generated_tokens']} tokens, "
+                    f"{_local.stats['tokens_saved']} saved, complete: {_local.stats['completed']}.")
+        return outputs[0]["generated_text"]
+
+    def generate(prompt_value) -> str:
+        prompt_text = prompt_value.to_string()
+        cache_key = None
+        if response_cache is not None and seed is not None:
+            params = {**sampling_params, "constrained_json": constrained_json, "schema": json_schema}
+            cache_key = response_cache.make_key(model_name, prompt_text, max_length, params, seed)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached["text"]
+        # Agents may run concurrently (run_workflow), so the seed and the sampling that
+        # follows hold torch's global RNG together.
+        with seeded_generation(seed):
+            if constrained_json:
+                text = generate_constrained(prompt_text)
+            else:
+                text = llm.invoke(prompt_text)
+        if cache_key is not None:
+            response_cache.put(cache_key, {"text": text})
+        return text
+
     # Create the RunnableSequence using the pipe operator.
-    chain = prompt | llm | StrOutputParser()
+    chain = prompt | RunnableLambda(generate) | StrOutputParser()
     logger.info(f"Created agent chain with model '{model_name}' and custom template.")
     return chain
 
-def run_agent_chain(chain: RunnableSequence, task_description: str) -> dict:
+def run_agent_chain(chain: "RunnableSequence", task_description: str) -> dict:
     """
     Executes the given RunnableSequence for the provided task description and parses the output as JSON.
     
@@ -1,13 +1,36 @@
 """
 Module: agenttrace.prompt_optimizer
 Provides a prompt optimization assistant that analyzes a conversation turn
-and suggests improvements based on output analysis.
+and suggests improvements based on output analysis, and an automated search
+over prompt variants that evaluates them in batches and prunes losing
+candidates early with successive halving.
 """
 
-from typing import Dict
-from agenttrace.analyzer import analyze_response
+import itertools
+import math
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+from agenttrace.analyzer import analyze_response, analyze_responses
+from agenttrace.logger import setup_logger
 
-def optimize_prompt(prompt: str, response: str) -> Dict[str, str]:
+if TYPE_CHECKING:
+    from agenttrace.llm_backend import LLMBackend
+
+logger = setup_logger("AgentTrace.prompt_optimizer")
+
+# A scorer rates one (prompt, response, analysis) evaluation; higher is better.
+Scorer = Callable[[str, str, Dict[str, float]], float]
+
+DEFAULT_TEMPLATES = ("{prompt}", "Question: {prompt}\nAnswer:", "Task: {prompt}\nResponse:")
+DEFAULT_SUFFIXES = ("", " Answer in your own words.", " Explain step by step.")
+DEFAULT_CONSTRAINTS = ("", " Do not repeat yourself.", " Keep the answer under three sentences.")
+
+DEFAULT_SCORERS: Dict[str, Scorer] = {
+    "echo": lambda prompt, response, analysis: 1.0 - analysis["prompt_similarity"],
+    "repetition": lambda prompt, response, analysis: 1.0 - analysis["repetition_score"],
+}
+
+def optimize_prompt(prompt: str, response: str, analysis: Optional[Dict[str, float]] = None) -> Dict[str, str]:
     """
     Analyze the prompt and its corresponding response to suggest improvements.
 
@@ -20,11 +43,14 @@ def optimize_prompt(prompt: str, response: str) -> Dict[str, str]:
     Args:
         prompt (str): The original prompt.
         response (str): The generated response.
+        analysis (Dict[str, float], optional): A precomputed analysis of the pair, e.g. from
+            Conversation.get_analysis. Computed here if not given.
 
     Returns:
         Dict[str, str]: A dictionary containing a suggestion.
     """
-    analysis = analyze_response(prompt, response)
+    if analysis is None:
+        analysis = analyze_response(prompt, response)
     suggestion = "Your prompt appears to be working well."
     
     if analysis["prompt_similarity"] > 0.7:
@@ -36,3 +62,132 @@ def optimize_prompt(prompt: str, response: str) -> Dict[str, str]:
                       "constraints or ask for more variety in the response.")
 
     return {"suggestion": suggestion}
+
+
+def build_prompt_variants(prompt: str, templates: Sequence[str] = DEFAULT_TEMPLATES,
+                          suffixes: Sequence[str] = DEFAULT_SUFFIXES,
+                          constraints: Sequence[str] = DEFAULT_CONSTRAINTS) -> List[str]:
+    """
+    Build candidate prompts from every combination of template, instruction suffix and constraint clause.
+
+    Templates contain a "{prompt}" placeholder. Duplicates are dropped and the order
+    is deterministic, starting with the unmodified prompt when "{prompt}" and the
+    empty suffix and constraint are included.
+
+    Args:
+        prompt (str): The prompt to vary.
+        templates (Sequence[str]): Templates wrapping the prompt.
+        suffixes (Sequence[str]): Instruction suffixes appended to the prompt.
+        constraints (Sequence[str]): Constraint clauses appended after the suffix.
+
+    Returns:
+        List[str]: The distinct candidate prompts.
+    """
+    variants: Dict[str, None] = {}
+    for template, suffix, constraint in itertools.product(templates, suffixes, constraints):
+        variants[template.format(prompt=f"{prompt}{suffix}{constraint}")] = None
+    return list(variants)
+
+
+def search_prompts(backend: "LLMBackend", candidates: Sequence[str], max_length: int,
+                   seeds: Sequence[int] = (0, 1, 2, 3), eta: int = 2,
+                   scorers: Optional[Dict[str, Scorer]] = None, weights: Optional[Dict[str, float]] = None,
+                   batch_size: int = 8) -> Dict[str, Any]:
+    """
+    Rank candidate prompts by their mean score over several seeds, with successive halving.
+
+    Round r evaluates every surviving candidate on the seeds it has not been run with
+    among the first eta**r seeds (one batched backend call per seed), then keeps the
+    best 1/eta of them. Rounds continue until one candidate is left or all seeds are
+    used, so weak candidates cost one generation instead of len(seeds).
+
+    Each evaluation is scored by every scorer (by default "echo" and "repetition",
+    both from analyze_response and both in [0, 1]); a candidate's score is the
+    weighted sum of its mean scorer values. Backends with a `seed` attribute (e.g.
+    HuggingFaceBackend) are reseeded per batch; the attribute is restored afterwards.
+
+    Args:
+        backend (LLMBackend): Backend generating the responses.
+        candidates (Sequence[str]): Prompts to compare, e.g. from build_prompt_variants.
+        max_length (int): Maximum output length passed to the backend.
+        seeds (Sequence[int]): Seeds available for evaluation. Defaults to (0, 1, 2, 3).
+        eta (int): Reduction factor per round. Defaults to 2.
+        scorers (Dict[str, Scorer], optional): Extra or replacement scorers, added to the defaults.
+        weights (Dict[str, float], optional): Weight per scorer name. Defaults to 1.0 each.
+        batch_size (int): Batch size for generate_batch. Defaults to 8.
+
+    Returns:
+        Dict[str, Any]: "ranking", a list of candidates best first with their "prompt",
+        "score", per-scorer "scores", "evaluations" and the "round" they were
+        eliminated in (None for the finalists), and "cost", with the number of
+        generations, rounds, elapsed seconds and the generations an exhaustive
+        evaluation would have needed.
+    """
+    if eta < 2:
+        raise ValueError("eta must be at least 2.")
+    if not candidates or not seeds:
+        raise ValueError("search_prompts needs at least one candidate and one seed.")
+    all_scorers = {**DEFAULT_SCORERS, **(scorers or {})}
+    weights = weights or {}
+    candidates = list(dict.fromkeys(candidates))
+    totals = {prompt: {name: 0.0 for name in all_scorers} for prompt in candidates}
+    evaluations = {prompt: 0 for prompt in candidates}
+    eliminated: Dict[str, int] = {}
+
+    def score(prompt: str) -> float:
+        return sum(weights.get(name, 1.0) * total / evaluations[prompt]
+                   for name, total in totals[prompt].items()) if evaluations[prompt] else float("-inf")
+
+    start = time.perf_counter()
+    generations = 0
+    survivors = candidates
+    used_seeds = 0
+    round_index = 0
+    original_seed = getattr(backend, "seed", None)
+    try:
+        while True:
+            round_seeds = seeds[used_seeds:min(len(seeds), eta ** round_index)]
+            for seed in round_seeds:
+                if hasattr(backend, "seed"):
+                    backend.seed = seed
+                responses = backend.generate_batch(survivors, max_length, batch_size)
+                turns = [{"prompt": prompt, "response": response} for prompt, response in zip(survivors, responses)]
+                for turn, analysis in zip(turns, analyze_responses(turns)):
+                    for name, scorer in all_scorers.items():
+                        totals[turn["prompt"]][name] += scorer(turn["prompt"], turn["response"], analysis)
+                    evaluations[turn["prompt"]] += 1
+                generations += len(survivors)
+            used_seeds += len(round_seeds)
+            logger.info(f"Prompt search round {round_index}: {len(survivors)} candidates, {used_seeds} seeds.")
+            if used_seeds == len(seeds):
+                break
+            survivors = sorted(survivors, key=score, reverse=True)
+            keep = max(1, math.ceil(len(survivors) / eta))
+            for prompt in survivors[keep:]:
+                eliminated[prompt] = round_index
+            survivors = survivors[:keep]
+            if len(survivors) == 1:
+                break
+            round_index += 1
+    finally:
+        if hasattr(backend, "seed"):
+            backend.seed = original_seed
+
+    # Finalists first, then candidates by how long they survived, each group by score.
+    ranked = sorted(candidates, key=lambda prompt: (-eliminated.get(prompt, round_index + 1), -score(prompt)))
+    ranking = [{
+        "prompt": prompt,
+        "score": score(prompt),
+        "scores": {name: total / evaluations[prompt] for name, total in totals[prompt].items()},
+        "evaluations": evaluations[prompt],
+        "round": eliminated.get(prompt),
+    } for prompt in ranked]
+    return {
+        "ranking": ranking,
+        "cost": {
+            "generations": generations,
+            "rounds": round_index + 1,
+            "time": time.perf_counter() - start,
+            "exhaustive_generations": len(candidates) * len(seeds),
+        },
+    }
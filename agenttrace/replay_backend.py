@@ -0,0 +1,207 @@
+"""
+Module: agenttrace.replay_backend
+LLM backend that replays recorded responses instead of running a model, with
+configurable synthetic latency. Used to load-test everything around the model
+(conversations, analysis, export, workflows) reproducibly and without inference.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from agenttrace.backend_base import LLMBackend
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.replay_backend")
+
+# Replayed text is split into word-sized pseudo-tokens for pacing and synthetic traces.
+_PSEUDO_TOKEN = re.compile(r"\s*\S+")
+
+
+class LatencyProfile:
+    """
+    Synthetic timing for replayed generations: a fixed prefill delay plus one delay
+    per generated token, optionally with multiplicative jitter.
+
+    Args:
+        prefill_time (float): Seconds before the first token. Defaults to 0.
+        tokens_per_sec (float, optional): Decode rate. Defaults to no decode delay.
+        jitter (float): Each delay is scaled by a random factor in [1 - jitter, 1 + jitter]. Defaults to 0.
+        seed (int, optional): Seed for the jitter, for reproducible runs.
+    """
+    def __init__(self, prefill_time: float = 0.0, tokens_per_sec: Optional[float] = None,
+                 jitter: float = 0.0, seed: Optional[int] = None) -> None:
+        if tokens_per_sec is not None and tokens_per_sec <= 0:
+            raise ValueError("tokens_per_sec must be positive.")
+        self.prefill_time = prefill_time
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _scale(self, delay: float) -> float:
+        if not self.jitter or delay <= 0:
+            return delay
+        with self._lock:
+            return delay * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def prefill_delay(self) -> float:
+        return self._scale(self.prefill_time)
+
+    def token_delay(self) -> float:
+        return self._scale(1.0 / self.tokens_per_sec) if self.tokens_per_sec else 0.0
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Replays recorded (prompt, response[, trace]) records.
+
+    A prompt that was recorded is answered with its recorded responses in turn
+    (cycling if it is asked more often than it was recorded). Unknown prompts get
+    the recorded responses in recording order, or raise KeyError with `strict`.
+    Recorded traces are returned as-is; otherwise a trace with one entry per
+    word-sized pseudo-token and confidence 1.0 is synthesised.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): Records with "prompt" and "response" and optionally "trace".
+        latency (LatencyProfile, optional): Synthetic timing. Defaults to no delay.
+        strict (bool): Raise KeyError for prompts that were not recorded. Defaults to False.
+    """
+    def __init__(self, records: Iterable[Dict[str, Any]], latency: Optional[LatencyProfile] = None,
+                 strict: bool = False) -> None:
+        self.records: List[Dict[str, Any]] = [
+            {"prompt": record["prompt"], "response": record["response"], "trace": record.get("trace")}
+            for record in records
+        ]
+        if not self.records:
+            raise ValueError("ReplayBackend needs at least one recorded response.")
+        self.latency = latency or LatencyProfile()
+        self.strict = strict
+        self.model_id = "replay"
+        self._by_prompt: Dict[str, List[int]] = defaultdict(list)
+        for index, record in enumerate(self.records):
+            self._by_prompt[record["prompt"]].append(index)
+        self._prompt_cursor: Dict[str, int] = defaultdict(int)
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_session(cls, session_data: Dict[str, Any], **kwargs: Any) -> "ReplayBackend":
+        """
+        Build a backend from exporter.export_session output.
+        """
+        return cls(session_data["turns"], **kwargs)
+
+    @classmethod
+    def from_file(cls, file_path: str, **kwargs: Any) -> "ReplayBackend":
+        """
+        Build a backend from a JSON (export_session_to_json) or JSON Lines (JSONLSessionExporter) export.
+        """
+        if file_path.endswith(".jsonl"):
+            with open(file_path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            return cls([record for record in records if record.get("type") == "turn"], **kwargs)
+        with open(file_path, "r", encoding="utf-8") as f:
+            return cls.from_session(json.load(f), **kwargs)
+
+    @classmethod
+    def from_trace_store(cls, trace_store: Any, **query: Any) -> "ReplayBackend":
+        """
+        Build a backend from generations recorded in a TraceStore, including their traces.
+        Keyword arguments other than `latency` and `strict` are passed to query_generations.
+        """
+        kwargs = {key: query.pop(key) for key in ("latency", "strict") if key in query}
+        return cls(reversed(trace_store.query_generations(**query)), **kwargs)
+
+    @property
+    def last_metrics(self) -> Optional[Dict[str, Any]]:
+        """
+        Simulated timings and token counts of the current thread's latest generation.
+        """
+        return getattr(self._local, "metrics", None)
+
+    def _next_record(self, prompt: str) -> Dict[str, Any]:
+        with self._lock:
+            indices = self._by_prompt.get(prompt)
+            if indices:
+                position = self._prompt_cursor[prompt]
+                self._prompt_cursor[prompt] = position + 1
+                return self.records[indices[position % len(indices)]]
+            if self.strict:
+                raise KeyError(f"No recorded response for prompt: {prompt[:50]}")
+            record = self.records[self._cursor % len(self.records)]
+            self._cursor += 1
+            return record
+
+    @staticmethod
+    def _split(response: str) -> List[str]:
+        return _PSEUDO_TOKEN.findall(response)
+
+    def _trace_for(self, record: Dict[str, Any], pieces: List[str]) -> list:
+        if record["trace"] is not None:
+            return record["trace"]
+        return [{"token": piece.strip(), "confidence": 1.0} for piece in pieces]
+
+    def generate(self, prompt: str, max_length: int) -> str:
+        output, _ = self.generate_with_trace(prompt, max_length)
+        return output
+
+    def generate_with_trace(self, prompt: str, max_length: int) -> Tuple[str, list]:
+        """
+        Return the next recorded response for `prompt`, after the profile's simulated
+        prefill and decode time. `max_length` is ignored; responses are replayed in full.
+        """
+        start = time.perf_counter()
+        record = self._next_record(prompt)
+        pieces = self._split(record["response"])
+        trace_info = self._trace_for(record, pieces)
+        num_tokens = len(trace_info) if record["trace"] is not None else len(pieces)
+        prefill = self.latency.prefill_delay()
+        decode = sum(self.latency.token_delay() for _ in range(num_tokens))
+        time.sleep(prefill + decode)
+        self._set_metrics(start, prefill, decode, prompt, num_tokens)
+        return record["response"], trace_info
+
+    def generate_stream(self, prompt: str, max_length: int,
+                        trace: bool = True) -> Iterator[Tuple[str, Optional[dict]]]:
+        """
+        Yield the recorded response one pseudo-token at a time, paced by the latency profile.
+        If the stream is closed early, last_metrics covers the pieces yielded so far and is
+        marked {"partial": True}.
+        """
+        start = time.perf_counter()
+        record = self._next_record(prompt)
+        pieces = self._split(record["response"])
+        trace_info = self._trace_for(record, pieces) if trace else []
+        prefill = self.latency.prefill_delay()
+        time.sleep(prefill)
+        decode_start = time.perf_counter()
+        emitted = 0
+        try:
+            for step, piece in enumerate(pieces):
+                time.sleep(self.latency.token_delay())
+                entry = trace_info[step] if step < len(trace_info) else None
+                emitted += 1
+                yield (piece.lstrip() if step == 0 else piece), entry
+        finally:
+            # A stream closed early still replaces the previous call's metrics, marked partial.
+            self._set_metrics(start, prefill, time.perf_counter() - decode_start, prompt, emitted)
+            if emitted < len(pieces):
+                self._local.metrics["partial"] = True
+
+    def _set_metrics(self, start: float, prefill: float, decode: float, prompt: str, num_tokens: int) -> None:
+        self._local.metrics = {
+            "prefill_time": prefill,
+            "decode_time": decode,
+            "total_time": time.perf_counter() - start,
+            "prompt_tokens": len(self._split(prompt)),
+            "generated_tokens": num_tokens,
+            "tokens_per_sec": num_tokens / (prefill + decode) if prefill + decode > 0 else None,
+            "cached": False,
+            "replayed": True,
+        }
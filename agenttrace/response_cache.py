@@ -0,0 +1,138 @@
+"""
+Module: agenttrace.response_cache
+Disk-backed response cache for deterministic generations. Entries are keyed by
+model id, exact prompt, max_length, sampling parameters and seed, stored in
+SQLite and evicted least-recently-used once the size bounds are exceeded.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.response_cache")
+
+
+def is_deterministic(generation_kwargs: Dict[str, Any], seed: Optional[int]) -> bool:
+    """
+    A generation can be served from the cache if it is seeded or does not sample.
+    """
+    return seed is not None or not generation_kwargs.get("do_sample", False)
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU cache of generated responses.
+
+    Args:
+        path (str): SQLite database file. Defaults to an in-memory database.
+        max_entries (int): Maximum number of cached responses. Defaults to 10000.
+        max_bytes (int, optional): Maximum total size of cached values in bytes. Defaults to no limit.
+    """
+    def __init__(self, path: str = ":memory:", max_entries: int = 10000, max_bytes: Optional[int] = None) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, max_length: int, params: Dict[str, Any],
+                 seed: Optional[int]) -> str:
+        """
+        Build a stable cache key from everything that determines the generated output.
+        """
+        payload = json.dumps(
+            {"model": model_id, "prompt": prompt, "max_length": max_length, "params": params, "seed": seed},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value for `key`, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Store a JSON-serialisable value and evict least-recently-used entries if needed.
+        """
+        data = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report hits, misses, hit rate and the current size of the cache.
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self) -> None:
+        """
+        Remove every cached response.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
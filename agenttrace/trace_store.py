@@ -0,0 +1,303 @@
+"""
+Module: agenttrace.trace_store
+Persistent, indexed store of conversation turns and token-level traces across
+sessions. Backed by SQLite so sessions can be queried by model, time range and
+analysis metrics without loading every export.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.trace_store")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "session_id TEXT PRIMARY KEY, model_name TEXT, max_length INTEGER, created_at REAL NOT NULL, source TEXT)",
+    "CREATE TABLE IF NOT EXISTS turns ("
+    "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, turn_index INTEGER NOT NULL, model_name TEXT, "
+    "created_at REAL NOT NULL, prompt TEXT NOT NULL, response TEXT NOT NULL, prompt_similarity REAL, "
+    "echo_flag REAL, repetition_score REAL, metrics TEXT)",
+    "CREATE TABLE IF NOT EXISTS generations ("
+    "id INTEGER PRIMARY KEY, session_id TEXT, model_id TEXT NOT NULL, created_at REAL NOT NULL, "
+    "prompt TEXT NOT NULL, response TEXT NOT NULL, trace TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_model ON sessions (model_name, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, turn_index)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_model_time ON turns (model_name, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_time ON turns (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_echo ON turns (echo_flag, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_similarity ON turns (prompt_similarity)",
+    "CREATE INDEX IF NOT EXISTS idx_turns_repetition ON turns (repetition_score)",
+    "CREATE INDEX IF NOT EXISTS idx_generations_model_time ON generations (model_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_generations_session ON generations (session_id)",
+)
+
+_TURN_COLUMNS = ("session_id", "turn_index", "model_name", "created_at", "prompt", "response",
+                 "prompt_similarity", "echo_flag", "repetition_score", "metrics")
+
+
+class TraceStore:
+    """
+    SQLite-backed store of sessions, turns and token-level traces.
+
+    Every write commits immediately unless it happens inside `batch()`, which
+    groups all writes into one transaction; bulk imports use batches internally.
+
+    Args:
+        path (str): SQLite database file. Defaults to an in-memory database.
+    """
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    @contextmanager
+    def batch(self) -> Iterator["TraceStore"]:
+        """
+        Group every write made inside the block into a single transaction.
+        """
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._conn.rollback()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._conn.commit()
+
+    def _commit(self) -> None:
+        if self._batch_depth == 0:
+            self._conn.commit()
+
+    def start_session(self, model_name: str, max_length: Optional[int] = None,
+                      session_id: Optional[str] = None, created_at: Optional[float] = None,
+                      source: Optional[str] = None) -> str:
+        """
+        Register a session and return its id (a new UUID unless one is given).
+        """
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, model_name, max_length, created_at, source) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (session_id, model_name, max_length, time.time() if created_at is None else created_at, source),
+            )
+            self._commit()
+        return session_id
+
+    def add_turns(self, session_id: str, model_name: str, turns: Iterable[Dict[str, Any]],
+                  start_index: int = 0) -> int:
+        """
+        Insert turns in one statement.
+
+        Args:
+            session_id (str): The session the turns belong to.
+            model_name (str): Model that generated the turns.
+            turns (Iterable[Dict[str, Any]]): Turns with "prompt" and "response" and optionally
+                "analysis", "metrics" and "created_at".
+            start_index (int): Index of the first turn within the session.
+
+        Returns:
+            int: The number of turns inserted.
+        """
+        now = time.time()
+        rows = []
+        for offset, turn in enumerate(turns):
+            analysis = turn.get("analysis") or {}
+            metrics = turn.get("metrics")
+            rows.append((
+                session_id, start_index + offset, model_name, turn.get("created_at") or now,
+                turn["prompt"], turn["response"], analysis.get("prompt_similarity"),
+                analysis.get("echo_flag"), analysis.get("repetition_score"),
+                json.dumps(metrics) if metrics is not None else None,
+            ))
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO turns ({', '.join(_TURN_COLUMNS)}) VALUES ({', '.join('?' * len(_TURN_COLUMNS))})",
+                rows,
+            )
+            self._commit()
+        return len(rows)
+
+    def add_turn(self, session_id: str, model_name: str, turn_index: int, prompt: str, response: str,
+                 analysis: Optional[Dict[str, float]] = None, metrics: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Insert a single turn.
+        """
+        self.add_turns(session_id, model_name,
+                       [{"prompt": prompt, "response": response, "analysis": analysis, "metrics": metrics}],
+                       start_index=turn_index)
+
+    def add_generation(self, model_id: str, prompt: str, response: str, trace: list,
+                       session_id: Optional[str] = None) -> None:
+        """
+        Record a generation and its token-level trace.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO generations (session_id, model_id, created_at, prompt, response, trace) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, model_id, time.time(), prompt, response, json.dumps(trace)),
+            )
+            self._commit()
+
+    def query_turns(self, model_name: Optional[str] = None, session_id: Optional[str] = None,
+                    since: Optional[float] = None, until: Optional[float] = None,
+                    echo_flag: Optional[bool] = None, min_prompt_similarity: Optional[float] = None,
+                    min_repetition_score: Optional[float] = None,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Find turns matching every given filter, newest first.
+
+        Args:
+            model_name (str, optional): Only turns from this model.
+            session_id (str, optional): Only turns from this session (returned in turn order).
+            since (float, optional): Only turns created at or after this Unix timestamp.
+            until (float, optional): Only turns created before this Unix timestamp.
+            echo_flag (bool, optional): Only turns whose echo flag matches.
+            min_prompt_similarity (float, optional): Only turns with at least this prompt similarity.
+            min_repetition_score (float, optional): Only turns with at least this repetition score.
+            limit (int, optional): Maximum number of turns returned.
+
+        Returns:
+            List[Dict[str, Any]]: Turns with their session, index, timestamp, text, analysis and metrics.
+        """
+        clauses, params = [], []
+        for column, op, value in (("model_name", "=", model_name), ("session_id", "=", session_id),
+                                  ("created_at", ">=", since), ("created_at", "<", until),
+                                  ("prompt_similarity", ">=", min_prompt_similarity),
+                                  ("repetition_score", ">=", min_repetition_score)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if echo_flag is not None:
+            clauses.append("echo_flag = ?")
+            params.append(1.0 if echo_flag else 0.0)
+        sql = f"SELECT {', '.join(_TURN_COLUMNS)} FROM turns"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY turn_index" if session_id is not None else " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            record = dict(zip(_TURN_COLUMNS, row))
+            record["analysis"] = {key: record.pop(key)
+                                  for key in ("prompt_similarity", "echo_flag", "repetition_score")}
+            record["metrics"] = json.loads(record["metrics"]) if record["metrics"] is not None else None
+            results.append(record)
+        return results
+
+    def query_generations(self, model_id: Optional[str] = None, session_id: Optional[str] = None,
+                          since: Optional[float] = None, until: Optional[float] = None,
+                          limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Find recorded generations (with their token-level traces), newest first.
+        """
+        clauses, params = [], []
+        for column, op, value in (("model_id", "=", model_id), ("session_id", "=", session_id),
+                                  ("created_at", ">=", since), ("created_at", "<", until)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT session_id, model_id, created_at, prompt, response, trace FROM generations"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {"session_id": session_id, "model_id": model_id, "created_at": created_at,
+             "prompt": prompt, "response": response, "trace": json.loads(trace)}
+            for session_id, model_id, created_at, prompt, response, trace in rows
+        ]
+
+    def list_sessions(self, model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        List stored sessions, newest first.
+        """
+        sql = "SELECT session_id, model_name, max_length, created_at, source FROM sessions"
+        params: List[Any] = []
+        if model_name is not None:
+            sql += " WHERE model_name = ?"
+            params.append(model_name)
+        sql += " ORDER BY created_at DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(("session_id", "model_name", "max_length", "created_at", "source"), row)) for row in rows]
+
+    def import_session(self, session_data: Dict[str, Any], source: Optional[str] = None) -> str:
+        """
+        Import a session in the format produced by exporter.export_session.
+
+        Returns:
+            str: The id of the new session.
+        """
+        exported_at = session_data.get("exported_at")
+        created_at = time.mktime(time.strptime(exported_at, "%Y-%m-%d %H:%M:%S")) if exported_at else None
+        with self.batch():
+            session_id = self.start_session(session_data.get("model_name"), session_data.get("max_length"),
+                                            created_at=created_at, source=source)
+            turns = [dict(turn, created_at=turn.get("created_at") or created_at) for turn in session_data["turns"]]
+            self.add_turns(session_id, session_data.get("model_name"), turns)
+        return session_id
+
+    def import_files(self, file_paths: Sequence[str], batch_size: int = 100) -> List[str]:
+        """
+        Import exported sessions from JSON (export_session_to_json) or JSON Lines
+        (JSONLSessionExporter) files, committing once per `batch_size` files.
+
+        Returns:
+            List[str]: The ids of the imported sessions, in file order.
+        """
+        session_ids = []
+        for start in range(0, len(file_paths), batch_size):
+            with self.batch():
+                for file_path in file_paths[start:start + batch_size]:
+                    session_ids.append(self.import_session(_read_export(file_path), source=file_path))
+            logger.info(f"Imported {len(session_ids)}/{len(file_paths)} session files.")
+        return session_ids
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _read_export(file_path: str) -> Dict[str, Any]:
+    if not file_path.endswith(".jsonl"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    session_data: Dict[str, Any] = {"turns": []}
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.pop("type", None) == "turn":
+                record.pop("index", None)
+                session_data["turns"].append(record)
+            else:
+                session_data.update(record)
+    return session_data
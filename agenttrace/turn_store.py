@@ -0,0 +1,256 @@
+"""
+Module: agenttrace.turn_store
+Compact storage for conversation turns. Turns are `__slots__` records; a TurnStore
+keeps the most recent turns in memory and spills older ones to an on-disk segment
+so long sessions use bounded memory.
+"""
+
+import json
+import tempfile
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.turn_store")
+
+
+class Turn(Mapping):
+    """
+    One conversation turn.
+
+    Behaves like the read-only dict {"prompt", "response"[, "metrics"]} used by
+    earlier versions of the history ("metrics" is only present for turns that have
+    them), and supports item assignment for those keys. Changing the prompt or the
+    response discards the cached analysis.
+    """
+    __slots__ = ("_prompt", "_response", "metrics", "analysis", "created_at")
+
+    def __init__(self, prompt: str, response: str, metrics: Optional[Dict[str, Any]] = None,
+                 analysis: Optional[Dict[str, float]] = None, created_at: Optional[float] = None) -> None:
+        self._prompt = prompt
+        self._response = response
+        self.metrics = metrics
+        self.analysis = analysis
+        self.created_at = time.time() if created_at is None else created_at
+
+    @property
+    def prompt(self) -> str:
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, value: str) -> None:
+        self._prompt = value
+        self.analysis = None
+
+    @property
+    def response(self) -> str:
+        return self._response
+
+    @response.setter
+    def response(self, value: str) -> None:
+        self._response = value
+        self.analysis = None
+
+    @classmethod
+    def from_mapping(cls, turn: Mapping) -> "Turn":
+        if isinstance(turn, Turn):
+            return turn
+        return cls(turn["prompt"], turn["response"], turn.get("metrics"))
+
+    def _keys(self) -> List[str]:
+        return ["prompt", "response"] if self.metrics is None else ["prompt", "response", "metrics"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "prompt":
+            return self._prompt
+        if key == "response":
+            return self._response
+        if key == "metrics" and self.metrics is not None:
+            return self.metrics
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in ("prompt", "response", "metrics"):
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def __repr__(self) -> str:
+        return f"Turn({dict(self)!r})"
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        Serialisable form of the turn, including its cached analysis.
+        """
+        return {"prompt": self._prompt, "response": self._response, "metrics": self.metrics,
+                "analysis": self.analysis, "created_at": self.created_at}
+
+
+class TurnStore:
+    """
+    List-like store of Turn records with an optional in-memory window.
+
+    Once more than `window` turns are held in memory, the oldest are appended to a
+    spill segment (a temporary JSON Lines file in `spill_dir`) and only their byte
+    offsets stay in memory. Indexing, slicing, iteration and len() work across both
+    parts, so callers see a single sequence.
+
+    Turns read back from the segment are fresh copies: to change a spilled turn,
+    assign it back with `store[index] = turn`. The new record overwrites the old one
+    when it fits in its slot and is appended otherwise; once abandoned slots take
+    more space than live ones, the segment is rewritten without them.
+
+    Args:
+        window (int, optional): Number of most recent turns kept in memory. Defaults to no limit.
+        spill_dir (str, optional): Directory for the spill segment. Defaults to the system temp directory.
+    """
+    def __init__(self, window: Optional[int] = None, spill_dir: Optional[str] = None) -> None:
+        if window is not None and window < 1:
+            raise ValueError("window must be at least 1.")
+        self.window = window
+        self.spill_dir = spill_dir
+        self._recent: List[Turn] = []
+        self._offsets = array("Q")  # Byte offset of every spilled turn in the segment
+        self._sizes = array("Q")  # Bytes reserved for every spilled turn (its slot)
+        self._live_bytes = 0  # Sum of _sizes
+        self._dead_bytes = 0  # Bytes of slots abandoned by rewritten turns
+        self._segment = None
+        self._lock = threading.Lock()
+
+    @property
+    def spilled(self) -> int:
+        """
+        Number of turns stored on disk.
+        """
+        return len(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._recent)
+
+    def append(self, turn: Mapping) -> None:
+        with self._lock:
+            self._recent.append(Turn.from_mapping(turn))
+            if self.window is not None and len(self._recent) > self.window:
+                self._spill(len(self._recent) - self.window)
+
+    def _spill(self, count: int) -> None:
+        if self._segment is None:
+            self._segment = tempfile.TemporaryFile(mode="w+b", dir=self.spill_dir, prefix="agenttrace-turns-")
+        self._segment.seek(0, 2)
+        for turn in self._recent[:count]:
+            record = json.dumps(turn.to_record()).encode("utf-8") + b"\n"
+            self._offsets.append(self._segment.tell())
+            self._sizes.append(len(record))
+            self._live_bytes += len(record)
+            self._segment.write(record)
+        self._segment.flush()
+        del self._recent[:count]
+        logger.debug(f"Spilled {count} turns to disk ({len(self._offsets)} on disk).")
+
+    def _read(self, index: int) -> Turn:
+        self._segment.seek(self._offsets[index])
+        return Turn(**json.loads(self._segment.readline()))
+
+    def _normalize_index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("turn index out of range")
+        return index
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Turn, List[Turn]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        with self._lock:
+            index = self._normalize_index(index)
+            if index >= len(self._offsets):
+                return self._recent[index - len(self._offsets)]
+            return self._read(index)
+
+    def __setitem__(self, index: int, turn: Mapping) -> None:
+        with self._lock:
+            index = self._normalize_index(index)
+            turn = Turn.from_mapping(turn)
+            if index >= len(self._offsets):
+                self._recent[index - len(self._offsets)] = turn
+                return
+            record = json.dumps(turn.to_record()).encode("utf-8") + b"\n"
+            if len(record) <= self._sizes[index]:
+                # Fits in the old slot; readline stops at the new record's newline.
+                self._segment.seek(self._offsets[index])
+            else:
+                self._dead_bytes += self._sizes[index]
+                self._live_bytes += len(record) - self._sizes[index]
+                self._segment.seek(0, 2)
+                self._offsets[index] = self._segment.tell()
+                self._sizes[index] = len(record)
+            self._segment.write(record)
+            self._segment.flush()
+            if self._dead_bytes > self._live_bytes:
+                self._compact()
+
+    def _compact(self) -> None:
+        """
+        Rewrite the spill segment with only the live records, in index order.
+        """
+        segment = tempfile.TemporaryFile(mode="w+b", dir=self.spill_dir, prefix="agenttrace-turns-")
+        offsets = array("Q")
+        sizes = array("Q")
+        for offset in self._offsets:
+            self._segment.seek(offset)
+            record = self._segment.readline()
+            offsets.append(segment.tell())
+            sizes.append(len(record))
+            segment.write(record)
+        segment.flush()
+        logger.debug(f"Compacted spill segment, reclaiming {self._dead_bytes} bytes.")
+        self._segment.close()
+        self._segment, self._offsets, self._sizes = segment, offsets, sizes
+        self._live_bytes, self._dead_bytes = sum(sizes), 0
+
+    def is_spilled(self, index: int) -> bool:
+        return self._normalize_index(index) < len(self._offsets)
+
+    def __iter__(self) -> Iterator[Turn]:
+        for index in range(len(self._offsets)):
+            with self._lock:
+                turn = self._read(index)
+            yield turn
+        yield from list(self._recent)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __repr__(self) -> str:
+        return f"TurnStore(turns={len(self)}, spilled={self.spilled}, window={self.window})"
+
+    def close(self) -> None:
+        """
+        Delete the spill segment and drop every turn; the store is left empty.
+        """
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self._offsets = array("Q")
+            self._sizes = array("Q")
+            self._live_bytes = self._dead_bytes = 0
+            self._recent = []
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Materialise spilled turns so the store can be pickled (e.g. by session state backends).
+        return {"window": self.window, "spill_dir": self.spill_dir, "turns": list(self)}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["window"], state["spill_dir"])
+        for turn in state["turns"]:
+            self.append(turn)
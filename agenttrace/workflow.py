@@ -0,0 +1,200 @@
+"""
+Module: agenttrace.workflow
+Executes multi-agent workflows described as a DAG of agents and dependencies.
+Independent agents run concurrently on a thread or process pool, bounded by a
+maximum concurrency and an optional memory limit.
+"""
+
+import json
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agenttrace.logger import setup_logger
+
+logger = setup_logger("AgentTrace.workflow")
+
+Agent = Dict[str, Any]
+Dependency = Tuple[str, str]
+
+
+def build_predecessor_index(agents: Sequence[Agent], dependencies: Sequence[Dependency]
+                            ) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    Index the dependency list once so each agent's upstreams and downstreams are O(1) lookups.
+
+    Returns:
+        Tuple[Dict[str, List[str]], Dict[str, List[str]]]: (successors, predecessors) keyed by agent id.
+            Predecessors keep the order in which dependencies were declared.
+    """
+    successors: Dict[str, List[str]] = {agent["id"]: [] for agent in agents}
+    predecessors: Dict[str, List[str]] = {agent["id"]: [] for agent in agents}
+    for src, tgt in dependencies:
+        if src not in successors or tgt not in predecessors:
+            raise ValueError(f"Dependency {src} -> {tgt} refers to an unknown agent.")
+        successors[src].append(tgt)
+        predecessors[tgt].append(src)
+    return successors, predecessors
+
+
+def topological_sort(agents: Sequence[Agent], dependencies: Sequence[Dependency]
+                     ) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Compute a topological order for the agent graph.
+    If an agent has multiple upstream inputs, its input will be the concatenation of all outputs.
+    """
+    graph, _ = build_predecessor_index(agents, dependencies)
+    indegree = {agent["id"]: 0 for agent in agents}
+    for _, tgt in dependencies:
+        indegree[tgt] += 1
+
+    # Initialize queue with agents having no incoming edges.
+    queue = deque([aid for aid in indegree if indegree[aid] == 0])
+    order = []
+    while queue:
+        aid = queue.popleft()
+        order.append(aid)
+        for neighbor in graph[aid]:
+            indegree[neighbor] -= 1
+            if indegree[neighbor] == 0:
+                queue.append(neighbor)
+
+    if len(order) != len(agents):
+        raise ValueError("Cycle detected or missing agents in dependencies!")
+
+    return order, graph
+
+
+def run_agent(agent: Agent, input_text: str, global_task: str) -> str:
+    """
+    Run a single agent on its input and return its output as a string.
+    Module-level so it can be shipped to worker processes.
+    """
+    from agenttrace.orchestrator import create_agent_chain, run_agent_chain
+
+    chain = create_agent_chain(
+        model_name=agent["model_name"],
+        max_length=agent["max_length"],
+        task_description=global_task,
+        custom_template=agent["prompt_template"],
+        constrained_json=agent.get("constrained_json", False)
+    )
+    result = run_agent_chain(chain, input_text)
+    return json.dumps(result) if isinstance(result, dict) else str(result)
+
+
+def run_workflow(agents: Sequence[Agent], dependencies: Sequence[Dependency], global_task: str,
+                 max_concurrency: int = 1, memory_limit_mb: Optional[float] = None,
+                 executor: str = "thread",
+                 agent_runner: Callable[[Agent, str, str], str] = run_agent,
+                 on_agent_start: Optional[Callable[[Agent], None]] = None,
+                 on_agent_error: Optional[Callable[[Agent, Exception], None]] = None) -> Dict[str, str]:
+    """
+    Run agents as soon as all of their upstream agents have finished.
+
+    A ready queue holds agents whose dependencies are satisfied; up to
+    `max_concurrency` of them run at once. For agents with multiple inputs, their
+    upstream outputs are concatenated (separated by newlines) in dependency order;
+    agents without inputs receive the global task.
+
+    Memory is bounded with each agent's optional "memory_mb" estimate: an agent is
+    only started if the running total stays within `memory_limit_mb` (a single agent
+    may always run). With thread workers, agents sharing a model share its weights
+    through the model registry, so a model is only charged once while it is running.
+
+    If an agent fails, its output is "Error: ...", no further agents are started and
+    the agents already running are allowed to finish.
+
+    Args:
+        agents (Sequence[Agent]): Agent dicts with "id", "name", "model_name", "prompt_template" and "max_length",
+            and optionally "constrained_json" to force JSON output (see orchestrator.create_agent_chain).
+        dependencies (Sequence[Dependency]): (source_id, target_id) edges.
+        global_task (str): The overall task description.
+        max_concurrency (int): Maximum number of agents running at once. Defaults to 1.
+        memory_limit_mb (float, optional): Memory budget for running agents. Defaults to no limit.
+        executor (str): "thread" or "process". Defaults to "thread".
+        agent_runner (Callable): Function running one agent; must be picklable for process pools.
+        on_agent_start (Callable, optional): Called with the agent when it is scheduled.
+        on_agent_error (Callable, optional): Called with the agent and the exception when it fails.
+
+    Returns:
+        Dict[str, str]: Mapping of agent id to its output, in completion order.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+    # Validates the graph (unknown agents, cycles) before anything runs.
+    topological_sort(agents, dependencies)
+    successors, predecessors = build_predecessor_index(agents, dependencies)
+    agent_dict = {agent["id"]: agent for agent in agents}
+    pending_inputs = {aid: len(preds) for aid, preds in predecessors.items()}
+    ready = deque(agent["id"] for agent in agents if pending_inputs[agent["id"]] == 0)
+
+    # Thread workers share model weights, so memory is charged per running model;
+    # process workers each load their own copy, so it is charged per agent.
+    shares_weights = executor == "thread"
+    holders: Counter = Counter()
+    charges: Dict[str, float] = {}
+    running: Dict[Future, str] = {}
+    running_memory = 0.0
+    outputs: Dict[str, str] = {}
+    failed = False
+
+    def charge_key(agent: Agent) -> str:
+        return agent["model_name"] if shares_weights else agent["id"]
+
+    def memory_cost(agent: Agent) -> float:
+        if holders[charge_key(agent)] > 0:
+            return 0.0
+        return float(agent.get("memory_mb", 0))
+
+    if executor == "thread":
+        pool: Executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agenttrace-agent")
+    elif executor == "process":
+        pool = ProcessPoolExecutor(max_workers=max_concurrency)
+    else:
+        raise ValueError(f"Unsupported executor: {executor}")
+
+    with pool:
+        while ready or running:
+            while ready and not failed and len(running) < max_concurrency:
+                agent = agent_dict[ready[0]]
+                cost = memory_cost(agent)
+                if running and memory_limit_mb is not None and running_memory + cost > memory_limit_mb:
+                    break
+                ready.popleft()
+                upstream_outputs = [outputs[src] for src in predecessors[agent["id"]]]
+                input_text = "\n".join(upstream_outputs) if upstream_outputs else global_task
+                if on_agent_start is not None:
+                    on_agent_start(agent)
+                future = pool.submit(agent_runner, agent, input_text, global_task)
+                running[future] = agent["id"]
+                key = charge_key(agent)
+                if holders[key] == 0:
+                    charges[key] = cost
+                    running_memory += cost
+                holders[key] += 1
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                aid = running.pop(future)
+                agent = agent_dict[aid]
+                key = charge_key(agent)
+                holders[key] -= 1
+                if holders[key] == 0:
+                    running_memory -= charges.pop(key)
+                try:
+                    outputs[aid] = future.result()
+                except Exception as e:
+                    outputs[aid] = f"Error: {e}"
+                    failed = True
+                    logger.error(f"Error in agent {agent['name']}: {e}")
+                    if on_agent_error is not None:
+                        on_agent_error(agent, e)
+                    continue
+                for successor in successors[aid]:
+                    pending_inputs[successor] -= 1
+                    if pending_inputs[successor] == 0:
+                        ready.append(successor)
+    return outputs
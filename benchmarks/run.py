@@ -0,0 +1,312 @@
+"""
+Module: benchmarks.run
+Offline benchmark suite for AgentTrace. Measures generation with and without
+traces, response analysis, session export and workflow scheduling, and writes
+the results as JSON so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from benchmarks.tiny_model import build_tiny_model, default_model_dir
+
+_WORDS = ("agent trace model prompt response token latency export session replay "
+          "analysis workflow memory cache stream batch").split()
+
+
+def _text(num_chars: int, seed: int = 0) -> str:
+    words, length, i = [], 0, seed
+    while length < num_chars:
+        word = _WORDS[(i * 7 + seed) % len(_WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        i += 1
+    return " ".join(words)[:num_chars]
+
+
+def _percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {"mean": statistics.fmean(ordered), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99)}
+
+
+def _time_calls(fn: Callable[[], Any], repeats: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_generation(model_dir: str, repeats: int, new_tokens: int = 48) -> Dict[str, Any]:
+    """
+    Latency and tokens/sec for raw model.generate, HuggingFaceBackend.generate and
+    generate_with_trace with alternatives and entropy, on a fixed number of new tokens.
+    """
+    import torch
+    from agenttrace.llm_backend import HuggingFaceBackend
+    from agenttrace.model_registry import ModelRegistry
+
+    backend = HuggingFaceBackend(model_dir, registry=ModelRegistry(snapshot_dir=""), prefix_cache_size=0, seed=0)
+    prompt = _text(120)
+    prompt_tokens = len(backend.tokenizer(prompt)["input_ids"])
+    max_length = prompt_tokens + new_tokens
+    # min_length pins the output length so every call decodes the same number of tokens;
+    # the prefix cache is disabled so repeated prompts do not skip the prefill.
+    backend.generation_kwargs["min_length"] = max_length
+    inputs = backend.tokenizer(prompt, return_tensors="pt")
+
+    def raw_generate() -> None:
+        with torch.no_grad():
+            backend.model.generate(**inputs, max_length=max_length, **backend.generation_kwargs)
+
+    cases = {
+        "model_generate": raw_generate,
+        "generate": lambda: backend.generate(prompt, max_length),
+        "generate_with_trace_detailed": lambda: backend.generate_with_trace(prompt, max_length, top_k=5,
+                                                                            detailed=True),
+    }
+    results: Dict[str, Any] = {"prompt_tokens": prompt_tokens, "new_tokens": new_tokens}
+    for name, fn in cases.items():
+        samples = _time_calls(fn, repeats)
+        latency = _percentiles(samples)
+        results[name] = {"latency_s": latency, "tokens_per_s": new_tokens / latency["mean"]}
+    baseline = results["model_generate"]["latency_s"]["mean"]
+    for name in ("generate", "generate_with_trace_detailed"):
+        results[name]["overhead_vs_model_generate"] = results[name]["latency_s"]["mean"] / baseline - 1
+    return results
+
+
+def bench_precision(model_dir: str, modes: Sequence[str], repeats: int, new_tokens: int = 48,
+                    num_threads: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Memory footprint and tokens/sec of generate_with_trace for each weight mode
+    (e.g. "float32", "bfloat16", "int8").
+    """
+    from agenttrace.llm_backend import HuggingFaceBackend
+    from agenttrace.model_registry import ModelRegistry
+
+    results: Dict[str, Any] = {}
+    for mode in modes:
+        registry = ModelRegistry(snapshot_dir="")
+        backend = HuggingFaceBackend(model_dir, dtype=mode, registry=registry, prefix_cache_size=0, seed=0,
+                                     num_threads=num_threads)
+        prompt = _text(120)
+        max_length = len(backend.tokenizer(prompt)["input_ids"]) + new_tokens
+        backend.generation_kwargs["min_length"] = max_length
+        samples = _time_calls(lambda: backend.generate_with_trace(prompt, max_length), repeats)
+        load_stats = next(iter(registry.stats()["load_stats"].values()))
+        latency = _percentiles(samples)
+        results[mode] = {
+            "size_mb": load_stats["size_mb"],
+            "rss_delta_mb": load_stats["rss_delta_mb"],
+            "latency_s": latency,
+            "tokens_per_sec": new_tokens / latency["mean"],
+        }
+        registry.clear()
+    return results
+
+
+def bench_analysis(sizes: Sequence[int], repeats: int) -> Dict[str, Any]:
+    """
+    analyze_response throughput for prompt/response pairs of growing size.
+    """
+    from agenttrace.analyzer import analyze_response
+
+    results = {}
+    for size in sizes:
+        prompt = _text(size, seed=1)
+        response = prompt[: size // 2] + " " + _text(size // 2, seed=3)
+        samples = _time_calls(lambda: analyze_response(prompt, response), repeats)
+        latency = _percentiles(samples)
+        results[str(size)] = {"latency_s": latency, "chars_per_s": 2 * size / latency["mean"]}
+    return results
+
+
+def _synthetic_conversation(model_dir: str, num_turns: int) -> Any:
+    from agenttrace.conversation import Conversation
+
+    conversation = Conversation(model_dir, max_length=64)
+    for i in range(num_turns):
+        prompt = _text(200, seed=i)
+        conversation.history.append({"prompt": prompt, "response": prompt[:80] + " " + _text(400, seed=i + 1)})
+    return conversation
+
+
+def bench_export(model_dir: str, turn_counts: Sequence[int]) -> Dict[str, Any]:
+    """
+    export_session time (cold and with cached analyses), JSON/JSON Lines file export
+    time and peak traced memory as the number of turns grows.
+    """
+    from agenttrace.exporter import JSONLSessionExporter, export_session, export_session_to_json
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_turns in turn_counts:
+            conversation = _synthetic_conversation(model_dir, num_turns)
+            entry: Dict[str, Any] = {}
+            tracemalloc.start()
+            start = time.perf_counter()
+            export_session(conversation)
+            entry["export_session_cold_s"] = time.perf_counter() - start
+            entry["export_session_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            export_session(conversation)
+            entry["export_session_warm_s"] = time.perf_counter() - start
+
+            for name, export in (
+                ("json_file", lambda path: export_session_to_json(conversation, path)),
+                ("jsonl_file", lambda path: JSONLSessionExporter(path, resume=False).export(conversation)),
+            ):
+                path = os.path.join(tmp_dir, f"session-{num_turns}.{name}")
+                tracemalloc.start()
+                start = time.perf_counter()
+                export(path)
+                entry[f"{name}_s"] = time.perf_counter() - start
+                entry[f"{name}_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+            results[str(num_turns)] = entry
+    return results
+
+
+def synthetic_agent(agent: Dict[str, Any], input_text: str, global_task: str) -> str:
+    """
+    Stand-in agent that sleeps for the agent's "duration" and echoes a short output.
+    Module-level so it can run in process pools.
+    """
+    time.sleep(agent.get("duration", 0.01))
+    return f"{agent['id']}:{len(input_text)}"
+
+
+def _layered_dag(layers: int, width: int, duration: float) -> Any:
+    agents, dependencies = [], []
+    for layer in range(layers):
+        for i in range(width):
+            agent_id = f"a{layer}_{i}"
+            agents.append({"id": agent_id, "name": agent_id, "model_name": "synthetic", "duration": duration})
+            if layer > 0:
+                # Each agent depends on two agents of the previous layer.
+                dependencies.append((f"a{layer - 1}_{i}", agent_id))
+                dependencies.append((f"a{layer - 1}_{(i + 1) % width}", agent_id))
+    return agents, sorted(set(dependencies))
+
+
+def bench_workflow(shapes: Sequence[Sequence[int]], concurrencies: Sequence[int],
+                   duration: float = 0.01) -> Dict[str, Any]:
+    """
+    run_workflow wall time on layered synthetic DAGs for several concurrency limits.
+    """
+    from agenttrace.workflow import run_workflow
+
+    results = {}
+    for layers, width in shapes:
+        agents, dependencies = _layered_dag(layers, width, duration)
+        entry: Dict[str, Any] = {"agents": len(agents), "critical_path_s": layers * duration}
+        for concurrency in concurrencies:
+            start = time.perf_counter()
+            run_workflow(agents, dependencies, "synthetic task", max_concurrency=concurrency,
+                         agent_runner=synthetic_agent)
+            entry[f"concurrency_{concurrency}_s"] = time.perf_counter() - start
+        results[f"{layers}x{width}"] = entry
+    return results
+
+
+def _metadata() -> Dict[str, Any]:
+    meta: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    try:
+        meta["commit"] = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                        check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        meta["commit"] = None
+    for module in ("torch", "transformers"):
+        try:
+            meta[module] = __import__(module).__version__
+        except ImportError:
+            meta[module] = None
+    return meta
+
+
+def run_all(model_dir: str, quick: bool = False) -> Dict[str, Any]:
+    """
+    Run every benchmark and return the results with run metadata.
+    """
+    build_tiny_model(model_dir)
+    return {
+        "meta": _metadata(),
+        "generation": bench_generation(model_dir, repeats=3 if quick else 20),
+        "precision": bench_precision(model_dir, ["float32", "bfloat16", "int8"], repeats=3 if quick else 10),
+        "analysis": bench_analysis([100, 1000, 10000] if quick else [100, 1000, 10000, 100000],
+                                   repeats=3 if quick else 20),
+        "export": bench_export(model_dir, [10, 100] if quick else [10, 100, 1000, 5000]),
+        "workflow": bench_workflow([(3, 2)] if quick else [(3, 2), (5, 4), (10, 8)],
+                                   [1, 4] if quick else [1, 2, 4, 8]),
+    }
+
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Relative change (current / baseline - 1) of every numeric result present in both runs.
+    """
+    old, new = _flatten({k: v for k, v in baseline.items() if k != "meta"}), \
+        _flatten({k: v for k, v in current.items() if k != "meta"})
+    return {name: new[name] / old[name] - 1 for name in sorted(old.keys() & new.keys()) if old[name]}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the offline AgentTrace benchmark suite.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--model-dir", default=None, help="Directory for the tiny GPT-2 model.")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats and smaller sizes.")
+    parser.add_argument("--compare", default=None, help="Previous results file to compare against.")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.model_dir or default_model_dir(), quick=args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, change in compare(baseline, results).items():
+            print(f"{name:70s} {change:+.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,61 @@
+"""
+Module: benchmarks.tiny_model
+Builds a tiny, randomly initialised GPT-2 model and byte-level BPE tokenizer on
+disk so benchmarks run fully offline.
+"""
+
+import os
+from typing import Optional
+
+_CORPUS = (
+    "AgentTrace is a debugging toolkit for AI agents. It records conversations, "
+    "replays turns with modified prompts, analyzes responses for prompt echo and "
+    "repetition, and exports sessions for offline review. Each model prompt, response, "
+    "token, latency, memory, cache, stream, batch, workflow and analysis is traced. "
+)
+
+
+def build_tiny_model(path: str, vocab_size: int = 512, n_layer: int = 2, n_embd: int = 64,
+                     n_head: int = 2, n_positions: int = 1024, seed: int = 0) -> str:
+    """
+    Save a randomly initialised GPT-2 model and its tokenizer to `path` (reused if it already exists).
+
+    Args:
+        path (str): Output directory.
+        vocab_size (int): Tokenizer vocabulary size.
+        n_layer (int): Number of transformer blocks.
+        n_embd (int): Hidden size.
+        n_head (int): Number of attention heads.
+        n_positions (int): Maximum sequence length.
+        seed (int): Seed for the random weights.
+
+    Returns:
+        str: The model directory, loadable with from_pretrained.
+    """
+    if os.path.isfile(os.path.join(path, "config.json")):
+        return path
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<|endoftext|>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator([_CORPUS] * 20, trainer)
+    fast_tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>",
+                                             bos_token="<|endoftext|>", unk_token="<|endoftext|>")
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(fast_tokenizer), n_positions=n_positions, n_embd=n_embd,
+                        n_layer=n_layer, n_head=n_head, bos_token_id=0, eos_token_id=0)
+    model = GPT2LMHeadModel(config)
+    model.save_pretrained(path)
+    fast_tokenizer.save_pretrained(path)
+    return path
+
+
+def default_model_dir(base_dir: Optional[str] = None) -> str:
+    base_dir = base_dir or os.path.join(os.path.expanduser("~"), ".cache", "agenttrace", "benchmarks")
+    return os.path.join(base_dir, "tiny-gpt2")
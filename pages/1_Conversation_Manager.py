@@ -15,10 +15,13 @@ def main() -> None:
     model_name = st.sidebar.text_input("Model Name", value="google/gemma-3-1b-it")
     max_length = st.sidebar.number_input("Max Output Length", value=50, min_value=10, max_value=2000, step=10)
     backend_type = st.sidebar.selectbox("Select LLM Backend", options=["huggingface"], index=0)
+    history_window = st.sidebar.number_input("Turns Kept in Memory (older turns are spilled to disk)",
+                                             value=100, min_value=1, step=10)
 
     # Check if conversation exists and if the model name has changed
     if "conversation" not in st.session_state or st.session_state.conversation.model_name != model_name:
-        st.session_state.conversation = Conversation(model_name, max_length, backend_type)
+        st.session_state.conversation = Conversation(model_name, max_length, backend_type,
+                                                     history_window=int(history_window))
         logger.info(f"Initialized conversation with model '{model_name}', max_length {max_length}, backend '{backend_type}'")
     else:
         # Optionally update max_length if changed
@@ -34,9 +37,13 @@ def main() -> None:
     prompt = st.text_input("Enter your prompt:")
     if st.button("Send"):
         if prompt.strip():
-            response = st.session_state.conversation.add_turn(prompt)
+            # Stream the response so tokens appear as soon as they are generated.
+            st.write_stream(st.session_state.conversation.add_turn_stream(prompt))
+            metrics = st.session_state.conversation.get_history()[-1]["metrics"]
             st.success("Response generated!")
-            st.code(response)
+            if metrics["time_to_first_token"] is not None:
+                st.caption(f"Time to first token: {metrics['time_to_first_token']:.2f}s | "
+                           f"Mean inter-token latency: {(metrics['inter_token_latency_mean'] or 0.0) * 1000:.1f} ms")
         else:
             st.warning("Please enter a valid prompt.")
 
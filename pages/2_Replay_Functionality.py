@@ -32,5 +32,23 @@ def main():
         st.write(f"**New Prompt:** {new_prompt}")
         st.write(f"**New Response:** {new_response}")
 
+    # Sweep: replay a range of turns across many modifications, seeds and temperatures at once
+    st.subheader("Replay Sweep")
+    first_turn, last_turn = st.select_slider("Turns to replay:", options=turn_indices,
+                                             value=(selected_turn, selected_turn))
+    modifications_text = st.text_area("Modifications (one per line, empty line = unmodified):", value="\n")
+    seeds_text = st.text_input("Seeds (comma-separated):", value="0, 1, 2")
+    temperatures_text = st.text_input("Temperatures (comma-separated, empty = backend default):", value="")
+    if st.button("Run Sweep"):
+        try:
+            modifications = list(dict.fromkeys(line.strip() for line in modifications_text.split("\n")))
+            seeds = [int(seed) for seed in seeds_text.split(",") if seed.strip()] or [None]
+            sampling = [{"temperature": float(value)} for value in temperatures_text.split(",") if value.strip()] or [{}]
+            with st.spinner("Replaying..."):
+                rows = conversation.replay_sweep(range(first_turn - 1, last_turn), modifications, seeds, sampling)
+            st.dataframe([{**row, "turn": row["turn"] + 1, "sampling": str(row["sampling"])} for row in rows])
+        except Exception as e:
+            st.error(f"Error during replay sweep: {e}")
+
 if __name__ == "__main__":
     main()
@@ -1,5 +1,4 @@
 import streamlit as st
-from agenttrace.analyzer import analyze_response
 
 def main():
     st.title("Output Analyzer")
@@ -27,7 +26,7 @@ def main():
     st.write(f"**Response:** {response}")
 
     if st.button("Analyze Last Turn"):
-        analysis = analyze_response(prompt, response)
+        analysis = conversation.get_analysis(len(history) - 1)
         st.subheader("Analysis Results")
         st.write(f"**Prompt Similarity:** {analysis['prompt_similarity']:.2f}")
         st.write(f"**Echo Flag:** {'Yes' if analysis['echo_flag'] else 'No'}")
@@ -1,6 +1,6 @@
 import streamlit as st
 import json
-from agenttrace.exporter import export_session
+from agenttrace.exporter import JSONLSessionExporter, export_session
 from agenttrace.logger import setup_logger
 
 logger = setup_logger("AgentTrace.SessionExport")
@@ -16,17 +16,43 @@ def main() -> None:
 
     conversation = st.session_state.conversation
 
-    if st.button("Export Session"):
-        session_data = export_session(conversation)
-        # Convert the session data to JSON string for download
-        json_str = json.dumps(session_data, indent=4)
-        st.download_button(
-            label="Download Session as JSON",
-            data=json_str,
-            file_name="agenttrace_session.json",
-            mime="application/json"
-        )
-        logger.info("Session exported successfully.")
+    export_format = st.radio("Export Format", ["JSON", "JSON Lines (incremental)"])
+
+    if export_format == "JSON":
+        if st.button("Export Session"):
+            session_data = export_session(conversation)
+            # Convert the session data to JSON string for download
+            json_str = json.dumps(session_data, indent=4)
+            st.download_button(
+                label="Download Session as JSON",
+                data=json_str,
+                file_name="agenttrace_session.json",
+                mime="application/json"
+            )
+            logger.info("Session exported successfully.")
+        return
+
+    st.write("Each export appends only the turns added since the last export; the file can be tailed while the session runs.")
+    file_path = st.text_input("Export File", value="agenttrace_session.jsonl")
+    exporter = st.session_state.get("jsonl_exporter")
+    # Start a fresh file for a new conversation or a new path
+    if exporter is None or exporter.file_path != file_path or st.session_state.get("jsonl_exporter_owner") is not conversation:
+        exporter = JSONLSessionExporter(file_path, resume=False)
+        st.session_state.jsonl_exporter = exporter
+        st.session_state.jsonl_exporter_owner = conversation
+
+    if st.button("Append New Turns"):
+        written = exporter.export(conversation)
+        st.success(f"Appended {written} turns ({exporter.exported_turns} total) to {file_path}.")
+
+    if exporter.exported_turns:
+        with open(file_path, "rb") as f:
+            st.download_button(
+                label="Download Session as JSON Lines",
+                data=f,
+                file_name="agenttrace_session.jsonl",
+                mime="application/jsonl"
+            )
 
 if __name__ == "__main__":
     main()
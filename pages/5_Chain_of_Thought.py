@@ -16,6 +16,10 @@ def main() -> None:
     model_name = st.sidebar.text_input("Model Name", value="GPT2-large")
     max_length = st.sidebar.number_input("Max Output Length", value=50, min_value=10, max_value=2000, step=10)
     backend_type = st.sidebar.selectbox("Select LLM Backend", options=["huggingface"], index=0)
+    top_k = st.sidebar.number_input("Alternatives per Token", value=0, min_value=0, max_value=10, step=1)
+    detailed = st.sidebar.checkbox("Show sampled token probability and entropy", value=False)
+    draft_model = st.sidebar.text_input("Draft Model (assisted decoding, same tokenizer)", value="",
+                                        help="e.g. distilgpt2 for GPT-2 models. Leave empty to disable.")
 
     # Initialize conversation in session state if not present
     if "conversation" not in st.session_state:
@@ -24,14 +28,46 @@ def main() -> None:
     st.subheader("Enter Prompt for Chain-of-Thought")
     prompt = st.text_input("Prompt:", value="Explain Einstein's theory of relativity in layman's terms.")
     
+    if draft_model and st.session_state.get("assisted_backend_key") != (model_name, draft_model):
+        from agenttrace.llm_backend import HuggingFaceBackend
+        st.session_state.assisted_backend = HuggingFaceBackend(model_name, assistant_model=draft_model)
+        st.session_state.assisted_backend_key = (model_name, draft_model)
+
     if st.button("Generate with Trace"):
         try:
-            # Directly call the backend's generate_with_trace method
-            generated_text, trace_info = st.session_state.conversation.backend.generate_with_trace(prompt, max_length)
             st.markdown("### Generated Text:")
-            st.code(generated_text)
+            text_placeholder = st.empty()
             st.markdown("### Chain-of-Thought Trace:")
-            st.table(trace_info)
+            trace_placeholder = st.empty()
+            if draft_model:
+                # Assisted decoding verifies several draft tokens per step, so it is not streamed
+                backend = st.session_state.assisted_backend
+                generated_text, trace_info = backend.generate_with_trace(prompt, max_length, top_k=top_k,
+                                                                         detailed=detailed)
+                text_placeholder.code(generated_text)
+                trace_placeholder.table(trace_info)
+                assisted = backend.last_metrics["assisted"]
+                if assisted["acceptance_rate"] is not None:
+                    st.caption(f"Draft acceptance rate: {assisted['acceptance_rate']:.0%} "
+                               f"({assisted['accepted_tokens']}/{assisted['draft_tokens']} tokens, "
+                               f"{assisted['tokens_per_round']:.2f} tokens per verification step)")
+                logger.info("Assisted chain-of-thought generated successfully.")
+                return
+            # Stream from the backend so text and trace render while tokens are generated
+            generated_text = ""
+            trace_info = []
+            for delta, entry in st.session_state.conversation.backend.generate_stream(
+                prompt, max_length, top_k=top_k, detailed=detailed
+            ):
+                generated_text += delta
+                text_placeholder.code(generated_text)
+                if entry is not None:
+                    trace_info.append(entry)
+                    # Redrawing the table is costly; refresh it every few tokens
+                    if len(trace_info) % 16 == 0:
+                        trace_placeholder.table(trace_info)
+            text_placeholder.code(generated_text.strip())
+            trace_placeholder.table(trace_info)
             logger.info("Chain-of-thought generated successfully.")
         except Exception as e:
             st.error(f"Error during generation with trace: {e}")
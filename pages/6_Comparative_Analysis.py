@@ -1,46 +1,77 @@
 # pages/6_Comparative_Analysis.py
 
 import streamlit as st
-from difflib import SequenceMatcher
-from agenttrace.llm_backend import HuggingFaceBackend
-from agenttrace.analyzer import analyze_response
+from agenttrace.comparison import ComparisonEngine
+from agenttrace.response_cache import ResponseCache
 
 def main() -> None:
     st.title("Comparative Analysis of LLMs")
-    st.write("Compare outputs and chain-of-thought traces from two different models for the same prompt.")
+    st.write("Compare outputs and chain-of-thought statistics of several models over a suite of prompts.")
 
     # Sidebar options for configuring models
     st.sidebar.header("Configuration")
-    model_name1 = st.sidebar.text_input("Model 1 Name", value="GPT2-large")
-    model_name2 = st.sidebar.text_input("Model 2 Name", value="EleutherAI/gpt-neo-125M")
+    models_text = st.sidebar.text_area("Models (one per line)", value="GPT2-large\nEleutherAI/gpt-neo-125M")
     max_length = st.sidebar.number_input("Max Output Length", value=50, min_value=10, max_value=200, step=10)
-    
-    # Prompt input for comparison
-    prompt = st.text_input("Enter the prompt for comparison:", value="Explain Einstein's theory of relativity in layman's terms.")
-
-    if st.button("Compare Models"):
-        # Instantiate two backends for each model
-        backend1 = HuggingFaceBackend(model_name1)
-        backend2 = HuggingFaceBackend(model_name2)
-        
-        # Generate outputs with chain-of-thought traces
-        output1, trace1 = backend1.generate_with_trace(prompt, max_length)
-        output2, trace2 = backend2.generate_with_trace(prompt, max_length)
-        
-        st.markdown("### Model 1 Output")
-        st.code(output1)
-        st.markdown("#### Chain-of-Thought (Model 1)")
-        st.table(trace1)
-        
-        st.markdown("### Model 2 Output")
-        st.code(output2)
-        st.markdown("#### Chain-of-Thought (Model 2)")
-        st.table(trace2)
-        
-        # Compare outputs using SequenceMatcher
-        similarity = SequenceMatcher(None, output1, output2).ratio()
-        st.markdown("### Output Similarity")
-        st.write(f"Similarity Ratio: {similarity:.2f}")
+    num_seeds = st.sidebar.number_input("Seeds per Prompt", value=1, min_value=1, max_value=10, step=1)
+    max_workers = st.sidebar.number_input("Worker Processes", value=2, min_value=1, max_value=8, step=1,
+                                          help="Each worker holds one model in memory at a time.")
+
+    # Prompt suite for comparison
+    prompts_text = st.text_area("Enter the prompts for comparison (one per line):",
+                                value="Explain Einstein's theory of relativity in layman's terms.")
+    models = [line.strip() for line in models_text.splitlines() if line.strip()]
+    prompts = [line.strip() for line in prompts_text.splitlines() if line.strip()]
+
+    # Generated cells are cached for the session, so adding a model only runs the new model
+    if "comparison_cache" not in st.session_state:
+        st.session_state.comparison_cache = ResponseCache()
+    settings = (tuple(prompts), int(num_seeds), int(max_length), int(max_workers))
+    if st.session_state.get("comparison_settings") != settings:
+        st.session_state.comparison_engine = ComparisonEngine(
+            prompts, seeds=range(int(num_seeds)), max_length=int(max_length),
+            cache=st.session_state.comparison_cache, max_workers=int(max_workers)
+        )
+        st.session_state.comparison_settings = settings
+    engine = st.session_state.comparison_engine
+
+    if st.button("Compare Models") and models and prompts:
+        progress = st.progress(0.0)
+        total = len(models) * engine.result.size
+        done = [0]
+
+        def on_cell(model_name: str, index: int, cell: dict) -> None:
+            done[0] += 1
+            progress.progress(done[0] / total, text=f"{done[0]}/{total} generations")
+
+        done[0] = sum(engine.result.completed(model) for model in models if model in engine.result.models)
+        try:
+            engine.run(models, on_cell=on_cell)
+        except Exception as e:
+            st.error(f"Error during comparison: {e}")
+
+    result = engine.result
+    if not result.models:
+        return
+
+    st.markdown("### Output Similarity")
+    st.table([{"model": model, **row} for model, row in result.similarity_matrix().items()])
+
+    st.markdown("### Model Statistics")
+    st.table(result.model_stats())
+
+    st.markdown("### Outputs")
+    prompt_index = st.selectbox("Prompt", options=range(len(result.prompts)),
+                                format_func=lambda index: result.prompts[index])
+    seed_index = st.selectbox("Seed", options=range(len(result.seeds)),
+                              format_func=lambda index: str(result.seeds[index]))
+    for model in result.models:
+        cell = result.cell(model, prompt_index, seed_index)
+        if cell is None:
+            continue
+        st.markdown(f"#### {model}")
+        st.code(cell["text"])
+        st.caption(f"{cell['tokens']} tokens, mean confidence {cell['mean_confidence'] or 0:.3f}, "
+                   f"min confidence {cell['min_confidence'] or 0:.3f}")
 
 if __name__ == "__main__":
     main()
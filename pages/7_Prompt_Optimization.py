@@ -2,7 +2,7 @@
 
 import streamlit as st
 from agenttrace.conversation import Conversation
-from agenttrace.prompt_optimizer import optimize_prompt
+from agenttrace.prompt_optimizer import build_prompt_variants, optimize_prompt, search_prompts
 
 def main() -> None:
     st.title("Prompt Optimization Assistant")
@@ -31,9 +31,24 @@ def main() -> None:
     st.write(selected_turn["response"])
 
     if st.button("Get Optimization Suggestion"):
-        suggestion_dict = optimize_prompt(selected_turn["prompt"], selected_turn["response"])
+        suggestion_dict = optimize_prompt(selected_turn["prompt"], selected_turn["response"],
+                                          conversation.get_analysis(turn_number - 1))
         st.markdown("### Suggestion:")
         st.write(suggestion_dict["suggestion"])
 
+    # Automated search over prompt variants, pruning weak ones after a single seed
+    st.subheader("Search Prompt Variants")
+    num_seeds = st.number_input("Seeds per Finalist", value=4, min_value=1, max_value=16, step=1)
+    if st.button("Search Variants"):
+        candidates = build_prompt_variants(selected_turn["prompt"])
+        with st.spinner(f"Evaluating {len(candidates)} prompt variants..."):
+            result = search_prompts(conversation.backend, candidates, conversation.max_length,
+                                    seeds=range(int(num_seeds)))
+        cost = result["cost"]
+        st.caption(f"{cost['generations']} generations in {cost['rounds']} rounds ({cost['time']:.1f}s); "
+                   f"evaluating every variant on every seed would take {cost['exhaustive_generations']}.")
+        st.table([{"prompt": entry["prompt"], "score": round(entry["score"], 3),
+                   "evaluations": entry["evaluations"]} for entry in result["ranking"]])
+
 if __name__ == "__main__":
     main()
@@ -1,7 +1,7 @@
 # pages/8_Agent_Orchestration.py
 
 import streamlit as st
-from agenttrace.orchestrator import create_agent_chain, run_agent_chain
+from agenttrace.orchestrator import create_agent_chain, last_constrained_stats, run_agent_chain
 from agenttrace.logger import setup_logger
 import graphviz
 import json
@@ -29,11 +29,19 @@ def main() -> None:
         ),
         height=200
     )
+    constrained_json = st.sidebar.checkbox("Constrain output to the plan JSON schema", value=True,
+                                           help="Only tokens that keep the output valid JSON are sampled, "
+                                                "and generation stops once the plan is closed.")
 
     if st.button("Run Agent Workflow"):
         try:
-            chain = create_agent_chain(model_name, max_length, task_description, custom_template)
+            chain = create_agent_chain(model_name, max_length, task_description, custom_template,
+                                       constrained_json=constrained_json)
             result = run_agent_chain(chain, task_description)
+            stats = last_constrained_stats() if constrained_json else None
+            if stats is not None:
+                st.caption(f"Generated {stats['generated_tokens']} of {stats['max_new_tokens']} tokens "
+                           f"({stats['tokens_saved']} saved by stopping at the closing brace).")
             st.markdown("### Generated Plan (JSON):")
             st.json(result)
             logger.info("Agent workflow executed successfully.")
@@ -1,83 +1,11 @@
 import streamlit as st
 import graphviz
-import json
-import torch
-from collections import defaultdict, deque
-from agenttrace.orchestrator import create_agent_chain, run_agent_chain
+from agenttrace.workflow import run_workflow
 from agenttrace.logger import setup_logger
-import gc
 
 
 logger = setup_logger("AgentTrace.MultiAgentDesigner")
 
-def topological_sort(agents, dependencies):
-    """
-    Compute a topological order for the agent graph.
-    If an agent has multiple upstream inputs, its input will be the concatenation of all outputs.
-    """
-    graph = defaultdict(list)
-    indegree = {agent['id']: 0 for agent in agents}
-    
-    for src, tgt in dependencies:
-        graph[src].append(tgt)
-        indegree[tgt] += 1
-    
-    # Initialize queue with agents having no incoming edges.
-    queue = deque([aid for aid in indegree if indegree[aid] == 0])
-    order = []
-    while queue:
-        aid = queue.popleft()
-        order.append(aid)
-        for neighbor in graph[aid]:
-            indegree[neighbor] -= 1
-            if indegree[neighbor] == 0:
-                queue.append(neighbor)
-    
-    if len(order) != len(agents):
-        raise ValueError("Cycle detected or missing agents in dependencies!")
-    
-    return order, graph
-
-def run_workflow(agents, dependencies, global_task):
-    """
-    Run agents in topological order. For agents with multiple inputs,
-    concatenate their upstream outputs (separated by newlines).
-    Returns a dict mapping agent id to its output.
-    Each agent uses its own max_length parameter.
-    Explicitly deallocates GPU memory after each agent run.
-    """
-    order, graph = topological_sort(agents, dependencies)
-    outputs = {}
-    # Build a lookup dictionary for agents by id
-    agent_dict = {agent["id"]: agent for agent in agents}
-    
-    for aid in order:
-        # Determine input for current agent: either global task or concatenated outputs.
-        upstream_outputs = [outputs[src] for src, tgt in dependencies if tgt == aid]
-        input_text = "\n".join(upstream_outputs) if upstream_outputs else global_task
-        
-        agent = agent_dict[aid]
-        st.write(f"**Running {agent['name']} (ID: {aid})**")
-        try:
-            chain = create_agent_chain(
-                model_name=agent["model_name"],
-                max_length=agent["max_length"],
-                task_description=global_task,
-                custom_template=agent["prompt_template"]
-            )
-            result = run_agent_chain(chain, input_text)
-            outputs[aid] = json.dumps(result) if isinstance(result, dict) else str(result)
-            # Deallocate GPU memory after each agent run
-            # del chain
-            # gc.collect()
-            # torch.cuda.empty_cache()
-        except Exception as e:
-            outputs[aid] = f"Error: {e}"
-            st.error(f"Error in {agent['name']}: {e}")
-            logger.error(f"Error in agent {agent['name']}: {e}")
-            break
-    return outputs
-
 def visualize_workflow(agents, dependencies):
     dot = graphviz.Digraph(comment="Multi-Agent Workflow")
     for agent in agents:
@@ -91,7 +19,8 @@ def main():
     st.write(
         "Design a custom multi-agent workflow by adding agents, defining their roles, and specifying how they interact. "
         "You can create a non-linear (branching) structure where multiple agents perform tasks independently, and their outputs "
-        "can be merged and fed into a final agent. Only one agent runs at a time to suit memory constraints."
+        "can be merged and fed into a final agent. Independent agents can run in parallel; lower the concurrency "
+        "or set a memory limit to suit your hardware."
     )
     
     # Sidebar: Global Workflow Settings
@@ -99,6 +28,8 @@ def main():
     global_task = st.sidebar.text_area("Overall Task Description", 
                                        value="Plan a comprehensive marketing strategy for a new tech product.")
     global_max_length = st.sidebar.number_input("Global Max Output Length (fallback)", value=100, min_value=50, max_value=3000, step=10)
+    max_concurrency = st.sidebar.number_input("Max Parallel Agents", value=1, min_value=1, max_value=16, step=1)
+    memory_limit_mb = st.sidebar.number_input("Memory Limit for Running Agents (MB, 0 = no limit)", value=0, min_value=0, step=512)
     
     # Sidebar: Add Agent
     st.sidebar.header("Add Agent")
@@ -115,6 +46,7 @@ def main():
             )
         )
         agent_max_length = st.number_input("Agent Max Output Length", value=100, min_value=50, max_value=3000, step=10)
+        agent_memory_mb = st.number_input("Estimated Agent Memory (MB)", value=0, min_value=0, step=256)
         add_agent = st.form_submit_button(label="Add Agent")
     
     if "agents" not in st.session_state:
@@ -125,7 +57,8 @@ def main():
             "name": agent_name.strip(),
             "model_name": model_name.strip(),
             "prompt_template": prompt_template,
-            "max_length": agent_max_length
+            "max_length": agent_max_length,
+            "memory_mb": agent_memory_mb
         }
         st.session_state.agents.append(agent)
         st.success(f"Added {agent_name}!")
@@ -178,7 +111,11 @@ def main():
                 outputs = run_workflow(
                     agents=st.session_state.agents,
                     dependencies=st.session_state.dependencies,
-                    global_task=global_task
+                    global_task=global_task,
+                    max_concurrency=max_concurrency,
+                    memory_limit_mb=memory_limit_mb or None,
+                    on_agent_start=lambda agent: st.write(f"**Running {agent['name']} (ID: {agent['id']})**"),
+                    on_agent_error=lambda agent, e: st.error(f"Error in {agent['name']}: {e}")
                 )
             st.markdown("### Workflow Results")
             for agent_id, output in outputs.items():
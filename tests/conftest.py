@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.tiny_model import build_tiny_model
+
+
+@pytest.fixture(scope="session")
+def tiny_model_factory(tmp_path_factory):
+    """
+    Build (once per session) a tiny random GPT-2 model per name and return its path.
+    """
+    built = {}
+
+    def build(name="tiny-gpt2", **kwargs):
+        if name not in built:
+            built[name] = build_tiny_model(str(tmp_path_factory.mktemp(name)), n_positions=128, **kwargs)
+        return built[name]
+
+    return build
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tiny_model_factory):
+    return tiny_model_factory()
@@ -0,0 +1,11 @@
+from agenttrace.analyzer import analyze_response, analyze_responses
+
+
+def test_analyze_responses_matches_analyze_response():
+    turns = [
+        {"prompt": "Tell me a story.", "response": "Tell me a story. Once upon a time. Once upon a time."},
+        {"prompt": "Tell me a story.", "response": "A dragon slept under the hill!"},
+        {"prompt": "What is 2+2?", "response": ""},
+    ]
+    expected = [analyze_response(turn["prompt"], turn["response"]) for turn in turns]
+    assert analyze_responses(turns) == expected
@@ -0,0 +1,18 @@
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+
+
+def test_draft_equal_to_target_accepts_every_proposal(tiny_model):
+    registry = ModelRegistry(snapshot_dir="")
+    plain = HuggingFaceBackend(tiny_model, registry=registry, generation_kwargs={"do_sample": False})
+    assisted = HuggingFaceBackend(tiny_model, registry=registry, generation_kwargs={"do_sample": False},
+                                  assistant_model=tiny_model, num_assistant_tokens=4)
+    expected, _ = plain.generate_with_trace("AgentTrace records", 40)
+    text, trace = assisted.generate_with_trace("AgentTrace records", 40)
+
+    stats = assisted.last_metrics["assisted"]
+    assert text == expected
+    assert stats["draft_tokens"] > 0
+    assert stats["acceptance_rate"] == 1.0
+    assert [entry["source"] for entry in trace].count("draft") == stats["accepted_tokens"]
+
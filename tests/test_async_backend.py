@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agenttrace.async_backend import ExecutorBackend
+from agenttrace.llm_backend import HuggingFaceBackend, LLMBackend
+from agenttrace.model_registry import ModelRegistry
+
+
+class _SlowBackend(LLMBackend):
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.stopped = []
+
+    def generate(self, prompt, max_length):
+        return self.generate_with_trace(prompt, max_length)[0]
+
+    def generate_with_trace(self, prompt, max_length, stop_event=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            stopped = stop_event.wait(self.delay) if stop_event is not None else time.sleep(self.delay)
+            self.stopped.append(bool(stopped))
+            return prompt.upper(), []
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class _StoppableExecutor(ExecutorBackend):
+    def _generate_sync(self, prompt, max_length, stop_event):
+        return self.backend.generate_with_trace(prompt, max_length, stop_event=stop_event)
+
+
+def test_concurrency_is_bounded_by_max_concurrency():
+    backend = _SlowBackend()
+    executor = ExecutorBackend(backend, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(executor.agenerate(f"p{i}", 10) for i in range(6)))
+
+    assert asyncio.run(run()) == [f"P{i}" for i in range(6)]
+    executor.close()
+    assert backend.peak == 2
+
+
+def test_timeout_raises_and_stops_the_worker():
+    backend = _SlowBackend(delay=5)
+    executor = _StoppableExecutor(backend, max_concurrency=1, timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.agenerate("p", 10))
+    executor.close()
+    assert backend.stopped == [True]
+
+
+def test_cancellation_sets_stop_event():
+    backend = _SlowBackend(delay=5)
+    executor = _StoppableExecutor(backend, max_concurrency=1)
+
+    async def run():
+        task = asyncio.create_task(executor.agenerate("p", 10))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    executor.close()
+    assert backend.stopped == [True]
+
+
+def test_seeded_generations_are_reproducible_across_threads(tiny_model):
+    backend = HuggingFaceBackend(tiny_model, registry=ModelRegistry(snapshot_dir=""), seed=7,
+                                 generation_kwargs={"do_sample": True, "top_k": 0})
+    expected = backend.generate("AgentTrace records", 40)
+    executor = ExecutorBackend(backend, max_concurrency=4)
+
+    async def run():
+        return await asyncio.gather(*(executor.agenerate("AgentTrace records", 40) for _ in range(4)))
+
+    assert asyncio.run(run()) == [expected] * 4
+    executor.close()
+
+
+def test_backend_can_be_reused_across_event_loops():
+    backend = _SlowBackend(delay=0.01)
+    executor = ExecutorBackend(backend, max_concurrency=1)
+
+    async def run():
+        return await asyncio.gather(*(executor.agenerate(f"p{i}", 10) for i in range(3)))
+
+    assert asyncio.run(run()) == ["P0", "P1", "P2"]
+    assert asyncio.run(run()) == ["P0", "P1", "P2"]
+    executor.close()
+    assert backend.peak == 1
+
+
+def test_async_conversation_records_turns_like_conversation():
+    from agenttrace.conversation import AsyncConversation, Conversation
+    from agenttrace.replay_backend import ReplayBackend
+    from agenttrace.trace_store import TraceStore
+
+    records = [{"prompt": "Hi", "response": "Hello there."}]
+    store = TraceStore()
+    seen = []
+    sync = Conversation("replay", backend=ReplayBackend(records), trace_store=store,
+                        on_turn_metrics=lambda index, metrics: seen.append(("sync", metrics["generated_tokens"])))
+    sync.add_turn("Hi")
+    executor = ExecutorBackend(ReplayBackend(records))
+    async_conversation = AsyncConversation(
+        "replay", backend=executor, trace_store=store,
+        on_turn_metrics=lambda index, metrics: seen.append(("async", metrics["generated_tokens"]))
+    )
+    assert asyncio.run(async_conversation.add_turn("Hi")) == "Hello there."
+    executor.close()
+
+    assert seen == [("sync", 2), ("async", 2)]
+    assert async_conversation.get_history()[0]["metrics"]["replayed"] is True
+    rows = [store.query_turns(session_id=conversation.session_id)
+            for conversation in (sync, async_conversation)]
+    assert [(row[0]["prompt"], row[0]["response"]) for row in rows] == [("Hi", "Hello there.")] * 2
+    assert async_conversation.get_history()[0].analysis == sync.get_history()[0].analysis
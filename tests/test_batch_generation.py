@@ -0,0 +1,18 @@
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+
+
+def test_mixed_prompt_lengths_respect_their_own_budget(tiny_model):
+    backend = HuggingFaceBackend(tiny_model, registry=ModelRegistry(snapshot_dir=""),
+                                 generation_kwargs={"do_sample": False})
+    prompts = ["hi", "AgentTrace records every turn", "w" * 100, " w" * 60]
+    results = backend.generate_batch_with_trace(prompts, 120, batch_size=4)
+    # The longest prompt plus the shortest prompt's budget does not fit in 128 positions.
+    assert backend.last_metrics["batches"] >= 2
+
+    for prompt, (text, trace) in zip(prompts, results):
+        prompt_tokens = len(backend.tokenizer(prompt)["input_ids"])
+        assert prompt_tokens + len(trace) <= 120
+        expected_text, expected_trace = backend.generate_with_trace(prompt, 120)
+        assert text == expected_text
+        assert [entry["token"] for entry in trace] == [entry["token"] for entry in expected_trace]
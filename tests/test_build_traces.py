@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from agenttrace.llm_backend import _TRACE_BLOCK_STEPS, HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+
+
+def _expected_trace(tokenizer, step_scores, ids, top_k):
+    """
+    Reference trace for one row, computed one step at a time.
+    """
+    def token(token_id):
+        return tokenizer.decode([token_id]).strip()
+
+    expected = []
+    for scores, chosen_id in zip(step_scores, ids):
+        probs = torch.softmax(scores.float(), dim=-1)
+        top_probs, top_ids = torch.topk(probs, top_k)
+        nonzero = probs[probs > 0]
+        expected.append({
+            "token": token(int(top_ids[0])),
+            "confidence": float(top_probs[0]),
+            "chosen_token": token(chosen_id),
+            "chosen_confidence": float(probs[chosen_id]),
+            "entropy": float(-(nonzero * nonzero.log()).sum()),
+            "alternatives": [{"token": token(int(i)), "confidence": float(p)} for i, p in zip(top_ids, top_probs)],
+        })
+    return expected
+
+
+def _assert_trace_matches(trace, expected):
+    assert len(trace) == len(expected)
+    for entry, reference in zip(trace, expected):
+        assert entry["token"] == reference["token"]
+        assert entry["chosen_token"] == reference["chosen_token"]
+        for field in ("confidence", "chosen_confidence", "entropy"):
+            assert entry[field] == pytest.approx(reference[field], abs=1e-5)
+        assert [alt["token"] for alt in entry["alternatives"]] == [alt["token"] for alt in reference["alternatives"]]
+        assert [alt["confidence"] for alt in entry["alternatives"]] == pytest.approx(
+            [alt["confidence"] for alt in reference["alternatives"]], abs=1e-5)
+
+
+@pytest.fixture(scope="module")
+def backend(tiny_model):
+    return HuggingFaceBackend(tiny_model, registry=ModelRegistry(snapshot_dir=""),
+                              generation_kwargs={"do_sample": False})
+
+
+def test_generate_with_trace_matches_per_step_softmax(backend):
+    prompt = "AgentTrace records every turn"
+    _, trace = backend.generate_with_trace(prompt, 40, top_k=3, detailed=True)
+
+    inputs = backend.tokenizer(prompt, return_tensors="pt")
+    with torch.inference_mode():
+        outputs = backend.model.generate(**inputs, max_length=40, do_sample=False, output_scores=True,
+                                         return_dict_in_generate=True)
+    ids = outputs.sequences[0, inputs["input_ids"].shape[1]:].tolist()
+    _assert_trace_matches(trace, _expected_trace(backend.tokenizer, [s[0] for s in outputs.scores], ids, 3))
+    # Greedy decoding picks the most likely token at every step.
+    assert all(entry["chosen_token"] == entry["token"] for entry in trace)
+
+
+def test_build_traces_spans_several_blocks(backend):
+    generator = torch.Generator().manual_seed(0)
+    vocab_size = len(backend.tokenizer)
+    num_steps = _TRACE_BLOCK_STEPS + 44
+    scores = [torch.randn(2, vocab_size, generator=generator) * 3 for _ in range(num_steps)]
+    # Sampled ids, not always the top token; the second row finished earlier, inside the second block.
+    generated_ids = [torch.randint(vocab_size, (num_steps,), generator=generator).tolist(),
+                     torch.randint(vocab_size, (_TRACE_BLOCK_STEPS + 14,), generator=generator).tolist()]
+
+    traces = backend._build_traces(scores, generated_ids, top_k=4, detailed=True)
+
+    for row, ids in enumerate(generated_ids):
+        expected = _expected_trace(backend.tokenizer, [s[row] for s in scores[:len(ids)]], ids, 4)
+        _assert_trace_matches(traces[row], expected)
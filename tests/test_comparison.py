@@ -0,0 +1,26 @@
+from agenttrace.comparison import ComparisonEngine
+from agenttrace.response_cache import ResponseCache
+
+
+def echo_cells(model_name, tasks, max_length, generation_kwargs, dtype):
+    return [(index, {"text": f"{prompt} {seed}" if model_name != "c" else "other", "tokens": 2})
+            for index, prompt, seed in tasks]
+
+
+def test_adding_a_model_only_generates_its_column():
+    cache = ResponseCache()
+    prompts = ["alpha beta", "gamma delta", "epsilon"]
+    engine = ComparisonEngine(prompts, seeds=(0, 1), cache=cache, max_workers=2, chunk_size=4,
+                              cell_runner=echo_cells)
+    result = engine.run(["a", "b"])
+    assert result.similarity("a", "b") == 1.0
+    assert cache.stats()["entries"] == 12
+
+    fresh = ComparisonEngine(prompts, seeds=(0, 1), cache=cache, cell_runner=echo_cells)
+    seen = []
+    result = fresh.run(["a", "b", "c"], on_cell=lambda model, index, cell: seen.append(model))
+    assert cache.stats()["entries"] == 18
+    assert seen.count("c") == 6
+    assert result.similarity("a", "c") < 0.5
+    assert result.cell("b", 1, 1)["text"] == "gamma delta 1"
+    assert [row["tokens"] for row in result.model_stats()] == [2.0, 2.0, 2.0]
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from agenttrace.conversation import Conversation
+from agenttrace.exporter import JSONLSessionExporter
+from agenttrace.replay_backend import ReplayBackend
+
+
+def test_jsonl_export_appends_only_new_turns_and_resumes(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    records = [{"prompt": f"p{i}", "response": f"r{i}"} for i in range(4)]
+    conversation = Conversation("replay", backend=ReplayBackend(records, strict=True))
+    exporter = JSONLSessionExporter(path)
+    conversation.add_turn("p0")
+    assert exporter.export(conversation) == 1
+    conversation.add_turn("p1")
+    assert exporter.export(conversation) == 1
+    assert exporter.export(conversation) == 0
+
+    conversation.add_turn("p2")
+    conversation.add_turn("p3")
+    resumed = JSONLSessionExporter(path, resume=True)
+    assert resumed.exported_turns == 2
+    assert resumed.export(conversation) == 2
+
+    lines = [json.loads(line) for line in open(path, encoding="utf-8")]
+    assert [line["type"] for line in lines] == ["session"] + ["turn"] * 4
+    assert [line["index"] for line in lines[1:]] == [0, 1, 2, 3]
+    assert [line["prompt"] for line in lines[1:]] == ["p0", "p1", "p2", "p3"]
+
+
+def test_jsonl_resume_rejects_another_session(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    records = [{"prompt": "p", "response": "r"}]
+    first = Conversation("replay", backend=ReplayBackend(records))
+    first.add_turn("p")
+    JSONLSessionExporter(path).export(first)
+
+    other = Conversation("replay", backend=ReplayBackend(records))
+    other.add_turn("p")
+    with pytest.raises(ValueError):
+        JSONLSessionExporter(path, resume=True).export(other)
+    continued = Conversation("replay", backend=ReplayBackend(records * 2), session_id=first.session_id)
+    continued.add_turn("p")
+    continued.add_turn("p")
+    assert JSONLSessionExporter(path, resume=True).export(continued) == 1
+
+    # Without resume the file is started over for the new session.
+    assert JSONLSessionExporter(path).export(other) == 1
+    lines = [json.loads(line) for line in open(path, encoding="utf-8")]
+    assert lines[0]["session_id"] == other.session_id and len(lines) == 2
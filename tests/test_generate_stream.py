@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+
+PROMPT = "AgentTrace records every turn"
+
+
+@pytest.fixture
+def backend(tiny_model):
+    return HuggingFaceBackend(tiny_model, registry=ModelRegistry(snapshot_dir=""),
+                              generation_kwargs={"do_sample": False})
+
+
+def test_stream_matches_generate_with_trace(backend):
+    chunks, entries = zip(*backend.generate_stream(PROMPT, 60, top_k=2, detailed=True))
+    stream_metrics = backend.last_metrics
+    text, trace = backend.generate_with_trace(PROMPT, 60, top_k=2, detailed=True)
+
+    assert "".join(chunks) == text
+    streamed = [entry for entry in entries if entry is not None]
+    assert [entry["token"] for entry in streamed] == [entry["token"] for entry in trace]
+    assert [entry["confidence"] for entry in streamed] == pytest.approx(
+        [entry["confidence"] for entry in trace], abs=1e-5)
+    assert stream_metrics["generated_tokens"] == len(trace)
+    assert stream_metrics["stop_reason"] in ("eos", "max_length")
+    assert "partial" not in stream_metrics
+
+
+def test_closing_stream_stops_generation(backend, monkeypatch):
+    forward = backend.model.forward
+    calls = []
+
+    def slow_forward(*args, **kwargs):
+        calls.append(1)
+        time.sleep(0.02)
+        return forward(*args, **kwargs)
+
+    monkeypatch.setattr(backend.model, "forward", slow_forward)
+    # Without the stop event this would take ~100 slowed steps.
+    monkeypatch.setitem(backend.generation_kwargs, "min_new_tokens", 100)
+    stream = backend.generate_stream(PROMPT, 120)
+    next(stream)
+    stream.close()
+
+    assert len(calls) < 10
+    metrics = backend.last_metrics
+    assert metrics["partial"] is True
+    assert metrics["stop_reason"] == "cancelled"
+    assert 1 <= metrics["generated_tokens"] < 10
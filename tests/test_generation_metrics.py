@@ -0,0 +1,50 @@
+import itertools
+
+import pytest
+
+import agenttrace.llm_backend as llm_backend
+from agenttrace.conversation import Conversation
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry, rss_mb
+
+TIMING_FIELDS = ("tokenize_time", "prefill_time", "decode_time", "detokenize_time", "trace_time", "total_time")
+
+
+def _backend(path):
+    return HuggingFaceBackend(path, registry=ModelRegistry(snapshot_dir=""),
+                              generation_kwargs={"do_sample": False})
+
+
+def test_turn_metrics_reach_history_and_hook(tiny_model):
+    reported = []
+    conversation = Conversation(tiny_model, max_length=30, backend=_backend(tiny_model),
+                                on_turn_metrics=lambda index, metrics: reported.append((index, metrics)))
+    conversation.add_turn("AgentTrace records every turn")
+    conversation.add_turn("and replays it")
+
+    assert [index for index, _ in reported] == [0, 1]
+    for turn, (_, metrics) in zip(conversation.get_history(), reported):
+        assert turn["metrics"] == metrics
+        assert all(metrics[field] >= 0 for field in TIMING_FIELDS)
+        parts = sum(metrics[field] for field in TIMING_FIELDS if field != "total_time")
+        assert parts <= metrics["total_time"] + 1e-6
+        assert metrics["generated_tokens"] > 0
+        assert metrics["tokens_per_sec"] > 0
+        if rss_mb() is not None:
+            assert isinstance(metrics["peak_memory_delta_mb"], float)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_peak_memory_delta_is_peak_rss_during_generation(tiny_model, monkeypatch, stream):
+    backend = _backend(tiny_model)
+    if backend.model.device.type == "cuda":
+        pytest.skip("CPU memory sampling only")
+    # RSS before the generation, a spike during a step, then back down.
+    samples = itertools.chain([100.0, 160.0], itertools.repeat(120.0))
+    monkeypatch.setattr(llm_backend, "rss_mb", lambda: next(samples))
+
+    if stream:
+        "".join(chunk for chunk, _ in backend.generate_stream("AgentTrace records", 20))
+    else:
+        backend.generate_with_trace("AgentTrace records", 20)
+    assert backend.last_metrics["peak_memory_delta_mb"] == pytest.approx(60.0)
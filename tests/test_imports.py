@@ -0,0 +1,17 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ("torch", "transformers", "langchain", "langchain_core", "langchain_huggingface")
+
+
+def test_light_modules_do_not_import_model_stack():
+    # A fresh interpreter, so modules imported by other tests don't leak in.
+    code = (
+        "import sys\n"
+        "import agenttrace.analyzer, agenttrace.exporter, agenttrace.prompt_optimizer, agenttrace.logger\n"
+        "import agenttrace.conversation, agenttrace.orchestrator, agenttrace.workflow\n"
+        "import agenttrace.replay_backend, agenttrace.response_cache, agenttrace.trace_store\n"
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
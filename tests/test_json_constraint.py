@@ -0,0 +1,44 @@
+import torch
+
+from agenttrace.json_constraint import PLAN_SCHEMA, JSONConstraint, advance, initial_state, is_complete
+
+
+def accepts(text, schema=PLAN_SCHEMA):
+    state = advance(initial_state(schema), text)
+    return state is not None and is_complete(state)
+
+
+def test_plan_schema_accepts_only_valid_plans():
+    assert accepts('{"plan": [{"notes": "", "step_number": 2, "description": "Ship \\"it\\""}]}')
+    assert not accepts('{"plan": [{"step_number": 1.5, "description": "", "notes": ""}]}')
+    assert not accepts('{"plan": [{"step_number": 1}]}')
+    assert not accepts('{"plan": [], "extra": 1}')
+    assert advance(initial_state(PLAN_SCHEMA), '{"plan": []') is None
+    assert accepts('{"a": [1, -2.5e3, true, null, {"b": "c"}]}', schema=None)
+    assert advance(initial_state(None), '{"a": 01') is None
+
+
+class _Tokenizer:
+    name_or_path = "test-json-vocab"
+    vocab = ["<eos>", "{", "}", '"plan"', ":", "[", "]", "hello",
+             ' {"plan": [{"step_number": 1, "description": "Go", "notes": ""}]}']
+    all_special_ids = [0]
+    eos_token_id = 0
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def batch_decode(self, ids, **kwargs):
+        return [self.vocab[i[0]] for i in ids]
+
+
+def test_processor_masks_invalid_tokens_and_stops_when_closed():
+    constraint = JSONConstraint(_Tokenizer(), PLAN_SCHEMA, max_new_tokens=10)
+    processor, stopping = constraint.logits_processor(), constraint.stopping_criteria()
+    input_ids = torch.tensor([[7, 7]])
+    scores = processor(input_ids, torch.zeros(1, 9))
+    assert torch.isfinite(scores[0]).nonzero().flatten().tolist() == [1, 8]
+
+    input_ids = torch.tensor([[7, 7, 8]])
+    assert stopping(input_ids, None).tolist() == [True]
+    assert constraint.stats() == {"generated_tokens": 1, "max_new_tokens": 10, "tokens_saved": 9, "completed": True}
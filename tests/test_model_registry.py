@@ -0,0 +1,58 @@
+import gc
+import weakref
+
+import pytest
+import torch
+
+from agenttrace.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def tiny_models(tiny_model_factory):
+    return [tiny_model_factory(), tiny_model_factory("tiny-gpt2-other", seed=1)]
+
+
+def test_hits_misses_and_evictions_are_counted(tiny_models):
+    first, second = tiny_models
+    registry = ModelRegistry(snapshot_dir="")
+    model, _ = registry.get(first)
+    assert registry.get(first)[0] is model
+    assert (registry.hits, registry.misses, registry.evictions) == (1, 1, 0)
+
+    registry.set_max_memory_mb(registry.memory_bytes() / 2**20 * 1.5)
+    registry.get(second)
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 2, 1)
+    assert stats["resident_models"] == [f"{second}/default/cpu"]
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+    # The evicted model is reloaded on its next use, and the caller's copy is not freed.
+    assert registry.get(first)[0] is not model
+    assert registry.misses == 3 and registry.evictions == 2
+
+
+def test_eviction_frees_unreferenced_models(tiny_models):
+    first, second = tiny_models
+    registry = ModelRegistry(max_memory_mb=0, snapshot_dir="")
+    model_ref = weakref.ref(registry.get(first)[0])
+    registry.get(second)
+    gc.collect()
+    assert model_ref() is None
+
+
+def test_snapshot_is_written_once_and_reused(tiny_models, tmp_path):
+    first, _ = tiny_models
+    registry = ModelRegistry(snapshot_dir=str(tmp_path))
+    model, _ = registry.get(first, dtype="float32")
+    stats = registry.stats()["load_stats"][f"{first}/float32/cpu"]
+    assert stats["snapshot"] is None
+    snapshots = [path for path in tmp_path.iterdir() if (path / "config.json").is_file()]
+    assert len(snapshots) == 1
+
+    # A fresh registry, e.g. after a restart, reads the snapshot instead of the checkpoint.
+    restarted = ModelRegistry(snapshot_dir=str(tmp_path))
+    reloaded, tokenizer = restarted.get(first, dtype="float32")
+    assert restarted.stats()["load_stats"][f"{first}/float32/cpu"]["snapshot"] == str(snapshots[0])
+    assert tokenizer("AgentTrace")["input_ids"]
+    for (name, weight), (_, reloaded_weight) in zip(model.state_dict().items(), reloaded.state_dict().items()):
+        assert torch.equal(weight, reloaded_weight), name
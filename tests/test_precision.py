@@ -0,0 +1,41 @@
+import pytest
+import torch
+
+from agenttrace.llm_backend import HuggingFaceBackend, configure_threads
+from agenttrace.model_registry import ModelRegistry
+
+
+def _backend(path, dtype):
+    return HuggingFaceBackend(path, dtype=dtype, registry=ModelRegistry(snapshot_dir=""),
+                              generation_kwargs={"do_sample": False})
+
+
+@pytest.mark.parametrize("dtype", ["int8", "bfloat16", "auto"])
+def test_reduced_precision_models_generate(tiny_model, dtype):
+    backend = _backend(tiny_model, dtype)
+    if dtype == "int8":
+        quantized = torch.ao.nn.quantized.dynamic.Linear
+        assert any(isinstance(module, quantized) for module in backend.model.modules())
+    elif dtype == "bfloat16":
+        assert backend.model.get_input_embeddings().weight.dtype == torch.bfloat16
+    _, trace = backend.generate_with_trace("AgentTrace records every turn", 30)
+    assert trace
+    assert all(0 <= entry["confidence"] <= 1 for entry in trace)
+
+
+@pytest.mark.parametrize("dtype", ["int4", "float8", "torch.float64"])
+def test_unsupported_dtype_is_rejected(tiny_model, dtype):
+    registry = ModelRegistry(snapshot_dir="")
+    with pytest.raises(ValueError, match="Unsupported dtype"):
+        registry.get(tiny_model, dtype=dtype)
+    assert registry.misses == 0
+
+
+def test_configure_threads_sets_torch_thread_count():
+    previous = torch.get_num_threads()
+    target = 2 if previous != 2 else 1
+    try:
+        configure_threads(num_threads=target)
+        assert torch.get_num_threads() == target
+    finally:
+        torch.set_num_threads(previous)
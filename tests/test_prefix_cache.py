@@ -0,0 +1,24 @@
+import pytest
+
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+
+
+def test_prefix_cache_reuses_prompt_and_keeps_output(tiny_model):
+    registry = ModelRegistry(snapshot_dir="")
+    cached = HuggingFaceBackend(tiny_model, registry=registry, generation_kwargs={"do_sample": False})
+    uncached = HuggingFaceBackend(tiny_model, registry=registry, prefix_cache_size=0,
+                                  generation_kwargs={"do_sample": False})
+    prompt = "AgentTrace records every turn of the conversation"
+    extended = prompt + " and replays it"
+
+    for text in (prompt, extended):
+        (cached_text, cached_trace), (text_off, trace_off) = (cached.generate_with_trace(text, 40),
+                                                              uncached.generate_with_trace(text, 40))
+        assert cached_text == text_off
+        assert [entry["token"] for entry in cached_trace] == [entry["token"] for entry in trace_off]
+        assert [entry["confidence"] for entry in cached_trace] == pytest.approx(
+            [entry["confidence"] for entry in trace_off], abs=1e-5)
+    assert cached.prefix_cache_stats["hits"] == 1
+    assert cached.prefix_cache_stats["reused_tokens"] > 0
+    assert uncached.prefix_cache_stats["hits"] == 0
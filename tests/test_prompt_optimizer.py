@@ -0,0 +1,26 @@
+from agenttrace.prompt_optimizer import build_prompt_variants, search_prompts
+from agenttrace.replay_backend import ReplayBackend
+
+
+def test_build_prompt_variants_starts_with_original():
+    variants = build_prompt_variants("Explain gravity.", templates=("{prompt}", "Q: {prompt}"),
+                                     suffixes=("", " Briefly."), constraints=("",))
+    assert variants == ["Explain gravity.", "Explain gravity. Briefly.", "Q: Explain gravity.", "Q: Explain gravity. Briefly."]
+
+
+def test_search_prompts_prunes_and_ranks_candidates():
+    records = [
+        {"prompt": "echo", "response": "echo"},
+        {"prompt": "loop", "response": "Same. Same. Same."},
+        {"prompt": "good", "response": "Gravity pulls masses together. It keeps planets in orbit."},
+        {"prompt": "okay", "response": "Things fall. Things fall. Apples drop."},
+    ]
+    result = search_prompts(ReplayBackend(records, strict=True), ["echo", "loop", "good", "okay"],
+                            max_length=50, seeds=(0, 1, 2, 3))
+    ranking = result["ranking"]
+    assert [entry["prompt"] for entry in ranking][:2] == ["good", "okay"]
+    assert ranking[0]["round"] is None and ranking[0]["evaluations"] == 2
+    assert ranking[-1]["evaluations"] == 1
+    # 4 candidates on seed 0, then the best 2 on seed 1.
+    assert result["cost"]["generations"] == 6
+    assert result["cost"]["exhaustive_generations"] == 16
@@ -0,0 +1,29 @@
+import torch
+
+from agenttrace.llm_backend import RepetitionDetector, _RepetitionStop
+
+
+def test_detector_triggers_on_loops_only():
+    varied = RepetitionDetector(ngram=3, window=32, threshold=0.5, min_ngrams=8)
+    assert not any(varied.push(token) for token in range(100))
+    assert varied.ratio == 0.0
+
+    looping = RepetitionDetector(ngram=3, window=32, threshold=0.5, min_ngrams=8)
+    pushes = [looping.push(token) for token in [5, 6, 7, 8] * 5]
+    assert pushes.index(True) == looping.triggered_at - 1 == 9
+    assert looping.state()["distinct_ngrams"] == 4
+
+
+def test_stopping_criterion_consumes_only_generated_tokens():
+    stop = _RepetitionStop(RepetitionDetector(ngram=2, window=8, threshold=0.5, min_ngrams=4), prompt_length=3)
+    assert stop(torch.tensor([[9, 9, 9, 1, 2]]), None).tolist() == [False]
+    assert stop(torch.tensor([[9, 9, 9, 1, 2, 1, 2, 1, 2]]), None).tolist() == [True]
+    assert stop.detector.triggered_at == stop.detector.tokens_seen == 5
+
+
+def test_stopping_criterion_stops_batch_rows_independently():
+    detectors = [RepetitionDetector(ngram=2, window=8, threshold=0.5, min_ngrams=4) for _ in range(2)]
+    stop = _RepetitionStop(detectors, prompt_length=1)
+    assert stop(torch.tensor([[0, 1, 2, 1, 2, 1, 2], [0, 1, 2, 3, 4, 5, 6]]), None).tolist() == [True, False]
+    assert stop(torch.tensor([[0, 1, 2, 1, 2, 1, 2, 0, 0], [0, 1, 2, 3, 4, 5, 6, 7, 8]]), None).tolist() == [True, False]
+    assert detectors[0].tokens_seen == detectors[0].triggered_at == 5
@@ -0,0 +1,69 @@
+import pytest
+
+from agenttrace.conversation import Conversation
+from agenttrace.exporter import export_session
+from agenttrace.replay_backend import ReplayBackend
+
+
+def test_replayed_session_round_trips_through_conversation():
+    records = [{"prompt": "Hi", "response": "Hello there."}, {"prompt": "Bye", "response": "Goodbye!"}]
+    conversation = Conversation("replay", backend=ReplayBackend(records, strict=True))
+    assert conversation.add_turn("Bye") == "Goodbye!"
+    assert "".join(conversation.add_turn_stream("Hi")) == "Hello there."
+
+    replayed = ReplayBackend.from_session(export_session(conversation))
+    assert replayed.generate_with_trace("Hi", 50) == ("Hello there.", [
+        {"token": "Hello", "confidence": 1.0}, {"token": "there.", "confidence": 1.0}
+    ])
+
+
+def test_replay_sweep_groups_identical_prompts():
+    records = [{"prompt": "Hi", "response": "Hello there."}, {"prompt": "Hi again", "response": "Hi again"}]
+    backend = ReplayBackend(records, strict=True)
+    conversation = Conversation("replay", backend=backend)
+    conversation.add_turn("Hi")
+    conversation.add_turn("Hi")
+
+    rows = conversation.replay_sweep(range(2), modifications=["", "again"])
+    assert [(row["turn"], row["prompt"], row["response"]) for row in rows] == [
+        (0, "Hi", "Hello there."), (0, "Hi again", "Hi again"),
+        (1, "Hi", "Hello there."), (1, "Hi again", "Hi again"),
+    ]
+    assert rows[1]["echo_flag"] == 1.0
+    with pytest.raises(ValueError):
+        conversation.replay_sweep(0, sampling=[{"temperature": 0.5}])
+
+
+def test_streamed_turn_keeps_backend_token_count_and_early_close_is_partial():
+    records = [{"prompt": "Hi", "response": "Hello there, friend."}] * 2
+    backend = ReplayBackend(records, strict=True)
+    conversation = Conversation("replay", backend=backend)
+    assert "".join(conversation.add_turn_stream("Hi")) == "Hello there, friend."
+    metrics = conversation.get_history()[0]["metrics"]
+    assert metrics["generated_tokens"] == 3
+    assert metrics["time_to_first_token"] is not None
+    assert "partial" not in metrics
+
+    stream = backend.generate_stream("Hi", 50)
+    next(stream)
+    stream.close()
+    assert backend.last_metrics["partial"] is True
+    assert backend.last_metrics["generated_tokens"] == 1
+
+
+def test_replay_sweep_defaults_to_the_backend_seed():
+    class SeededReplay(ReplayBackend):
+        seed = 5
+        seen = []
+
+        def generate_batch(self, prompts, max_length, batch_size=8):
+            self.seen.append(self.seed)
+            return super().generate_batch(prompts, max_length, batch_size)
+
+    backend = SeededReplay([{"prompt": "Hi", "response": "Hello"}])
+    conversation = Conversation("replay", backend=backend)
+    conversation.add_turn("Hi")
+    conversation.replay_sweep(0)
+    conversation.replay_sweep(0, seeds=[None])
+    assert backend.seen == [5, None]
+    assert backend.seed == 5
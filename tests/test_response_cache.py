@@ -0,0 +1,69 @@
+import itertools
+import threading
+
+import pytest
+
+from agenttrace import response_cache
+from agenttrace.llm_backend import HuggingFaceBackend
+from agenttrace.model_registry import ModelRegistry
+from agenttrace.response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct, increasing access times so LRU order never depends on timer resolution.
+    ticks = itertools.count()
+    monkeypatch.setattr(response_cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_key_is_stable_across_parameter_order():
+    key = ResponseCache.make_key("m", "p", 50, {"do_sample": True, "temperature": 0.7}, 1)
+    assert key == ResponseCache.make_key("m", "p", 50, {"temperature": 0.7, "do_sample": True}, 1)
+    assert key != ResponseCache.make_key("m", "p", 50, {"do_sample": True, "temperature": 0.7}, 2)
+    assert key != ResponseCache.make_key("m", "p ", 50, {"do_sample": True, "temperature": 0.7}, 1)
+
+
+def test_evicts_least_recently_used_by_entries(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_evicts_least_recently_used_by_bytes(clock):
+    cache = ResponseCache(max_bytes=12)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.get("a")
+    cache.put("c", "zzzz")
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2 and cache.stats()["size_bytes"] == 12
+
+
+def test_stats_report_hit_rate():
+    cache = ResponseCache()
+    cache.put("a", {"text": "x"})
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+
+def test_generations_cut_short_are_not_cached(tiny_model):
+    cache = ResponseCache()
+    backend = HuggingFaceBackend(tiny_model, registry=ModelRegistry(snapshot_dir=""), response_cache=cache,
+                                 generation_kwargs={"do_sample": False})
+    stop_event = threading.Event()
+    stop_event.set()
+    backend.generate_with_trace("AgentTrace records", 40, stop_event=stop_event)
+    assert cache.stats()["entries"] == 0
+
+    backend.generate_with_trace("AgentTrace records", 40)
+    assert cache.stats()["entries"] == 1
+    backend.generate_with_trace("AgentTrace records", 40)
+    assert backend.last_metrics["cached"] is True
@@ -0,0 +1,21 @@
+from agenttrace.analyzer import analyze_response
+from agenttrace.similarity import ngram_similarity, sequence_ratio, similarity
+
+
+def test_ngram_similarity_bounds():
+    assert ngram_similarity("", "") == 1.0
+    assert ngram_similarity("abc", "") == 0.0
+    assert ngram_similarity("the same text", "the same text") == 1.0
+    assert ngram_similarity("abcdef", "uvwxyz") == 0.0
+
+
+def test_auto_uses_exact_ratio_for_short_inputs():
+    a, b = "Tell me a story.", "Tell me a story about dragons."
+    assert similarity(a, b) == sequence_ratio(a, b)
+    assert similarity(a, b, method="ratio") == sequence_ratio(a, b)
+
+
+def test_long_echo_is_flagged():
+    prompt = "Describe the water cycle in detail, including evaporation and rain. " * 40
+    metrics = analyze_response(prompt, prompt + " It starts with the sun.")
+    assert metrics["echo_flag"] == 1.0
@@ -0,0 +1,22 @@
+from agenttrace.trace_store import TraceStore
+
+
+def test_query_turns_by_model_and_echo_flag():
+    store = TraceStore()
+    session_data = {
+        "exported_at": "2025-01-01 12:00:00",
+        "model_name": "distilgpt2",
+        "max_length": 50,
+        "turns": [
+            {"prompt": "a", "response": "a", "analysis": {"prompt_similarity": 1.0, "echo_flag": 1.0, "repetition_score": 1.0}},
+            {"prompt": "b", "response": "c", "analysis": {"prompt_similarity": 0.0, "echo_flag": 0.0, "repetition_score": 1.0}},
+        ],
+    }
+    session_id = store.import_session(session_data)
+    store.add_turn(store.start_session("gpt2"), "gpt2", 0, "a", "a",
+                   {"prompt_similarity": 1.0, "echo_flag": 1.0, "repetition_score": 1.0})
+
+    echoed = store.query_turns(model_name="distilgpt2", echo_flag=True)
+    assert [(turn["session_id"], turn["prompt"]) for turn in echoed] == [(session_id, "a")]
+    assert len(store.query_turns(echo_flag=True)) == 2
+    assert [turn["turn_index"] for turn in store.query_turns(session_id=session_id)] == [0, 1]
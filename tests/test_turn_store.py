@@ -0,0 +1,35 @@
+from agenttrace.turn_store import TurnStore
+
+
+def test_spilled_turns_stay_readable():
+    store = TurnStore(window=2)
+    for i in range(5):
+        store.append({"prompt": f"p{i}", "response": f"r{i}"})
+    assert len(store) == 5 and store.spilled == 3
+    assert [turn["prompt"] for turn in store] == ["p0", "p1", "p2", "p3", "p4"]
+    assert dict(store[-1]) == {"prompt": "p4", "response": "r4"}
+
+    turn = store[1]
+    turn["response"] = "edited"
+    store[1] = turn
+    assert store[1]["response"] == "edited"
+
+
+def test_rewritten_spilled_turns_reuse_or_reclaim_space():
+    store = TurnStore(window=1)
+    for i in range(3):
+        store.append({"prompt": f"p{i}", "response": f"r{i}"})
+    size = store._segment.seek(0, 2)
+
+    turn = store[0]
+    turn["response"] = "r"
+    store[0] = turn
+    assert store._segment.seek(0, 2) == size
+    for i in range(10):
+        turn["response"] = "longer" * (i + 1)
+        store[0] = turn
+        assert store._dead_bytes <= store._live_bytes == sum(store._sizes)
+    assert [t["response"] for t in store] == ["longer" * 10, "r1", "r2"]
+
+    store.close()
+    assert len(store) == 0 and list(store) == []
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from agenttrace.workflow import run_workflow, topological_sort
+
+
+def make_agent(aid, model=None, memory_mb=0):
+    return {"id": aid, "name": aid, "model_name": model or f"model-{aid}", "prompt_template": "",
+            "max_length": 10, "memory_mb": memory_mb}
+
+
+class Recorder:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self, agent, input_text, global_task):
+        with self.lock:
+            self.events.append(("start", agent["id"]))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+            self.events.append(("end", agent["id"]))
+        return f"{agent['id']}({input_text})"
+
+
+def test_topological_order_and_cycle_detection():
+    agents = [make_agent(aid) for aid in "abc"]
+    order, _ = topological_sort(agents, [("b", "a"), ("c", "b")])
+    assert order == ["c", "b", "a"]
+    with pytest.raises(ValueError):
+        topological_sort(agents, [("a", "b"), ("b", "a")])
+    with pytest.raises(ValueError):
+        run_workflow(agents, [("a", "b"), ("b", "c"), ("c", "a")], "task", agent_runner=Recorder())
+
+
+def test_successor_waits_for_all_predecessors():
+    runner = Recorder()
+    agents = [make_agent(aid) for aid in "abcd"]
+    outputs = run_workflow(agents, [("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")], "task",
+                           max_concurrency=4, agent_runner=runner)
+    events = runner.events
+    start_d = events.index(("start", "d"))
+    assert events.index(("end", "b")) < start_d and events.index(("end", "c")) < start_d
+    assert outputs["d"] == "d(b(a(task))\nc(a(task)))"
+
+
+def test_max_concurrency_is_respected():
+    runner = Recorder()
+    run_workflow([make_agent(str(i)) for i in range(6)], [], "task", max_concurrency=2, agent_runner=runner)
+    assert runner.peak == 2
+
+
+def test_memory_limit_admission():
+    runner = Recorder()
+    agents = [make_agent(str(i), memory_mb=60) for i in range(3)]
+    run_workflow(agents, [], "task", max_concurrency=3, memory_limit_mb=100, agent_runner=runner)
+    assert runner.peak == 1
+
+    # Agents sharing a model are charged once with thread workers.
+    runner = Recorder()
+    agents = [make_agent(str(i), model="shared", memory_mb=60) for i in range(3)]
+    run_workflow(agents, [], "task", max_concurrency=3, memory_limit_mb=100, agent_runner=runner)
+    assert runner.peak == 3
+
+
+def test_agent_larger_than_memory_limit_still_runs():
+    outputs = run_workflow([make_agent("big", memory_mb=500), make_agent("small", memory_mb=10)], [], "task",
+                           max_concurrency=2, memory_limit_mb=100, agent_runner=Recorder())
+    assert set(outputs) == {"big", "small"}